@@ -5,8 +5,6 @@ Incluye regresión temporal simple y análisis avanzado.
 
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
 from typing import Tuple, Optional
 from utils import log_time, logger
 from exceptions import ProcessingError
@@ -40,7 +38,8 @@ def predict_monthly_trend(df: pd.DataFrame, months_ahead: int = 3) -> Optional[p
         X = monthly["MES"].values.reshape(-1, 1)
         y = monthly["cantidad"].values
         
-        # Entrenar modelo lineal simple
+        # Entrenar modelo lineal simple (sklearn se importa sólo cuando se predice)
+        from sklearn.linear_model import LinearRegression
         model = LinearRegression()
         model.fit(X, y)
         
@@ -56,11 +55,11 @@ def predict_monthly_trend(df: pd.DataFrame, months_ahead: int = 3) -> Optional[p
             "es_prediccion": True
         })
         
-        logger.info(f"Predicción generada para {months_ahead} meses")
+        logger.info("Predicción generada para %s meses", months_ahead)
         return result
     
     except Exception as e:
-        logger.exception(f"Error en predicción de tendencia: {e}")
+        logger.exception("Error en predicción de tendencia: %s", e)
         raise ProcessingError(f"No se pudo predecir tendencia: {e}")
 
 
@@ -94,7 +93,7 @@ def calculate_growth_rate(df: pd.DataFrame, period: str = "anio") -> Optional[pd
             return by_mod
     
     except Exception as e:
-        logger.exception(f"Error calculando growth rate: {e}")
+        logger.exception("Error calculando growth rate: %s", e)
         return None
 
 
@@ -120,11 +119,11 @@ def top_modalidad_by_departamento(df: pd.DataFrame, n: int = 5) -> Optional[pd.D
             .groupby("DEPARTAMENTO")
             .head(n)
         )
-        logger.info(f"Calculado top {n} modalidades por departamento")
+        logger.info("Calculado top %s modalidades por departamento", n)
         return result
     
     except Exception as e:
-        logger.exception(f"Error en top modalidad por departamento: {e}")
+        logger.exception("Error en top modalidad por departamento: %s", e)
         return None
 
 
@@ -153,5 +152,108 @@ def calculate_correlation_matrix(df: pd.DataFrame) -> Optional[pd.DataFrame]:
         return corr_matrix
     
     except Exception as e:
-        logger.exception(f"Error calculando correlación: {e}")
+        logger.exception("Error calculando correlación: %s", e)
         return None
+
+
+# Columnas que identifican una serie mensual (el nombre de distrito no es único entre departamentos)
+CLAVES_SERIE = ("DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES")
+
+COLUMNAS_ANOMALIAS = list(CLAVES_SERIE) + ["AÑO", "MES", "cantidad", "mediana", "mad", "z", "exceso"]
+
+
+@log_time
+def detectar_anomalias(
+    df: pd.DataFrame,
+    ventana: int = 12,
+    ultimos_meses: Optional[int] = 3,
+    top: int = 50,
+    z_min: float = 3.5,
+    min_cantidad: int = 5,
+    bloque: int = 4096,
+) -> pd.DataFrame:
+    """
+    Detecta picos inusuales en todas las series distrito × modalidad a la vez.
+
+    Arma una matriz densa (series × meses consecutivos, 0 donde no hay filas) y,
+    para cada mes evaluado, compara el valor con la mediana y la MAD de los
+    `ventana` meses anteriores: z = (x - mediana) / max(1.4826·MAD, 1). Todo se
+    calcula con operaciones vectorizadas por bloques de `bloque` series.
+
+    Args:
+        df: DataFrame limpio (AÑO, MES, DEPARTAMENTO, PROVINCIA, DISTRITO, MODALIDADES, cantidad).
+        ventana: meses de historia para la línea base.
+        ultimos_meses: sólo se evalúan los últimos N meses (None = todos los que tienen historia completa).
+        top: número máximo de anomalías devueltas.
+        z_min: puntaje robusto mínimo para considerar un pico.
+        min_cantidad: denuncias mínimas en el mes para reportarlo.
+        bloque: series procesadas por bloque (acota la memoria).
+
+    Returns:
+        DataFrame con las anomalías ordenadas por severidad (z descendente).
+    """
+    try:
+        datos = df.dropna(subset=list(CLAVES_SERIE) + ["AÑO", "MES"])
+        if datos.empty:
+            return pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+
+        # Id de serie: códigos por columna combinados (más rápido que factorizar un MultiIndex)
+        codigos, valores_clave = zip(*(pd.factorize(datos[c]) for c in CLAVES_SERIE))
+        combinado = np.ravel_multi_index(codigos, tuple(len(v) for v in valores_clave))
+        unicos, serie = np.unique(combinado, return_inverse=True)
+        claves = np.unravel_index(unicos, tuple(len(v) for v in valores_clave))
+        periodo = datos["AÑO"].to_numpy(dtype=np.int64) * 12 + datos["MES"].to_numpy(dtype=np.int64) - 1
+        p0 = int(periodo.min())
+        n_meses = int(periodo.max()) - p0 + 1
+        n_series = len(unicos)
+        if n_meses <= ventana:
+            logger.warning("Historia insuficiente para anomalías (%s meses, ventana %s)", n_meses, ventana)
+            return pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+
+        # Matriz densa series × meses
+        matriz = np.bincount(
+            serie * n_meses + (periodo - p0),
+            weights=datos["cantidad"].to_numpy(dtype=np.float64),
+            minlength=n_series * n_meses,
+        ).reshape(n_series, n_meses)
+
+        inicio = ventana if not ultimos_meses else max(ventana, n_meses - ultimos_meses)
+        z = np.empty((n_series, n_meses - inicio))
+        mediana = np.empty_like(z)
+        mad = np.empty_like(z)
+        for a in range(0, n_series, bloque):
+            m = matriz[a:a + bloque]
+            # historia[:, j] = meses inicio+j-ventana … inicio+j-1
+            historia = np.lib.stride_tricks.sliding_window_view(m, ventana, axis=1)[:, inicio - ventana:n_meses - ventana]
+            med = np.median(historia, axis=-1)
+            desv = np.median(np.abs(historia - med[..., None]), axis=-1)
+            z[a:a + bloque] = (m[:, inicio:] - med) / np.maximum(1.4826 * desv, 1.0)
+            mediana[a:a + bloque] = med
+            mad[a:a + bloque] = desv
+
+        valores = matriz[:, inicio:]
+        candidatos = np.flatnonzero((z >= z_min) & (valores >= min_cantidad))
+        if len(candidatos) > top:
+            candidatos = candidatos[np.argpartition(-z.ravel()[candidatos], top - 1)[:top]]
+        filas, cols = np.unravel_index(candidatos, z.shape)
+
+        resultado = pd.DataFrame({
+            c: np.asarray(valores_clave[i], dtype=object)[claves[i][filas]] for i, c in enumerate(CLAVES_SERIE)
+        })
+        periodos = p0 + inicio + cols
+        resultado["AÑO"] = periodos // 12
+        resultado["MES"] = periodos % 12 + 1
+        resultado["cantidad"] = valores[filas, cols].astype(np.int64)
+        resultado["mediana"] = mediana[filas, cols]
+        resultado["mad"] = mad[filas, cols]
+        resultado["z"] = z[filas, cols].round(2)
+        resultado["exceso"] = resultado["cantidad"] - resultado["mediana"]
+        resultado = resultado.sort_values(["z", "exceso"], ascending=False).reset_index(drop=True)
+
+        logger.info("Anomalías: %s series × %s meses evaluados → %s picos (z ≥ %s)",
+                    n_series, n_meses - inicio, len(resultado), z_min)
+        return resultado
+
+    except Exception as e:
+        logger.exception("Error detectando anomalías: %s", e)
+        raise ProcessingError(f"No se pudo detectar anomalías: {e}")
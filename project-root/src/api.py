@@ -0,0 +1,342 @@
+"""
+API HTTP local de sólo lectura (JSON) con los agregados del dashboard SIDPOL.
+
+Sirve los mismos datos que la app (dataset compartido, cubo OLAP, análisis y
+consultas a la BD) sin pasar por Streamlit. Cada respuesta lleva un ETag
+derivado de la versión de los datos y de la consulta: un cliente que envía
+If-None-Match recibe 304 sin que se recalcule nada. Las respuestas se
+comprimen con gzip si el cliente lo acepta, y las ya calculadas se guardan
+en una caché LRU por ETag. Un hilo por conexión (ThreadingHTTPServer, HTTP/1.1
+con keep-alive).
+
+Uso:
+    python src/api.py [--host 127.0.0.1] [--puerto 8600]
+
+Parámetros de filtro (todos opcionales, en la query string):
+    anio=2024  mes=3-5  desde=2023-06&hasta=2025-03  modalidades=Robo,Hurto
+    dpto=LIMA  prov=LIMA  dist=MIRAFLORES
+
+Búsqueda de nombres: /api/buscar?q=san juan&limite=10
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import analysis
+import busqueda
+import cube
+import database
+import dataset
+import processing
+from metrics import registry
+from utils import logger, FRECUENTE
+from exceptions import ValidationError
+
+HOST_DEFECTO = "127.0.0.1"
+PUERTO_DEFECTO = 8600
+
+# Respuestas menores que esto no se comprimen
+MIN_GZIP_BYTES = 1024
+
+# Respuestas (ya serializadas y comprimidas) guardadas por ETag
+MAX_RESPUESTAS = 512
+
+# Valores de `periodo` que acepta analysis.calculate_growth_rate
+PERIODOS_CRECIMIENTO = ("anio", "mes", "modalidad")
+
+
+# --- Parámetros ---
+
+def _periodo_param(valor: str):
+    try:
+        anio, mes = valor.split("-")
+        return int(anio), int(mes)
+    except ValueError:
+        raise ValidationError(f"Periodo inválido (se espera AAAA-MM): {valor}")
+
+
+def filtro_desde_query(query: dict) -> dict:
+    """Convierte la query string en los argumentos de `DatasetCompartido.filtrar` (+ distrito)."""
+    def uno(nombre):
+        valores = query.get(nombre)
+        return valores[-1] if valores else None
+
+    try:
+        anio = int(uno("anio")) if uno("anio") else None
+        mes_range = None
+        if uno("mes"):
+            lo, _, hi = uno("mes").partition("-")
+            mes_range = (int(lo), int(hi or lo))
+    except ValueError as e:
+        raise ValidationError(f"Parámetro numérico inválido: {e}")
+
+    periodo = None
+    if uno("desde") or uno("hasta"):
+        if not (uno("desde") and uno("hasta")):
+            raise ValidationError("El rango de fechas requiere 'desde' y 'hasta'")
+        periodo = (_periodo_param(uno("desde")), _periodo_param(uno("hasta")))
+
+    modalidades = [m for valor in query.get("modalidades", []) for m in valor.split(",") if m] or None
+    return {
+        "anio": anio,
+        "modalidades": modalidades,
+        "dpto": uno("dpto") or "Todos",
+        "prov": uno("prov"),
+        "mes_range": mes_range,
+        "periodo": periodo,
+        "dist": uno("dist"),
+    }
+
+
+# --- Cálculo ---
+
+def _registros(df) -> list:
+    """DataFrame → lista de dicts JSON (NaN/NA → null, tipos NumPy → Python)."""
+    if df is None:
+        return []
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+class Contexto:
+    """Datos de una petición: dataset vigente, filtro y agregados del cubo (si el filtro lo permite)."""
+
+    def __init__(self, ds, filtro: dict):
+        self.ds = ds
+        self.filtro = filtro
+        self._filas = None
+        self._agregados = None
+        if not filtro["dist"] and (not filtro["prov"] or filtro["prov"] == "Todas"):
+            try:
+                self._agregados = cube.obtener_cubo(ds).agregados(
+                    filtro["anio"], filtro["modalidades"], filtro["dpto"], filtro["mes_range"], filtro["periodo"])
+            except Exception as e:
+                logger.warning("API: cubo no disponible, se agrega sobre filas: %s", e)
+
+    def filas(self) -> pd.DataFrame:
+        if self._filas is None:
+            f = self.filtro
+            df = self.ds.filtrar(f["anio"], f["modalidades"], f["dpto"], f["prov"], f["mes_range"], f["periodo"])
+            if f["dist"]:
+                df = df[df["DISTRITO"] == f["dist"]]
+            self._filas = df
+        return self._filas
+
+    def agregado(self, nombre: str) -> pd.DataFrame:
+        if self._agregados is not None:
+            if self._agregados.vacio:
+                return pd.DataFrame()
+            return getattr(self._agregados, nombre)()
+        filas = self.filas()
+        return pd.DataFrame() if filas.empty else getattr(processing, nombre)(filas)
+
+    def total(self) -> int:
+        if self._agregados is not None:
+            return self._agregados.total()
+        return int(self.filas()["cantidad"].sum())
+
+
+def _entero(query: dict, nombre: str, defecto: int, minimo: int, maximo: int) -> int:
+    try:
+        valor = int(query.get(nombre, [defecto])[-1])
+    except ValueError:
+        raise ValidationError(f"'{nombre}' debe ser entero")
+    if not minimo <= valor <= maximo:
+        raise ValidationError(f"'{nombre}' debe estar entre {minimo} y {maximo}")
+    return valor
+
+
+def _opcion(query: dict, nombre: str, defecto: str, opciones: tuple) -> str:
+    valor = query.get(nombre, [defecto])[-1]
+    if valor not in opciones:
+        raise ValidationError(f"'{nombre}' debe ser uno de: {', '.join(opciones)}")
+    return valor
+
+
+def _bd(nombre: str, *args):
+    resultado, exito = getattr(database, nombre)(*args)
+    if not exito:
+        raise RuntimeError(f"Consulta a BD fallida: {nombre}")
+    return _registros(resultado)
+
+
+# ruta → (usa la BD, función(contexto, query) → objeto JSON)
+RUTAS = {
+    "/api/version": (False, lambda c, q: {"version": c.ds.version, "filas": len(c.ds)}),
+    "/api/opciones": (False, lambda c, q: c.ds.opciones),
+    "/api/total": (False, lambda c, q: {"total": c.total()}),
+    "/api/modalidades": (False, lambda c, q: _registros(c.agregado("by_modalidad"))),
+    "/api/mensual": (False, lambda c, q: _registros(c.agregado("monthly_trend"))),
+    "/api/departamentos": (False, lambda c, q: _registros(c.agregado("top_departamentos"))),
+    "/api/heatmap": (False, lambda c, q: _registros(c.agregado("heatmap_modalidad_mes"))),
+    "/api/prediccion": (False, lambda c, q: _registros(
+        analysis.predict_monthly_trend(c.filas(), months_ahead=_entero(q, "meses", 3, 1, 24)))),
+    "/api/crecimiento": (False, lambda c, q: _registros(
+        analysis.calculate_growth_rate(c.filas(), period=_opcion(q, "periodo", "anio", PERIODOS_CRECIMIENTO)))),
+    "/api/buscar": (False, lambda c, q: [r.a_dict() for r in busqueda.obtener_indice(c.ds).buscar(
+        q.get("q", [""])[-1], limite=_entero(q, "limite", busqueda.LIMITE_DEFECTO, 1, 100))]),
+    "/api/bd/buscar": (True, lambda c, q: _bd(
+        "buscar_nombres", q.get("q", [""])[-1], _entero(q, "limite", busqueda.LIMITE_DEFECTO, 1, 100))),
+    "/api/bd/estadisticas": (True, lambda c, q: _bd("obtener_estadisticas_generales")),
+    "/api/bd/modalidades": (True, lambda c, q: _bd("obtener_denuncias_por_modalidad")),
+    "/api/bd/departamentos": (True, lambda c, q: _bd("obtener_denuncias_por_departamento")),
+}
+
+
+# --- Caché de respuestas por ETag ---
+
+_respuestas: "OrderedDict[str, tuple]" = OrderedDict()
+_lock_respuestas = threading.Lock()
+
+
+def _cache_get(etag: str):
+    with _lock_respuestas:
+        respuesta = _respuestas.get(etag)
+        if respuesta is not None:
+            _respuestas.move_to_end(etag)
+        return respuesta
+
+
+def _cache_put(etag: str, respuesta: tuple):
+    with _lock_respuestas:
+        _respuestas[etag] = respuesta
+        while len(_respuestas) > MAX_RESPUESTAS:
+            _respuestas.popitem(last=False)
+
+
+def etag_para(version: str, ruta: str, query: dict) -> str:
+    clave = json.dumps([version, ruta, sorted((k, v) for k, v in query.items())], ensure_ascii=False)
+    return '"' + hashlib.sha1(clave.encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def acepta_gzip(accept_encoding: str) -> bool:
+    """¿La cabecera Accept-Encoding admite gzip? Respeta los q-values ("gzip;q=0" lo rechaza) y "*"."""
+    calidades = {}
+    for token in accept_encoding.split(","):
+        nombre, _, parametros = token.partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.partition("=")
+            if clave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        calidades[nombre] = q
+    return calidades.get("gzip", calidades.get("x-gzip", calidades.get("*", 0.0))) > 0
+
+
+# --- Servidor ---
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SIDPOL-API/1.0"
+
+    def do_GET(self):
+        inicio = time.perf_counter()
+        partes = urlsplit(self.path)
+        ruta = partes.path.rstrip("/") or "/"
+        error = False
+        try:
+            if ruta not in RUTAS:
+                self._enviar_json(HTTPStatus.NOT_FOUND, {"error": f"Ruta desconocida: {ruta}",
+                                                         "rutas": sorted(RUTAS)})
+                return
+            usa_bd, funcion = RUTAS[ruta]
+            query = parse_qs(partes.query)
+            ds = dataset.obtener_dataset(processing.data_path())
+            version = ds.version + ("|" + database.version_bd() if usa_bd else "")
+            etag = etag_para(version, ruta, query)
+
+            if etag in {e.strip() for e in self.headers.get("If-None-Match", "").split(",")}:
+                self._enviar(HTTPStatus.NOT_MODIFIED, b"", etag=etag)
+                return
+
+            respuesta = _cache_get(etag)
+            if respuesta is None:
+                cuerpo = json.dumps(funcion(Contexto(ds, filtro_desde_query(query)), query),
+                                    ensure_ascii=False).encode("utf-8")
+                comprimido = gzip.compress(cuerpo, compresslevel=6) if len(cuerpo) >= MIN_GZIP_BYTES else None
+                respuesta = (cuerpo, comprimido)
+                _cache_put(etag, respuesta)
+            cuerpo, comprimido = respuesta
+            if comprimido is not None and acepta_gzip(self.headers.get("Accept-Encoding", "")):
+                self._enviar(HTTPStatus.OK, comprimido, etag=etag, gzip_=True)
+            else:
+                self._enviar(HTTPStatus.OK, cuerpo, etag=etag)
+        except ValidationError as e:
+            self._enviar_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        except FileNotFoundError:
+            self._enviar_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "No hay CSV descargado en data/"})
+        except Exception as e:
+            error = True
+            logger.exception("API: error en %s: %s", self.path, e)
+            self._enviar_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+        finally:
+            registry.observe("api" + ruta.replace("/", "_"), time.perf_counter() - inicio, error)
+
+    def _enviar_json(self, estado: HTTPStatus, objeto):
+        self._enviar(estado, json.dumps(objeto, ensure_ascii=False).encode("utf-8"))
+
+    def _enviar(self, estado: HTTPStatus, cuerpo: bytes, etag: str = None, gzip_: bool = False):
+        self.send_response(estado)
+        if estado != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if gzip_:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        logger.debug("API %s - " + formato, self.address_string(), *args, extra=FRECUENTE)
+
+
+class ServidorAPI(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones pendientes amplia para ráfagas de clientes concurrentes
+    request_queue_size = 128
+
+
+def crear_servidor(host: str = HOST_DEFECTO, puerto: int = PUERTO_DEFECTO) -> ServidorAPI:
+    """Crea el servidor (sin arrancarlo); `puerto=0` elige uno libre (ver `server_address`)."""
+    return ServidorAPI((host, puerto), ManejadorAPI)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="API JSON de sólo lectura de SIDPOL")
+    parser.add_argument("--host", default=HOST_DEFECTO)
+    parser.add_argument("--puerto", type=int, default=PUERTO_DEFECTO)
+    args = parser.parse_args(argv)
+
+    servidor = crear_servidor(args.host, args.puerto)
+    logger.info("API escuchando en http://%s:%s", *servidor.server_address[:2])
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
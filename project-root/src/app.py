@@ -1,437 +1,836 @@
+from __future__ import annotations
+
+import functools
+import os
+import time
 import streamlit as st
-import pandas as pd
-import numpy as np
-from processing import (
-    data_path, list_data_files, load_raw, clean, filter_df,
-    by_modalidad, monthly_trend, top_departamentos, heatmap_modalidad_mes
-)
-from viz import bar_modalidad, line_trend, bar_top_departamentos, heatmap_mod_mes
-from download_data import download_csv
-from database import (
-    cargar_csv_a_bd, 
-    consultar_bd, 
-    obtener_denuncias_por_modalidad,
-    obtener_denuncias_por_departamento,
-    obtener_tabla_completa,
-    obtener_estadisticas_generales,
-    obtener_denuncias_join,
-    obtener_top_modalidades_por_departamento,
-)
-from analysis import (
-    predict_monthly_trend,
-    calculate_growth_rate,
-    top_modalidad_by_departamento,
-    calculate_correlation_matrix
-)
-from utils import logger
+from utils import logger, log_time, LOG_DIR, FRECUENTE, importar_perezoso
+from metrics import registry
+from profiling import objetivos_activos, perfil_opcional
+
+# Módulos pesados: se importan en su primer uso y no en la carga del script
+# (pandas, sklearn vía analysis, altair vía viz, requests vía download_data)
+pd = importar_perezoso("pandas")
+processing = importar_perezoso("processing")
+database = importar_perezoso("database")
+viz = importar_perezoso("viz")
+analysis = importar_perezoso("analysis")
+download_data = importar_perezoso("download_data")
+dataset = importar_perezoso("dataset")
+components = importar_perezoso("components")
+export = importar_perezoso("export")
+lake = importar_perezoso("lake")
+aproximado = importar_perezoso("aproximado")
+tareas = importar_perezoso("tareas")
+busqueda = importar_perezoso("busqueda")
+instantanea = importar_perezoso("instantanea")
+precalentamiento = importar_perezoso("precalentamiento")
 
 # Configuración básica de la página
 st.set_page_config(page_title="SIDPOL Perú - Prototipo", layout="wide")
 
 logger.info("=== Aplicación Streamlit iniciada ===")
 
-# --- Login simple: guardar nombre temporalmente en sesión ---
-if "user_name" not in st.session_state:
-    st.session_state["user_name"] = "X"
 
-with st.sidebar.expander("👤 Usuario / Login", expanded=False):
-    name_input = st.text_input("Nombre", value=st.session_state.get("user_name", "X"))
-    if st.button("Iniciar sesión", key="login_btn"):
-        st.session_state["user_name"] = name_input.strip() if name_input.strip() else "X"
-        st.success(f"Sesión iniciada como {st.session_state['user_name']}")
-        logger.info(f"Usuario {st.session_state['user_name']} inició sesión")
+def id_sesion() -> str:
+    """Identificador corto de la sesión de Streamlit (para etiquetar perfiles)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id[:8] if ctx else "local"
+    except Exception:
+        return "local"
 
-# Mostrar usuario en la app
-st.caption(f"👤 Usuario actual: `{st.session_state.get('user_name', 'X')}`")
 
+def consumir_perfil_url() -> str | None:
+    """Lee `?profile=1|rerun|ingest` y lo elimina de la URL: el perfil aplica a una sola ejecución.
 
-# ====== SECCIÓN DE DESCARGA CSV ======
-st.title("🚔 Dashboard de denuncias policiales (SIDPOL) - Prototipo")
-st.caption("Fuente: SIDPOL/SIDPPOL – MININTER. Variables: AÑO, MES, DEPARTAMENTO, PROVINCIA, DISTRITO, MODALIDADES, cantidad. Licencia ODC-By.")
+    Sólo con el panel admin habilitado (ver `admin_habilitado`); si no, el parámetro se descarta.
+    """
+    try:
+        valor = st.query_params.get("profile")
+        if not valor:
+            return None
+        del st.query_params["profile"]
+        if not admin_habilitado():
+            logger.warning("?profile ignorado: requiere SIDPOL_ADMIN=1 o ?admin=1")
+            return None
+        return "ingest" if valor == "ingest" else "rerun"
+    except Exception:
+        return None
 
-if st.button("📥 Descargar/Actualizar CSV desde datosabiertos.gob.pe"):
-    with st.spinner("Descargando datos..."):
-        try:
-            output_path = download_csv()
-            st.success(f"✓ Descarga completada: {output_path.name}")
-            logger.info(f"CSV descargado: {output_path.name}")
-            st.cache_data.clear()
-            st.rerun()
-        except Exception as e:
-            st.error(f"❌ Error durante descarga: {e}")
-            logger.exception(f"Error descargando CSV: {e}")
-else:
-    st.info("ℹ️ Haz clic en el botón para obtener el CSV actualizado desde la fuente oficial.")
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def bd_cacheada(version: str, nombre: str, *args):
+    """Memoiza una consulta de `database` por token de versión de la BD.
+
+    Mientras no cambie `database.version_bd()` (nadie escribió en la BD),
+    los reruns reutilizan el resultado en lugar de volver a consultar SQLite.
+    """
+    return getattr(database, nombre)(*args)
+
+
+@log_time
+def seccion_login():
+    """Login simple: guarda el nombre temporalmente en sesión."""
+    if "user_name" not in st.session_state:
+        st.session_state["user_name"] = "X"
+
+    with st.sidebar.expander("👤 Usuario / Login", expanded=False):
+        name_input = st.text_input("Nombre", value=st.session_state.get("user_name", "X"))
+        if st.button("Iniciar sesión", key="login_btn"):
+            st.session_state["user_name"] = name_input.strip() if name_input.strip() else "X"
+            st.success(f"Sesión iniciada como {st.session_state['user_name']}")
+            logger.info("Usuario %s inició sesión", st.session_state['user_name'])
 
-# ====== SECCIÓN DE BASE DE DATOS ======
-st.divider()
-st.subheader("⚙️ Gestión de Base de Datos")
+    # Mostrar usuario en la app
+    st.caption(f"👤 Usuario actual: `{st.session_state.get('user_name', 'X')}`")
 
-col_db1, col_db2, col_db3 = st.columns(3)
 
-with col_db1:
-    if st.button("💾 Cargar CSV a Base de Datos"):
-        with st.spinner("Cargando a BD..."):
+@log_time
+def seccion_descarga():
+    """Título y botón de descarga del CSV oficial."""
+    st.title("🚔 Dashboard de denuncias policiales (SIDPOL) - Prototipo")
+    st.caption("Fuente: SIDPOL/SIDPPOL – MININTER. Variables: AÑO, MES, DEPARTAMENTO, PROVINCIA, DISTRITO, MODALIDADES, cantidad. Licencia ODC-By.")
+
+    if st.button("📥 Descargar/Actualizar CSV desde datosabiertos.gob.pe"):
+        with st.spinner("Descargando datos..."):
             try:
-                csv_to_load = data_path()
-                filas, exito = cargar_csv_a_bd(str(csv_to_load))
-                if exito:
-                    st.success(f"✓ {filas} registros cargados a BD SQLite")
-                    logger.info(f"Datos cargados a BD: {filas} registros")
+                output_path = download_data.download_csv()
+                st.success(f"✓ Descarga completada: {output_path.name}")
+                logger.info("CSV descargado: %s", output_path.name)
+                try:
+                    # Sólo se escriben en el lago Parquet los meses nuevos o modificados
+                    reporte = lake.actualizar_desde_csv(output_path)
+                    logger.info("Lago actualizado: %s particiones nuevas/modificadas", len(reporte["escritas"]))
+                except Exception as e:
+                    logger.warning("No se pudo actualizar el lago Parquet: %s", e)
+                st.cache_data.clear()
+                # Cachés de la versión nueva y de los filtros más usados, antes de que lleguen las sesiones
+                precalentamiento.programar(output_path)
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error durante descarga: {e}")
+                logger.exception("Error descargando CSV: %s", e)
+    else:
+        st.info("ℹ️ Haz clic en el botón para obtener el CSV actualizado desde la fuente oficial.")
+
+
+@log_time
+def seccion_gestion_bd():
+    """Panel plegable de gestión de la BD; su contenido sólo se ejecuta con el panel abierto."""
+    st.divider()
+    # Cerrado no consulta la BD anterior ni crea los botones: nada de esto corre en el primer render
+    panel = st.expander("⚙️ Gestión de Base de Datos", key="panel_gestion_bd", on_change="rerun")
+    if panel.open:
+        with panel:
+            panel_gestion_bd()
+    st.divider()
+
+
+def panel_gestion_bd():
+    """Botones de carga a BD, estadísticas, limpieza de caché y restauración de la BD anterior."""
+    col_db1, col_db2, col_db3 = st.columns(3)
+
+    with col_db1:
+        incremental = st.checkbox("Sólo meses nuevos o modificados", value=True, key="carga_incremental",
+                                  help="Compara cada (año, mes) con la última carga y reemplaza sólo los que cambiaron")
+        if st.button("💾 Cargar CSV a Base de Datos"):
+            with st.spinner("Cargando a BD..."):
+                try:
+                    csv_to_load = processing.data_path()
+                    perfil_ingest = st.session_state.pop("perfil_ingest", False)
+                    with perfil_opcional("ingest", id_sesion(), perfil_ingest):
+                        if incremental:
+                            reporte, exito = database.cargar_csv_delta(str(csv_to_load))
+                        else:
+                            filas, exito = database.cargar_csv_a_bd(str(csv_to_load))
+                    if exito and incremental:
+                        st.success(f"✓ Carga incremental: {reporte['filas_insertadas']} registros insertados, "
+                                   f"{reporte['filas_eliminadas']} eliminados o reemplazados")
+                        # Dentro del panel de gestión no caben expanders anidados
+                        with st.container(border=True):
+                            st.caption("Cambios por mes")
+                            st.write(f"**Nuevos:** {', '.join(reporte['nuevas']) or '—'}")
+                            st.write(f"**Modificados:** {', '.join(reporte['modificadas']) or '—'}")
+                            st.write(f"**Sin cambios:** {len(reporte['sin_cambios'])} meses")
+                            if reporte["ausentes"]:
+                                st.warning(f"Meses eliminados de la BD (ya no están en el archivo): "
+                                           f"{', '.join(reporte['ausentes'])}")
+                    elif exito:
+                        st.success(f"✓ {filas} registros cargados a BD SQLite")
+                        logger.info("Datos cargados a BD: %s registros", filas)
+                    else:
+                        st.error("❌ Error al cargar los datos")
+                        logger.error("Error cargando datos a BD")
+                    if exito:
+                        precalentamiento.programar(csv_to_load)
+                except FileNotFoundError:
+                    st.error("❌ Descarga primero el CSV con el botón de arriba")
+                    logger.error("Archivo CSV no encontrado")
+                except Exception as e:
+                    st.error(f"❌ Error: {e}")
+                    logger.exception("Error: %s", e)
+
+    with col_db2:
+        if st.button("📊 Estadísticas de BD"):
+            try:
+                stats, exito = bd_cacheada(database.version_bd(), "obtener_estadisticas_generales")
+                if exito and stats is not None and not stats.empty:
+                    row = stats.iloc[0]
+                    st.metric("Años en BD", int(row['años']))
+                    st.metric("Departamentos", int(row['departamentos']))
+                    st.metric("Modalidades", int(row['modalidades']))
+                    st.metric("Total Denuncias", int(row['total_denuncias']))
                 else:
-                    st.error("❌ Error al cargar los datos")
-                    logger.error("Error cargando datos a BD")
-            except FileNotFoundError:
-                st.error("❌ Descarga primero el CSV con el botón de arriba")
-                logger.error("Archivo CSV no encontrado")
+                    st.warning("⚠️ Carga datos a la BD primero")
             except Exception as e:
                 st.error(f"❌ Error: {e}")
-                logger.exception(f"Error: {e}")
+                logger.exception("Error obteniendo estadísticas: %s", e)
 
-with col_db2:
-    if st.button("📊 Estadísticas de BD"):
-        try:
-            stats, exito = obtener_estadisticas_generales()
-            if exito and stats is not None and not stats.empty:
-                row = stats.iloc[0]
-                st.metric("Años en BD", int(row['años']))
-                st.metric("Departamentos", int(row['departamentos']))
-                st.metric("Modalidades", int(row['modalidades']))
-                st.metric("Total Denuncias", int(row['total_denuncias']))
-            else:
-                st.warning("⚠️ Carga datos a la BD primero")
-        except Exception as e:
-            st.error(f"❌ Error: {e}")
-            logger.exception(f"Error obteniendo estadísticas: {e}")
+    with col_db3:
+        if st.button("🔄 Actualizar caché"):
+            st.cache_data.clear()
+            dataset.invalidar()
+            # El próximo rerun vuelve a precalentar la versión actual (seccion_datos)
+            precalentamiento.invalidar()
+            st.success("✓ Caché limpiado")
+            st.rerun()
+
+        # Cada carga publica una BD nueva y conserva la reemplazada
+        anterior = database.version_anterior()
+        if anterior and st.button(f"↩️ Restaurar BD anterior ({anterior})", key="restaurar_bd_btn",
+                                  help="Intercambia la BD publicada con la anterior; repetirlo deshace el cambio"):
+            try:
+                database.restaurar_anterior()
+                st.cache_data.clear()
+                st.success("✓ BD anterior restaurada")
+            except Exception as e:
+                st.error(f"❌ Error: {e}")
+                logger.exception("Error restaurando BD: %s", e)
+
+
+def mostrar_sql_aproximado(resultado):
+    info = resultado.attrs.get("aproximado", {})
+    st.dataframe(resultado, use_container_width=True)
+    st.caption(f"⚡ Aproximado sobre {info.get('filas_muestra', 0):,} de {info.get('filas', 0):,} filas "
+               f"({info.get('fraccion', 0):.1%}); columnas ± = intervalo del 95 %. "
+               "Calculando el resultado exacto…")
+
+
+def mostrar_sql_exacto(futuro):
+    try:
+        resultado, exito = futuro.result()
+    except Exception as e:
+        resultado, exito = None, False
+        logger.exception("Error en consulta SQL exacta: %s", e)
+    if exito and resultado is not None:
+        st.dataframe(resultado, use_container_width=True)
+        st.caption(f"✓ Resultado exacto · Filas: {len(resultado)}")
+    else:
+        st.error("❌ Error en la consulta SQL exacta")
 
-with col_db3:
-    if st.button("🔄 Actualizar caché"):
-        st.cache_data.clear()
-        st.success("✓ Caché limpiado")
+
+@st.fragment(run_every=1)
+def sql_en_espera():
+    """Muestra la respuesta aproximada y, cuando el exacto termina, re-ejecuta la app para mostrarlo."""
+    pendiente = st.session_state.get("sql_exacto")
+    if not pendiente:
+        return
+    clave, sql_query, resultado = pendiente
+    if aproximado.en_segundo_plano(clave, database.consultar_bd, sql_query).done():
         st.rerun()
+    mostrar_sql_aproximado(resultado)
 
-st.divider()
 
+@st.fragment
+@log_time
+def seccion_consultas_sql():
+    """Editor de consultas SQL y vista de tabla completa."""
+    st.subheader("🔍 Editor de Consultas SQL")
 
-# ====== SECCIÓN DE CONSULTAS SQL ======
-st.subheader("🔍 Editor de Consultas SQL")
+    tab_consultas, tab_tabla = st.tabs(["Consulta personalizada", "Ver tabla"])
 
-tab_consultas, tab_tabla = st.tabs(["Consulta personalizada", "Ver tabla"])
+    with tab_consultas:
+        col_sql1, col_sql2 = st.columns([3, 1])
 
-with tab_consultas:
-    col_sql1, col_sql2 = st.columns([3, 1])
-    
-    with col_sql1:
-        sql_query = st.text_area(
-            "Escribe tu consulta SQL:",
-            value="SELECT * FROM denuncias LIMIT 10",
-            height=150
-        )
-    
-    with col_sql2:
-        ejecutar_sql = st.button("▶️ Ejecutar", use_container_width=True)
-    
-    if ejecutar_sql:
-        try:
-            resultado, exito = consultar_bd(sql_query)
-            if exito and resultado is not None:
-                st.dataframe(resultado, use_container_width=True)
-                st.caption(f"✓ Filas: {len(resultado)}")
-            else:
-                st.error("❌ Error en la consulta SQL")
-        except Exception as e:
-            st.error(f"❌ Error SQL: {e}")
-            logger.exception(f"Error SQL: {e}")
+        with col_sql1:
+            sql_query = st.text_area(
+                "Escribe tu consulta SQL:",
+                value="SELECT * FROM denuncias LIMIT 10",
+                height=150
+            )
 
-    if st.button("🔗 Mostrar ejemplo JOIN (denuncias con departamento y modalidad)"):
-        try:
-            jtab, ok = obtener_denuncias_join(limite=200)
-            if ok and jtab is not None:
-                st.dataframe(jtab, use_container_width=True)
-            else:
-                st.warning("⚠️ No hay datos o carga la BD primero")
-        except Exception as e:
-            st.error(f"❌ Error mostrando JOIN: {e}")
-            logger.exception(f"Error JOIN: {e}")
+        with col_sql2:
+            ejecutar_sql = st.button("▶️ Ejecutar", use_container_width=True)
+            sql_aproximado = st.checkbox("⚡ Aproximado", value=False, key="sql_aproximado",
+                                         help="Responde al instante sobre una muestra estratificada (SUM(cantidad) "
+                                              "estima el total, SUM(peso) las filas) y calcula el exacto en segundo plano")
 
-with tab_tabla:
-    if st.button("Cargar tabla completa desde BD"):
-        try:
-            tabla, exito = obtener_tabla_completa(limite=500)
-            if exito and tabla is not None:
-                st.dataframe(tabla, use_container_width=True)
-                st.caption(f"Total de filas mostradas: {len(tabla)}")
+        if ejecutar_sql:
+            st.session_state.pop("sql_exacto", None)
+            try:
+                resultado, exito = database.consultar_bd(sql_query, aproximado=sql_aproximado)
+                if exito and resultado is not None and sql_aproximado:
+                    # El exacto se calcula en un hilo; la misma consulta sobre la misma BD comparte la tarea
+                    clave = f"sql:{database.version_bd()}:{sql_query}"
+                    aproximado.en_segundo_plano(clave, database.consultar_bd, sql_query)
+                    st.session_state["sql_exacto"] = (clave, sql_query, resultado)
+                elif exito and resultado is not None:
+                    st.dataframe(resultado, use_container_width=True)
+                    st.caption(f"✓ Filas: {len(resultado)}")
+                else:
+                    st.error("❌ Error en la consulta SQL")
+            except Exception as e:
+                st.error(f"❌ Error SQL: {e}")
+                logger.exception("Error SQL: %s", e)
+
+        pendiente = st.session_state.get("sql_exacto")
+        if pendiente:
+            futuro = aproximado.en_segundo_plano(pendiente[0], database.consultar_bd, pendiente[1])
+            if futuro.done():
+                mostrar_sql_exacto(futuro)
             else:
-                st.warning("⚠️ Carga datos a la BD primero")
-        except Exception as e:
-            st.error(f"❌ Error: {e}")
-            logger.exception(f"Error: {e}")
+                sql_en_espera()
 
-st.divider()
+        if st.button("🔗 Mostrar ejemplo JOIN (denuncias con departamento y modalidad)"):
+            try:
+                jtab, ok = database.obtener_denuncias_join(limite=200)
+                if ok and jtab is not None:
+                    st.dataframe(jtab, use_container_width=True)
+                else:
+                    st.warning("⚠️ No hay datos o carga la BD primero")
+            except Exception as e:
+                st.error(f"❌ Error mostrando JOIN: {e}")
+                logger.exception("Error JOIN: %s", e)
 
-st.subheader("Tablas creadas y vista JOIN")
-try:
-    tablas_df, ok_tablas = consultar_bd(
-        "SELECT name AS tabla FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
-    )
-    if ok_tablas and tablas_df is not None and not tablas_df.empty:
-        st.dataframe(tablas_df, use_container_width=True)
-        table_names = tablas_df["tabla"].tolist()
-        selected_table = st.selectbox("Ver tabla individual", options=table_names)
-        if selected_table:
+    with tab_tabla:
+        if st.button("Cargar tabla completa desde BD"):
             try:
-                data_df, ok_data = consultar_bd(f"SELECT * FROM {selected_table} LIMIT 500")
-                if ok_data and data_df is not None:
-                    st.dataframe(data_df, use_container_width=True)
-                    st.caption(f"Mostrando hasta 500 filas de `{selected_table}`.")
+                tabla, exito = database.obtener_tabla_completa(limite=500)
+                if exito and tabla is not None:
+                    st.dataframe(tabla, use_container_width=True)
+                    st.caption(f"Total de filas mostradas: {len(tabla)}")
                 else:
-                    st.warning("⚠️ Sin datos para la tabla seleccionada.")
+                    st.warning("⚠️ Carga datos a la BD primero")
             except Exception as e:
-                st.error(f"❌ No se pudo mostrar la tabla {selected_table}: {e}")
-    else:
-        st.info("ℹ️ Aún no hay tablas registradas. Carga datos a la BD para verlas aquí.")
-except Exception as e:
-    st.error(f"❌ No se pudieron listar las tablas: {e}")
-    logger.exception(f"Error listando tablas: {e}")
+                st.error(f"❌ Error: {e}")
+                logger.exception("Error: %s", e)
 
-if st.button("Mostrar JOIN de todas las tablas", key="join_full_btn"):
+    st.divider()
+
+
+@st.fragment
+@log_time
+def seccion_tablas():
+    """Listado de tablas de la BD y vista JOIN (fragmento: el selector no re-ejecuta la app)."""
+    st.subheader("Tablas creadas y vista JOIN")
+    version = database.version_bd()
     try:
-        join_df, ok_join = obtener_denuncias_join(limite=300)
-        if ok_join and join_df is not None and not join_df.empty:
-            st.dataframe(join_df, use_container_width=True)
-            st.caption("Vista combinada de denuncias, departamentos y modalidades.")
+        tablas_df, ok_tablas = bd_cacheada(
+            version, "consultar_bd",
+            "SELECT name AS tabla FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+        if ok_tablas and tablas_df is not None and not tablas_df.empty:
+            st.dataframe(tablas_df, use_container_width=True)
+            table_names = tablas_df["tabla"].tolist()
+            selected_table = st.selectbox("Ver tabla individual", options=table_names)
+            if selected_table:
+                try:
+                    data_df, ok_data = bd_cacheada(version, "consultar_bd", f"SELECT * FROM {selected_table} LIMIT 500")
+                    if ok_data and data_df is not None:
+                        st.dataframe(data_df, use_container_width=True)
+                        st.caption(f"Mostrando hasta 500 filas de `{selected_table}`.")
+                    else:
+                        st.warning("⚠️ Sin datos para la tabla seleccionada.")
+                except Exception as e:
+                    st.error(f"❌ No se pudo mostrar la tabla {selected_table}: {e}")
         else:
-            st.warning("⚠️ No existen registros combinados para mostrar.")
+            st.info("ℹ️ Aún no hay tablas registradas. Carga datos a la BD para verlas aquí.")
     except Exception as e:
-        st.error(f"❌ Error obteniendo el JOIN: {e}")
-        logger.exception(f"Error JOIN completo: {e}")
+        st.error(f"❌ No se pudieron listar las tablas: {e}")
+        logger.exception("Error listando tablas: %s", e)
+
+    if st.button("Mostrar JOIN de todas las tablas", key="join_full_btn"):
+        try:
+            join_df, ok_join = bd_cacheada(version, "obtener_denuncias_join", 300)
+            if ok_join and join_df is not None and not join_df.empty:
+                st.dataframe(join_df, use_container_width=True)
+                st.caption("Vista combinada de denuncias, departamentos y modalidades.")
+            else:
+                st.warning("⚠️ No existen registros combinados para mostrar.")
+        except Exception as e:
+            st.error(f"❌ Error obteniendo el JOIN: {e}")
+            logger.exception("Error JOIN completo: %s", e)
 
-st.divider()
+    st.divider()
 
 
 # ====== RESTO DE LA APP (CÓDIGO ORIGINAL) ======
-# Carga de datos parametrizada (caché por ruta)
-@st.cache_data(show_spinner=False)
-def load_data(path_str: str) -> pd.DataFrame:
+# Carga de datos parametrizada: un único DataFrame limpio por proceso y versión
+# del archivo, compartido (sin copias) entre todas las sesiones
+def load_data(path_str: str):
     from pathlib import Path
     try:
-        df = clean(load_raw(Path(path_str)))
-        logger.info(f"Datos cargados en cache: {Path(path_str).name}")
-        return df
+        return dataset.obtener_dataset(Path(path_str))
+    except FileNotFoundError:
+        raise
     except Exception as e:
-        logger.exception(f"Error cargando datos en cache: {e}")
+        logger.exception("Error cargando datos en cache: %s", e)
         st.error(f"Error cargando datos: {e}")
         return None
 
 
-# Selector de archivo de datos: permite elegir el más reciente o un CSV concreto
-available = list_data_files()
-options = ["Último"] + [p.name for p in available]
-choice = st.selectbox("Archivo de datos a usar", options=options, index=0)
+def vista_inicial(dp):
+    """Instantánea de la vista por defecto mientras la sesión no cambie ningún filtro (o None)."""
+    if st.session_state.get("vista_completa") or not dp.exists():
+        return None
+    try:
+        return instantanea.obtener_instantanea(dataset.version_dataset(dp))
+    except Exception as e:
+        logger.warning("Instantánea no disponible: %s", e)
+        return None
 
-selected_filename = None if choice == "Último" else choice
-dp = data_path(selected_filename)
 
-# Mostrar info del archivo seleccionado
-try:
-    if dp.exists():
-        mtime = dp.stat().st_mtime
-        import datetime
-        ts = datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
-        st.caption(f"📄 Archivo de datos seleccionado: `{dp.name}` — modificado: {ts}")
-    else:
-        st.caption(f"📄 Archivo de datos seleccionado: `{dp.name}` (no existe aún)")
-except Exception:
-    pass
-
-# KPIs desde la base de datos (si hay datos)
-try:
-    stats_df, ok = obtener_estadisticas_generales()
-    if ok and stats_df is not None and not stats_df.empty:
-        row = stats_df.iloc[0]
-        k1, k2, k3, k4 = st.columns(4)
-        k1.metric("📅 Años en BD", int(row["años"]))
-        k2.metric("🗺️ Departamentos", int(row["departamentos"]))
-        k3.metric("📋 Modalidades", int(row["modalidades"]))
-        k4.metric("📊 Total denuncias", int(row["total_denuncias"]))
-except Exception as e:
-    logger.warning(f"Error mostrando KPIs de BD: {e}")
-
-# Cargar DataFrame usando la ruta seleccionada
-try:
-    df = load_data(str(dp))
-    if df is None:
+def cargar_vista_completa():
+    """A partir de aquí la sesión usa el dataset completo (se carga en el próximo rerun)."""
+    st.session_state["vista_completa"] = True
+
+
+@log_time
+def seccion_datos():
+    """Selector de archivo, KPIs de BD y carga del dataset compartido."""
+    # Selector de archivo de datos: permite elegir el más reciente o un CSV concreto
+    available = processing.list_data_files()
+    options = ["Último"] + [p.name for p in available]
+    choice = st.selectbox("Archivo de datos a usar", options=options, index=0)
+
+    selected_filename = None if choice == "Último" else choice
+    dp = processing.data_path(selected_filename)
+
+    # Mostrar info del archivo seleccionado
+    try:
+        if dp.exists():
+            mtime = dp.stat().st_mtime
+            import datetime
+            ts = datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+            st.caption(f"📄 Archivo de datos seleccionado: `{dp.name}` — modificado: {ts}")
+        else:
+            st.caption(f"📄 Archivo de datos seleccionado: `{dp.name}` (no existe aún)")
+    except Exception:
+        pass
+
+    # KPIs desde la base de datos (si hay datos)
+    try:
+        stats_df, ok = bd_cacheada(database.version_bd(), "obtener_estadisticas_generales")
+        if ok and stats_df is not None and not stats_df.empty:
+            row = stats_df.iloc[0]
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("📅 Años en BD", int(row["años"]))
+            k2.metric("🗺️ Departamentos", int(row["departamentos"]))
+            k3.metric("📋 Modalidades", int(row["modalidades"]))
+            k4.metric("📊 Total denuncias", int(row["total_denuncias"]))
+    except Exception as e:
+        logger.warning("Error mostrando KPIs de BD: %s", e)
+
+    # Una vez por versión: dataset, cubo, instantánea y filtros más usados en segundo plano
+    precalentamiento.programar(dp)
+
+    # Primer render: vista por defecto precalculada, sin cargar el dataset
+    inicial = vista_inicial(dp)
+    if inicial is not None:
+        return inicial
+
+    # Cargar DataFrame usando la ruta seleccionada
+    try:
+        ds = load_data(str(dp))
+        if ds is None:
+            st.stop()
+    except FileNotFoundError:
+        st.error("❌ Archivo seleccionado no encontrado. Descarga el CSV o elige otro archivo.")
         st.stop()
-except FileNotFoundError:
-    st.error("❌ Archivo seleccionado no encontrado. Descarga el CSV o elige otro archivo.")
-    st.stop()
-except Exception as e:
-    st.error(f"❌ Error cargando datos: {e}")
-    logger.exception(f"Error cargando datos: {e}")
-    st.stop()
-
-
-# Controles (≥3): año, modalidades, departamento, provincia dependiente, rango de meses
-years = sorted([int(x) for x in df["AÑO"].dropna().unique()])
-mods = sorted([m for m in df["MODALIDADES"].dropna().unique()])
-dptos = sorted([d for d in df["DEPARTAMENTO"].dropna().unique()])
-
-
-st.subheader("🎛️ Filtros de Análisis")
-c1, c2, c3, c4 = st.columns(4)
-with c1:
-    year_sel = st.selectbox("Año", options=years, index=len(years) - 1)
-with c2:
-    mods_sel = st.multiselect("Modalidades", options=mods, default=mods[:3])
-with c3:
-    dpto_sel = st.selectbox("Departamento", options=["Todos"] + dptos, index=0)
-with c4:
-    mes_sel = st.slider("Mes (rango)", min_value=1, max_value=12, value=(1, 12), step=1)
-
-# Control dependiente de provincia si se eligió un departamento
-prov_sel = None
-if dpto_sel != "Todos":
-    provs = sorted([p for p in df[df["DEPARTAMENTO"] == dpto_sel]["PROVINCIA"].dropna().unique()])
-    prov_sel = st.selectbox("Provincia", options=["Todas"] + provs, index=0)
-
-# Controles adicionales
-st.subheader("📋 Controles Adicionales")
-col_extra1, col_extra2, col_extra3 = st.columns(3)
-
-with col_extra1:
-    show_distritos = st.checkbox("Filtrar por Distrito", value=False)
-    dist_sel = None
-    if show_distritos and dpto_sel != "Todos":
-        distritos = sorted([d for d in df[df["DEPARTAMENTO"] == dpto_sel]["DISTRITO"].dropna().unique()])
-        dist_sel = st.selectbox("Distrito", options=["Todos"] + distritos, index=0)
-        dist_sel = None if dist_sel == "Todos" else dist_sel
-
-with col_extra2:
-    export_data = st.checkbox("Exportar datos filtrados", value=False)
-
-with col_extra3:
-    show_correlation = st.checkbox("Mostrar matriz de correlación", value=False)
-
-# Aplicar filtros
-try:
-    df_f = filter_df(df, year_sel, mods_sel, dpto_sel, prov_sel, mes_sel)
-    
-    # Filtro adicional de distrito si se aplicó
-    if dist_sel and "DISTRITO" in df_f.columns:
-        df_f = df_f[df_f["DISTRITO"] == dist_sel]
-    
-    logger.info(f"Filtros aplicados: {len(df_f)} filas resultantes")
-except Exception as e:
-    st.error(f"❌ Error aplicando filtros: {e}")
-    logger.exception(f"Error en filtros: {e}")
-    df_f = df.copy()
-
-
-# Indicador simple de total filtrado
-total_denuncias = int(df_f["cantidad"].sum())
-st.metric("📊 Total de denuncias (filtro activo)", total_denuncias)
-
-# Exportar datos filtrados si se solicita
-if export_data:
+    except Exception as e:
+        st.error(f"❌ Error cargando datos: {e}")
+        logger.exception("Error cargando datos: %s", e)
+        st.stop()
+    return ds
+
+
+LIMITE_BUSQUEDA = 8
+
+
+def aplicar_busqueda(resultado):
+    """Callback de un resultado de búsqueda: fija los filtros correspondientes (antes de crearlos)."""
+    if resultado.tipo == "modalidad":
+        actuales = st.session_state.get("filtro_mods", [])
+        if resultado.nombre not in actuales:
+            st.session_state["filtro_mods"] = [*actuales, resultado.nombre]
+        return
+    dpto = resultado.nombre if resultado.tipo == "departamento" else resultado.departamento
+    st.session_state["filtro_dpto"] = dpto
+    st.session_state["filtro_prov"] = resultado.nombre if resultado.tipo == "provincia" else (
+        resultado.provincia or "Todas")
+    st.session_state["filtro_ver_distritos"] = resultado.tipo == "distrito"
+    st.session_state["filtro_dist"] = resultado.nombre if resultado.tipo == "distrito" else "Todos"
+
+
+@st.fragment
+def buscador_nombres(ds):
+    """Búsqueda incremental en el índice de nombres; elegir un resultado aplica el filtro.
+
+    Es un fragmento: escribir sólo re-ejecuta la búsqueda (sub-milisegundo), no la página.
+    """
+    texto = st.text_input("🔎 Buscar departamento, provincia, distrito o modalidad", key="buscar_nombre",
+                          placeholder="p. ej. san juan")
+    if not texto.strip():
+        return
+    inicio = time.perf_counter()
+    resultados = busqueda.obtener_indice(ds).buscar(texto, limite=LIMITE_BUSQUEDA)
+    duracion = time.perf_counter() - inicio
+    registry.observe("busqueda_nombres", duracion)
+    if not resultados:
+        st.caption("Sin coincidencias")
+        return
+    st.caption(f"{len(resultados)} coincidencias en {duracion * 1000:.1f} ms — elige una para filtrar")
+    columnas = st.columns(2)
+    for i, resultado in enumerate(resultados):
+        with columnas[i % 2]:
+            if st.button(resultado.etiqueta(), key=f"buscar_res_{i}", on_click=aplicar_busqueda, args=(resultado,)):
+                # El callback ya fijó los filtros: re-ejecutar toda la página para aplicarlos
+                st.rerun()
+
+
+@log_time
+def seccion_filtros(ds):
+    """Controles de filtrado.
+
+    Devuelve el DataFrame filtrado, la opción de exportar, la clave del filtro y el
+    filtro (dict). En modo aproximado el DataFrame es None mientras el resultado
+    exacto se calcula en segundo plano; con la instantánea de la vista inicial
+    también es None (no hay filas cargadas).
+    """
+    # Controles (≥3): año o rango de fechas, modalidades, departamento, provincia dependiente, rango de meses
+    # Listas precalculadas una vez por versión del dataset (sin recorrer las filas en cada rerun)
+    periodos = ds.periodos()
+    years = ds.opciones["anios"]
+    mods = ds.opciones["modalidades"]
+    dptos = ds.opciones["departamentos"]
+
+
+    st.subheader("🎛️ Filtros de Análisis")
+    buscador_nombres(ds)
+    modo_periodo = st.radio("Periodo", options=["Un año", "Rango de fechas"], horizontal=True, key="modo_periodo")
+    year_sel, mes_sel, periodo_sel = None, None, None
+    c1, c2, c3, c4 = st.columns(4)
+    if modo_periodo == "Un año":
+        with c1:
+            year_sel = st.selectbox("Año", options=years, index=len(years) - 1)
+        with c4:
+            mes_sel = st.slider("Mes (rango)", min_value=1, max_value=12, value=(1, 12), step=1)
+    else:
+        with c1:
+            # Rango que puede cruzar años, p. ej. 2023-06 → 2025-03 (tramo contiguo del dataset ordenado)
+            periodo_sel = st.select_slider(
+                "Desde – hasta", options=periodos, value=(periodos[max(0, len(periodos) - 12)], periodos[-1]),
+                format_func=lambda p: f"{p[0]}-{p[1]:02d}", key="rango_periodo",
+            )
+    with c2:
+        # Valor inicial por session_state (la búsqueda de nombres también lo modifica);
+        # se descartan modalidades que ya no existen en esta versión del dataset
+        st.session_state["filtro_mods"] = [m for m in st.session_state.get("filtro_mods", mods[:3]) if m in mods]
+        mods_sel = st.multiselect("Modalidades", options=mods, key="filtro_mods")
+    with c3:
+        dpto_sel = st.selectbox("Departamento", options=["Todos"] + dptos, index=0, key="filtro_dpto")
+
+    # Control dependiente de provincia si se eligió un departamento
+    prov_sel = None
+    if dpto_sel != "Todos":
+        prov_sel = st.selectbox("Provincia", options=["Todas"] + ds.provincias(dpto_sel), index=0, key="filtro_prov")
+
+    # Controles adicionales
+    st.subheader("📋 Controles Adicionales")
+    col_extra1, col_extra2, col_extra3 = st.columns(3)
+
+    with col_extra1:
+        show_distritos = st.checkbox("Filtrar por Distrito", value=False, key="filtro_ver_distritos")
+        dist_sel = None
+        if show_distritos and dpto_sel != "Todos":
+            distritos = ds.distritos(dpto_sel, None if prov_sel == "Todas" else prov_sel)
+            dist_sel = st.selectbox("Distrito", options=["Todos"] + distritos, index=0, key="filtro_dist")
+            dist_sel = None if dist_sel == "Todos" else dist_sel
+
+    with col_extra2:
+        export_data = st.checkbox("Exportar datos filtrados", value=False)
+
+    with col_extra3:
+        show_correlation = st.checkbox("Mostrar matriz de correlación", value=False)
+        modo_aproximado = st.checkbox("⚡ Modo aproximado", value=False, key="modo_aproximado",
+                                      help="Muestra al instante una estimación con intervalos de error "
+                                           "mientras el resultado exacto se calcula en segundo plano")
+
+    filtro = dict(anio=year_sel, modalidades=mods_sel, dpto=dpto_sel, prov=prov_sel, mes_range=mes_sel,
+                  periodo=periodo_sel, dist=dist_sel)
+    # Identifica el contenido de df_f (versión del dataset + filtros) para cachés por sesión
+    clave_filtro = precalentamiento.clave_filtro(ds.version, filtro)
+    # Frecuencias de uso para el precalentamiento: cada filtro distinto una vez por sesión
+    if st.session_state.get("filtro_registrado") != clave_filtro:
+        st.session_state["filtro_registrado"] = clave_filtro
+        precalentamiento.registrar_uso(filtro)
+
+    if isinstance(ds, instantanea.Instantanea):
+        if ds.es_defecto(filtro) and not export_data and not modo_aproximado:
+            return None, export_data, clave_filtro, filtro
+        # Primer cambio de filtro: cargar el dataset completo (los widgets conservan sus valores)
+        cargar_vista_completa()
+        st.rerun()
+
+    # Aplicar filtros
     try:
-        csv_export = df_f.to_csv(index=False)
-        st.download_button(
-            label="📥 Descargar datos filtrados (CSV)",
-            data=csv_export,
-            file_name="denuncias_filtradas.csv",
-            mime="text/csv"
-        )
+        if modo_aproximado:
+            # La sinopsis (su propio hilo) se pide antes que el resultado exacto
+            aproximado.sinopsis_en_segundo_plano(ds)
+            futuro = aproximado.en_segundo_plano("filtro:" + clave_filtro, precalentamiento.resultado, ds, filtro)
+            if not futuro.done():
+                return None, export_data, clave_filtro, filtro
+            df_f = futuro.result().df
+        else:
+            # Caché compartida entre sesiones (los filtros más usados ya vienen precalentados)
+            df_f = precalentamiento.resultado(ds, filtro).df
+
+        logger.info("Filtros aplicados: %s filas resultantes", len(df_f))
     except Exception as e:
-        st.error(f"❌ Error exportando datos: {e}")
-        logger.exception(f"Error exportando: {e}")
+        st.error(f"❌ Error aplicando filtros: {e}")
+        logger.exception("Error en filtros: %s", e)
+        df_f = ds.df
+    return df_f, export_data, clave_filtro, filtro
+
+
+ETIQUETAS_FORMATO = {"csv.gz": "CSV comprimido (gzip)", "parquet": "Parquet", "csv": "CSV"}
+
+
+@st.fragment
+def panel_exportacion(df_f: pd.DataFrame, clave_filtro: str):
+    """Exportación bajo demanda: se escribe por bloques a un archivo temporal al pulsar "Preparar"."""
+    formato = st.radio("Formato", options=list(ETIQUETAS_FORMATO), format_func=ETIQUETAS_FORMATO.get,
+                       horizontal=True, key="export_formato")
+
+    # Descartar una exportación previa si cambió el filtro o el formato; la vigente se "toca" en cada
+    # render para que la limpieza de temporales abandonados no la borre
+    previa = st.session_state.get("export_archivo")
+    tamano_previa = export.tocar(previa[2]) if previa else None
+    if previa and (previa[0] != clave_filtro or previa[1] != formato or tamano_previa is None):
+        export.eliminar(previa[2])
+        st.session_state.pop("export_archivo", None)
+        previa = None
 
+    if previa is None and st.button("⚙️ Preparar exportación", key="export_preparar_btn"):
+        try:
+            with st.spinner("Generando archivo..."):
+                path = export.exportar(df_f, formato)
+            previa = st.session_state["export_archivo"] = (clave_filtro, formato, path)
+            tamano_previa = path.stat().st_size
+        except Exception as e:
+            st.error(f"❌ Error exportando datos: {e}")
+            logger.exception("Error exportando: %s", e)
 
-# Tabla principal
-st.subheader("📊 Tabla filtrada")
-st.dataframe(
-    df_f[["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"]]
-    .sort_values(["MES", "cantidad"], ascending=[True, False]),
-    use_container_width=True
-)
+    if previa:
+        extension, mime = export.FORMATOS[formato]
+        path = previa[2]
+        kb = tamano_previa / 1024
+        tamano = f"{kb / 1024:.1f} MB" if kb >= 1024 else f"{kb:.0f} KB"
+        # Contenido diferido: el archivo se lee sólo al pulsar (y se regenera si ya no existe)
+        st.download_button(
+            label=f"📥 Descargar datos filtrados · {ETIQUETAS_FORMATO[formato]} · {tamano}",
+            data=functools.partial(export.leer, path, df_f, formato),
+            file_name=f"denuncias_filtradas{extension}",
+            mime=mime,
+            key="export_descargar_btn",
+        )
 
 
-# ====== GRÁFICOS INTERACTIVOS ======
-col1, col2 = st.columns(2)
-with col1:
-    st.subheader("📈 Denuncias por modalidad")
+@st.fragment(run_every=1)
+def panel_aproximado(ds, filtro: dict, clave_filtro: str):
+    """Estimación del filtro (muestra + sketches) con intervalos del 95 %; se refresca hasta
+    que el resultado exacto está listo y entonces re-ejecuta la app para mostrarlo."""
+    if aproximado.en_segundo_plano("filtro:" + clave_filtro, precalentamiento.resultado, ds, filtro).done():
+        st.rerun()
+
+    st.subheader("⚡ Resultado aproximado")
+    sinopsis = aproximado.sinopsis_en_segundo_plano(ds)
+    if not sinopsis.done():
+        st.info("⏳ Preparando la muestra del dataset; el resultado exacto se está calculando…")
+        return
     try:
-        st.altair_chart(bar_modalidad(by_modalidad(df_f)), use_container_width=True)
+        est = sinopsis.result().estimar(**filtro)
     except Exception as e:
-        st.error(f"❌ Error en gráfico de modalidades: {e}")
-        logger.exception(f"Error gráfico modalidades: {e}")
+        st.warning(f"⚠️ Estimación no disponible ({e}); esperando el resultado exacto…")
+        logger.exception("Error en estimación aproximada: %s", e)
+        return
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("📊 Total de denuncias (aprox.)", f"{est.total:,} ± {est.error_total:,}")
+    k2.metric("🗺️ Distritos con denuncias (aprox.)",
+              "—" if est.distritos is None else f"{est.distritos:,} ± {est.error_distritos:,}")
+    k3.metric("⏱️ Estimado en", f"{est.segundos * 1000:.0f} ms")
+    st.caption(f"Intervalos del 95 % a partir de una muestra estratificada ({est.filas_muestra:,} filas en el filtro), "
+               "HyperLogLog de distritos y count-min de modalidades. Calculando el resultado exacto…")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📈 Denuncias por modalidad (aprox.)")
+        if not est.modalidades.empty:
+            st.altair_chart(viz.bar_modalidad_error(est.modalidades), use_container_width=True)
+    with col2:
+        st.subheader("📉 Tendencia mensual (aprox.)")
+        if not est.mensual.empty:
+            st.altair_chart(viz.line_trend_error(est.mensual), use_container_width=True)
+
+
+@log_time
+def seccion_tabla_y_graficos(ds, df_f: pd.DataFrame, export_data: bool, clave_filtro: str, filtro: dict):
+    """KPI filtrado, exportación, tabla principal y gráficos."""
+    # Total y agregados (cubo OLAP o filas) del mismo resultado compartido que df_f
+    resultado = precalentamiento.resultado(ds, filtro)
+
+    # Indicador simple de total filtrado
+    st.metric("📊 Total de denuncias (filtro activo)", resultado.total)
+
+    # Exportar datos filtrados si se solicita (el archivo se genera sólo al pedirlo)
+    if export_data:
+        panel_exportacion(df_f, clave_filtro)
+
 
-with col2:
-    st.subheader("📉 Tendencia mensual")
+    # Tabla principal: orden y paginación en el servidor, sólo se envía la página visible
+    st.subheader("📊 Tabla filtrada")
+    components.tabla_paginada(
+        df_f[["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"]],
+        clave_filtro,
+    )
+
+
+    graficos_principales(resultado.agregado)
+
+
+def graficos_principales(obtener):
+    """Barras por modalidad, tendencia mensual y top departamentos; `obtener(nombre)` da cada agregado."""
+    # ====== GRÁFICOS INTERACTIVOS ======
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📈 Denuncias por modalidad")
+        try:
+            st.altair_chart(viz.bar_modalidad(obtener("by_modalidad")), use_container_width=True)
+        except Exception as e:
+            st.error(f"❌ Error en gráfico de modalidades: {e}")
+            logger.exception("Error gráfico modalidades: %s", e)
+
+    with col2:
+        st.subheader("📉 Tendencia mensual")
+        try:
+            st.altair_chart(viz.line_trend(obtener("monthly_trend")), use_container_width=True)
+        except Exception as e:
+            st.error(f"❌ Error en gráfico de tendencia: {e}")
+            logger.exception("Error gráfico tendencia: %s", e)
+
+
+    st.subheader("🏆 Top 10 departamentos")
     try:
-        st.altair_chart(line_trend(monthly_trend(df_f)), use_container_width=True)
+        st.altair_chart(viz.bar_top_departamentos(obtener("top_departamentos")), use_container_width=True)
     except Exception as e:
-        st.error(f"❌ Error en gráfico de tendencia: {e}")
-        logger.exception(f"Error gráfico tendencia: {e}")
+        st.error(f"❌ Error en top departamentos: {e}")
+        logger.exception("Error top departamentos: %s", e)
+
+
+@st.fragment(run_every=0.5)
+def esperar_tarea(ranura: str):
+    """Aviso mientras la tarea de `ranura` corre en segundo plano; al terminar re-ejecuta la app."""
+    futuro = tareas.tarea(st.session_state, ranura)
+    if futuro is None or futuro.done():
+        st.rerun()
+    st.info("⏳ Calculando en segundo plano…")
+
+
+def resultado_tarea(ranura: str, clave, funcion, *args, **kwargs):
+    """(listo, resultado) de `funcion` calculada en el pool de `tareas`.
+
+    Si aún no terminó muestra un aviso y devuelve (False, None). Una clave nueva (otro
+    filtro u otros parámetros) reemplaza la tarea anterior de la ranura. Las excepciones
+    del cálculo se propagan al llamador.
+    """
+    futuro = tareas.en_ranura(st.session_state, ranura, clave, funcion, *args, **kwargs)
+    if not futuro.done():
+        esperar_tarea(ranura)
+        return False, None
+    return True, futuro.result()
+
+
+def calcular_prediccion(df_f: pd.DataFrame, months_ahead: int):
+    """Predicción y serie histórica mensual (se ejecuta en un hilo del pool)."""
+    pred_df = analysis.predict_monthly_trend(df_f, months_ahead=months_ahead)
+    if pred_df is None or pred_df.empty:
+        return pred_df, None
+    return pred_df, processing.monthly_trend(df_f)
 
 
-st.subheader("🏆 Top 10 departamentos")
-try:
-    st.altair_chart(bar_top_departamentos(top_departamentos(df_f)), use_container_width=True)
-except Exception as e:
-    st.error(f"❌ Error en top departamentos: {e}")
-    logger.exception(f"Error top departamentos: {e}")
+def mostrar_prediccion(pred_df, monthly):
+    """Tabla y gráfico de la serie mensual histórica más la predicción."""
+    if pred_df is None or pred_df.empty:
+        st.warning("⚠️ No hay datos suficientes para predicción")
+        return
+    # Combinar datos históricos + predicciones
+    monthly = monthly.assign(es_prediccion=False)  # el resultado de la tarea se reutiliza
 
+    combined = pd.concat([monthly, pred_df], ignore_index=True)
 
-# ====== ANÁLISIS AVANZADO ======
-st.divider()
-st.subheader("🔬 Análisis Avanzado")
+    st.dataframe(pred_df[["MES", "cantidad_predicha"]], use_container_width=True)
 
-tab_predict, tab_growth, tab_corr = st.tabs(["📊 Predicciones", "📈 Crecimiento", "🔗 Correlaciones"])
+    # Visualizar con Altair
+    import altair as alt
+    chart = alt.Chart(combined).mark_line(point=True).encode(
+        x=alt.X("MES:Q", title="Mes"),
+        y=alt.Y("cantidad_predicha:Q" if "cantidad_predicha" in combined.columns else "cantidad:Q", title="Denuncias"),
+        color=alt.Color("es_prediccion:N", scale=alt.Scale(domain=[False, True], range=["#1f77b4", "#ff7f0e"]), legend=alt.Legend(title="Tipo")),
+        tooltip=["MES", alt.Tooltip("cantidad_predicha:Q" if "cantidad_predicha" in combined.columns else "cantidad:Q", title="Denuncias")]
+    ).properties(height=300)
 
-with tab_predict:
+    st.altair_chart(chart, use_container_width=True)
+
+
+@st.fragment
+@log_time
+def analisis_prediccion(df_f: pd.DataFrame, clave_filtro: str):
+    """Pestaña de predicción (fragmento: mover su slider sólo re-ejecuta esta pestaña)."""
     st.write("**Predicción de tendencia mensual (regresión lineal simple)**")
-    months_ahead = st.slider("Meses a predecir", min_value=1, max_value=12, value=3)
-    
+    months_ahead = st.slider("Meses a predecir", min_value=1, max_value=12, value=3, key="meses_prediccion")
+
     try:
-        pred_df = predict_monthly_trend(df_f, months_ahead=months_ahead)
-        if pred_df is not None and not pred_df.empty:
-            # Combinar datos históricos + predicciones
-            monthly = monthly_trend(df_f)
-            monthly["es_prediccion"] = False
-            
-            combined = pd.concat([monthly, pred_df], ignore_index=True)
-            
-            st.dataframe(pred_df[["MES", "cantidad_predicha"]], use_container_width=True)
-            
-            # Visualizar con Altair
-            import altair as alt
-            chart = alt.Chart(combined).mark_line(point=True).encode(
-                x=alt.X("MES:Q", title="Mes"),
-                y=alt.Y("cantidad_predicha:Q" if "cantidad_predicha" in combined.columns else "cantidad:Q", title="Denuncias"),
-                color=alt.Color("es_prediccion:N", scale=alt.Scale(domain=[False, True], range=["#1f77b4", "#ff7f0e"]), legend=alt.Legend(title="Tipo")),
-                tooltip=["MES", alt.Tooltip("cantidad_predicha:Q" if "cantidad_predicha" in combined.columns else "cantidad:Q", title="Denuncias")]
-            ).properties(height=300)
-            
-            st.altair_chart(chart, use_container_width=True)
-        else:
-            st.warning("⚠️ No hay datos suficientes para predicción")
+        listo, resultado = resultado_tarea("prediccion", (clave_filtro, months_ahead),
+                                           calcular_prediccion, df_f, months_ahead)
+        if not listo:
+            return
+        mostrar_prediccion(*resultado)
     except Exception as e:
         st.warning(f"⚠️ Error en predicción: {e}")
-        logger.exception(f"Error predicción: {e}")
+        logger.exception("Error predicción: %s", e)
 
-with tab_growth:
+
+@st.fragment
+@log_time
+def analisis_crecimiento(df_f: pd.DataFrame, clave_filtro: str):
+    """Pestaña de crecimiento (fragmento)."""
     st.write("**Análisis de crecimiento (tasa de cambio)**")
-    
+
     growth_period = st.radio("Período de análisis", options=["Anual", "Mensual", "Por Modalidad"], horizontal=True)
-    
+
     try:
         period_map = {"Anual": "anio", "Mensual": "mes", "Por Modalidad": "modalidad"}
-        growth_df = calculate_growth_rate(df_f, period=period_map[growth_period])
-        
+        listo, growth_df = resultado_tarea("crecimiento", (clave_filtro, growth_period),
+                                           analysis.calculate_growth_rate, df_f, period=period_map[growth_period])
+        if not listo:
+            return
+
         if growth_df is not None and not growth_df.empty:
             st.dataframe(growth_df, use_container_width=True)
-            
+
             # Visualizar
             import altair as alt
             if growth_period == "Anual":
@@ -443,50 +842,230 @@ with tab_growth:
             else:
                 x_field, y_field = "MODALIDADES:N", "growth_rate:Q"
                 title = "Crecimiento por Modalidad (%)"
-            
+
             chart = alt.Chart(growth_df).mark_bar().encode(
                 x=alt.X(x_field, title=""),
                 y=alt.Y(y_field, title="Tasa de Crecimiento (%)"),
                 color=alt.condition(alt.datum.growth_rate > 0, alt.value("#2ca02c"), alt.value("#d62728")),
                 tooltip=["growth_rate"]
             ).properties(height=300, title=title)
-            
+
             st.altair_chart(chart, use_container_width=True)
         else:
             st.warning("⚠️ No hay datos para cálculo de crecimiento")
     except Exception as e:
         st.warning(f"⚠️ Error en crecimiento: {e}")
-        logger.exception(f"Error growth: {e}")
+        logger.exception("Error growth: %s", e)
 
-with tab_corr:
+
+@st.fragment
+@log_time
+def analisis_correlacion(df_f: pd.DataFrame, clave_filtro: str):
+    """Pestaña de correlación (fragmento)."""
     st.write("**Matriz de correlación: Modalidad vs Departamento**")
-    
+
     try:
-        corr_matrix = calculate_correlation_matrix(df_f)
+        listo, corr_matrix = resultado_tarea("correlacion", clave_filtro,
+                                             analysis.calculate_correlation_matrix, df_f)
+        if not listo:
+            return
         if corr_matrix is not None and not corr_matrix.empty:
             st.dataframe(corr_matrix.round(3), use_container_width=True)
-            
+
             # Heatmap
             import altair as alt
             corr_flat = corr_matrix.reset_index().melt(id_vars="DEPARTAMENTO")
             corr_flat.columns = ["DEPARTAMENTO", "MODALIDAD", "Correlacion"]
-            
+
             heatmap = alt.Chart(corr_flat).mark_rect().encode(
                 x=alt.X("MODALIDAD:N", title="Modalidad"),
                 y=alt.Y("DEPARTAMENTO:N", title="Departamento"),
                 color=alt.Color("Correlacion:Q", scale=alt.Scale(scheme="blues"), title="Correlación"),
                 tooltip=["DEPARTAMENTO", "MODALIDAD", "Correlacion"]
             ).properties(height=400, width=600)
-            
+
             st.altair_chart(heatmap, use_container_width=True)
         else:
             st.info("ℹ️ No hay datos para matriz de correlación")
     except Exception as e:
         st.info(f"ℹ️ No se pudo calcular correlación: {e}")
-        logger.exception(f"Error correlación: {e}")
+        logger.exception("Error correlación: %s", e)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def anomalias_cacheadas(path_str: str, version: str, ventana: int, ultimos_meses: int, z_min: float):
+    """Anomalías de todo el dataset, memoizadas por versión y parámetros."""
+    return analysis.detectar_anomalias(dataset.obtener_dataset(path_str).df, ventana=ventana,
+                                       ultimos_meses=ultimos_meses, z_min=z_min)
+
+
+@st.fragment
+@log_time
+def analisis_anomalias(ds):
+    """Pestaña de anomalías: picos por distrito × modalidad en todo el dataset (no depende del filtro)."""
+    st.write("**Picos inusuales por distrito y modalidad (mediana/MAD de los meses previos)**")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        ultimos = st.slider("Meses evaluados", min_value=1, max_value=12, value=3, key="anom_ultimos")
+    with c2:
+        ventana = st.slider("Meses de historia", min_value=6, max_value=24, value=12, key="anom_ventana")
+    with c3:
+        z_min = st.slider("Severidad mínima (z)", min_value=2.0, max_value=10.0, value=3.5, step=0.5, key="anom_z")
+    try:
+        anomalias = anomalias_cacheadas(str(ds.path), ds.version, ventana, ultimos, z_min)
+        if anomalias.empty:
+            st.info("ℹ️ No se detectaron picos con esos parámetros")
+        else:
+            st.dataframe(anomalias, use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.error(f"❌ Error detectando anomalías: {e}")
+        logger.exception("Error anomalías: %s", e)
+
+
+@st.fragment
+@log_time
+def seccion_analisis(ds, df_f: pd.DataFrame, clave_filtro: str):
+    """Pestañas de análisis avanzado: predicción, crecimiento, correlación y anomalías.
+
+    Sólo se calcula la pestaña activa (cambiar de pestaña re-ejecuta este fragmento),
+    y sus cálculos corren en el pool de `tareas` sin bloquear el resto de la página.
+    """
+    # ====== ANÁLISIS AVANZADO ======
+    st.divider()
+    st.subheader("🔬 Análisis Avanzado")
+
+    tab_predict, tab_growth, tab_corr, tab_anom = st.tabs(
+        ["📊 Predicciones", "📈 Crecimiento", "🔗 Correlaciones", "🚨 Anomalías"],
+        key="tab_analisis", on_change="rerun")
+
+    if tab_predict.open:
+        with tab_predict:
+            analisis_prediccion(df_f, clave_filtro)
+
+    if tab_growth.open:
+        with tab_growth:
+            analisis_crecimiento(df_f, clave_filtro)
+
+    if tab_corr.open:
+        with tab_corr:
+            analisis_correlacion(df_f, clave_filtro)
+
+    if tab_anom.open:
+        with tab_anom:
+            analisis_anomalias(ds)
+
+
+@log_time
+def seccion_vista_inicial(inst):
+    """Vista por defecto desde la instantánea: KPI, primera página, gráficos y predicción.
+
+    Cambiar un filtro, paginar o abrir otra pestaña de análisis carga el dataset completo.
+    """
+    st.metric("📊 Total de denuncias (filtro activo)", inst.total)
+
+    st.subheader("📊 Tabla filtrada")
+    tabla = inst.tablas.get("tabla")
+    if tabla is not None:
+        st.dataframe(tabla, use_container_width=True)
+        st.caption(f"Mostrando filas 1–{len(tabla):,} de {inst.filas:,} (vista precalculada)")
+    st.button("📂 Cargar datos completos (ordenar, paginar, exportar)", key="cargar_completo_btn",
+              on_click=cargar_vista_completa)
+
+    graficos_principales(lambda nombre: inst.tablas.get(nombre, pd.DataFrame()))
+
+    st.divider()
+    st.subheader("🔬 Análisis Avanzado")
+    tab_predict, tab_growth, tab_corr, tab_anom = st.tabs(
+        ["📊 Predicciones", "📈 Crecimiento", "🔗 Correlaciones", "🚨 Anomalías"],
+        key="tab_analisis", on_change="rerun")
+    if not tab_predict.open:
+        # Las demás pestañas se calculan sobre las filas
+        cargar_vista_completa()
+        st.rerun()
+    with tab_predict:
+        st.write("**Predicción de tendencia mensual (regresión lineal simple)**")
+        meses = st.slider("Meses a predecir", min_value=1, max_value=12, value=instantanea.MESES_PREDICCION,
+                          key="meses_prediccion")
+        if meses != instantanea.MESES_PREDICCION:
+            cargar_vista_completa()
+            st.rerun()
+        mostrar_prediccion(inst.tablas.get("prediccion"), inst.tablas.get("monthly_trend", pd.DataFrame()))
+
+
+def admin_habilitado() -> bool:
+    """El panel de métricas se activa con SIDPOL_ADMIN=1 o con `?admin=1` en la URL."""
+    if os.environ.get("SIDPOL_ADMIN") == "1":
+        return True
+    try:
+        return st.query_params.get("admin") == "1"
+    except Exception:
+        return False
+
+
+def seccion_admin_metricas():
+    """Panel opcional con las métricas en vivo del proceso (latencias por función/sección)."""
+    with st.sidebar.expander("📈 Métricas (admin)", expanded=False):
+        snap = registry.snapshot()
+        if not snap:
+            st.caption("Aún no hay métricas registradas.")
+            return
+        tabla = pd.DataFrame.from_dict(snap, orient="index")[
+            ["count", "errors", "mean_s", "p50_s", "p95_s", "p99_s", "max_s"]
+        ].sort_values("p95_s", ascending=False)
+        st.dataframe(tabla, use_container_width=True)
+        st.download_button(
+            "⬇️ Prometheus (.prom)", data=registry.to_prometheus(),
+            file_name="metrics.prom", mime="text/plain", key="metrics_prom_btn"
+        )
+        st.download_button(
+            "⬇️ JSON", data=registry.to_json(),
+            file_name="metrics.json", mime="application/json", key="metrics_json_btn"
+        )
+        if st.button("💾 Exportar a logs/", key="metrics_export_btn"):
+            prom_path, json_path = registry.export(LOG_DIR)
+            st.success(f"✓ Métricas exportadas: {prom_path.name}, {json_path.name}")
+        if st.button("♻️ Reiniciar métricas", key="metrics_reset_btn"):
+            registry.reset()
+            st.rerun()
+
+
+# ====== FLUJO PRINCIPAL ======
+# Perfilado opcional del rerun completo (SIDPOL_PROFILE=rerun o ?profile=1 con admin)
+objetivo_url = consumir_perfil_url()
+if objetivo_url == "ingest":
+    st.session_state["perfil_ingest"] = True
+    st.toast("🧪 Se perfilará la próxima carga a BD")
+perfilar_rerun = objetivo_url == "rerun" or "rerun" in objetivos_activos()
+
+inicio_rerun = time.perf_counter()
+with perfil_opcional("rerun", id_sesion(), perfilar_rerun):
+    seccion_login()
+    seccion_descarga()
+    seccion_gestion_bd()
+    seccion_consultas_sql()
+    seccion_tablas()
+
+    ds = seccion_datos()
+    df_f, export_data, clave_filtro, filtro = seccion_filtros(ds)
+    if isinstance(ds, instantanea.Instantanea):
+        seccion_vista_inicial(ds)
+    elif df_f is None:
+        # Modo aproximado: estimación inmediata hasta que termine el cálculo exacto
+        panel_aproximado(ds, filtro, clave_filtro)
+    else:
+        seccion_tabla_y_graficos(ds, df_f, export_data, clave_filtro, filtro)
+        seccion_analisis(ds, df_f, clave_filtro)
+
+    st.divider()
 
+    # Nota final de citación
+    st.caption("📚 Datos 2018–2025, cortes mensuales; procedencia y variables según diccionario y metadatos de SIDPOL/SIDPPOL – MININTER.")
 
-st.divider()
+# Latencia del rerun completo (los reruns de fragmentos se miden en su propia sección)
+duracion_rerun = time.perf_counter() - inicio_rerun
+registry.observe("rerun_app", duracion_rerun)
+logger.info("Rerun completo en %.3fs", duracion_rerun, extra=FRECUENTE)
+st.caption(f"⏱️ Rerun completo: {duracion_rerun * 1000:.0f} ms")
 
-# Nota final de citación
-st.caption("📚 Datos 2018–2025, cortes mensuales; procedencia y variables según diccionario y metadatos de SIDPOL/SIDPPOL – MININTER.")
+if admin_habilitado():
+    seccion_admin_metricas()
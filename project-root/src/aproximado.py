@@ -0,0 +1,475 @@
+"""
+Consultas aproximadas sobre el dataset: muestra estratificada + sketches fusionables.
+
+Por cada versión del dataset se guarda en data/approx/ una sinopsis con:
+
+- una muestra estratificada por (año, mes, departamento) con su peso (N_h / n_h):
+  totales y tendencia mensual con intervalo de confianza del 95 %;
+- un HyperLogLog de distritos por celda (año, mes, departamento, modalidad):
+  distritos distintos de cualquier filtro fusionando (máximo) los registros;
+- un count-min de modalidades por estrato: modalidades más frecuentes con una
+  cota de error ε·N, fusionando (suma) las tablas de los estratos del filtro.
+
+Las respuestas salen en milisegundos; el resultado exacto se calcula aparte en
+un hilo (`en_segundo_plano`) y reemplaza a la aproximación cuando está listo.
+La sinopsis se prepara en su propio hilo (`sinopsis_en_segundo_plano`), así la
+estimación nunca espera detrás de los cálculos exactos.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import log_time, logger
+from exceptions import ProcessingError
+
+APPROX_DIR = Path(__file__).resolve().parents[1] / "data" / "approx"
+
+# Muestra: fracción por estrato, con un mínimo de filas (o el estrato completo si es menor)
+FRACCION_MUESTRA = 0.02
+MIN_ESTRATO = 30
+SEMILLA = 20180101
+
+# HyperLogLog con 2^p registros: error relativo típico 1.04 / sqrt(2^p) (≈ 6.5 % con p = 8)
+HLL_P = 8
+
+# Count-min: ε = e / ancho sobre el total, con probabilidad 1 - e^(-profundidad)
+CM_ANCHO = 128
+CM_PROFUNDIDAD = 4
+
+# Intervalos de confianza del 95 %
+Z_95 = 1.96
+
+COLUMNAS = ("AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES")
+
+
+def _hash64(valores, semilla: int = 0) -> np.ndarray:
+    """Hash estable de 64 bits de cada valor (como texto), independiente del proceso."""
+    clave = f"sidpol{semilla:010d}"
+    return pd.util.hash_array(np.asarray([str(v) for v in valores], dtype=object), hash_key=clave)
+
+
+def _largo_bits(x: np.ndarray) -> np.ndarray:
+    """Número de bits significativos de cada entero sin signo (exacto, sin pasar por float)."""
+    x = x.astype(np.uint64)
+    n = np.zeros(len(x), dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        alto = x >= np.uint64(1 << s)
+        n[alto] += s
+        x[alto] >>= np.uint64(s)
+    return n + (x > 0)
+
+
+# --- Sketches ---
+
+@dataclass
+class HyperLogLog:
+    """Registros de un HyperLogLog; dos sketches se fusionan con el máximo registro a registro."""
+
+    registros: np.ndarray
+
+    @classmethod
+    def posiciones(cls, hashes: np.ndarray, p: int = HLL_P) -> Tuple[np.ndarray, np.ndarray]:
+        """(registro, rango) de cada hash: los p bits altos eligen el registro."""
+        registro = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        resto = hashes & np.uint64((1 << (64 - p)) - 1)
+        rango = (64 - p) - _largo_bits(resto) + 1
+        return registro, rango.astype(np.uint8)
+
+    def fusionar(self, otro: "HyperLogLog") -> "HyperLogLog":
+        return HyperLogLog(np.maximum(self.registros, otro.registros))
+
+    def estimar(self) -> float:
+        m = len(self.registros)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        e = alfa * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        vacios = int(np.count_nonzero(self.registros == 0))
+        if e <= 2.5 * m and vacios:
+            # Rango bajo: conteo lineal
+            e = m * np.log(m / vacios)
+        return float(e)
+
+    def error(self) -> float:
+        """Semiamplitud del intervalo del 95 % de `estimar()`."""
+        return Z_95 * 1.04 / np.sqrt(len(self.registros)) * self.estimar()
+
+
+@dataclass
+class CountMin:
+    """Tabla count-min (profundidad × ancho) con su total; se fusiona sumando tablas."""
+
+    tabla: np.ndarray
+    total: int
+
+    @staticmethod
+    def cubetas(valores, profundidad: int = CM_PROFUNDIDAD, ancho: int = CM_ANCHO) -> np.ndarray:
+        """Cubeta de cada valor en cada fila de la tabla → (profundidad, len(valores))."""
+        return np.stack([(_hash64(valores, semilla=j + 1) % np.uint64(ancho)).astype(np.int64)
+                         for j in range(profundidad)])
+
+    def fusionar(self, otro: "CountMin") -> "CountMin":
+        return CountMin(self.tabla + otro.tabla, self.total + otro.total)
+
+    def estimar(self, valores) -> np.ndarray:
+        """Cota superior de la suma de cada valor (nunca subestima)."""
+        cubetas = self.cubetas(valores, *self.tabla.shape)
+        return self.tabla[np.arange(self.tabla.shape[0])[:, None], cubetas].min(axis=0)
+
+    def error(self) -> float:
+        """Sobreestimación máxima ε·N con probabilidad 1 - e^(-profundidad)."""
+        return np.e / self.tabla.shape[1] * self.total
+
+
+# --- Sinopsis ---
+
+@dataclass(frozen=True)
+class Estimacion:
+    """Resultado aproximado de un filtro; los errores son semiamplitudes al 95 %."""
+
+    total: int
+    error_total: int
+    distritos: Optional[int]
+    error_distritos: Optional[int]
+    modalidades: pd.DataFrame = field(repr=False)
+    mensual: pd.DataFrame = field(repr=False)
+    filas_muestra: int
+    segundos: float
+
+
+def _codigos(serie: pd.Series) -> Tuple[np.ndarray, list]:
+    """Códigos 0..k-1 por valor (ordenados) y -1 para los nulos."""
+    codigos, uniques = pd.factorize(serie, sort=True)
+    return codigos.astype(np.int32), [v.item() if hasattr(v, "item") else v for v in uniques]
+
+
+@dataclass(frozen=True)
+class Sinopsis:
+    """Muestra estratificada, HyperLogLog y count-min de una versión del dataset."""
+
+    version: str
+    etiquetas: Dict[str, list]
+    arreglos: Dict[str, np.ndarray] = field(repr=False)
+
+    def _codigo(self, columna: str, valor) -> int:
+        try:
+            return self.etiquetas[columna].index(valor)
+        except ValueError:
+            return -2  # no existe: no coincide con ninguna fila (ni con los nulos, -1)
+
+    def _mascara_estratos(self, anio, dpto, mes_range, periodo) -> np.ndarray:
+        """Estratos (año, mes, departamento) que cumplen la parte temporal y geográfica del filtro."""
+        a = self.arreglos
+        anios = np.array(self.etiquetas["AÑO"], dtype=np.int64)[a["estrato_anio"]]
+        meses = np.array(self.etiquetas["MES"], dtype=np.int64)[a["estrato_mes"]]
+        mascara = (a["estrato_anio"] >= 0) & (a["estrato_mes"] >= 0)
+        if anio is not None:
+            mascara &= anios == int(anio)
+        if mes_range is not None:
+            mascara &= (meses >= mes_range[0]) & (meses <= mes_range[1])
+        if periodo is not None:
+            (a0, m0), (a1, m1) = periodo
+            clave = anios * 12 + meses - 1
+            mascara &= (clave >= a0 * 12 + m0 - 1) & (clave <= a1 * 12 + m1 - 1)
+        elif anio is None and mes_range is None:
+            # Sin filtro temporal también cuentan las filas sin año/mes
+            mascara[:] = True
+        if dpto and dpto != "Todos":
+            mascara &= a["estrato_dpto"] == self._codigo("DEPARTAMENTO", dpto)
+        return mascara
+
+    def _codigos_modalidades(self, modalidades) -> Optional[np.ndarray]:
+        if not modalidades:
+            return None
+        return np.array([self._codigo("MODALIDADES", m) for m in modalidades], dtype=np.int32)
+
+    @log_time
+    def estimar(self, anio=None, modalidades=None, dpto=None, prov=None, mes_range=None,
+                periodo=None, dist=None) -> Estimacion:
+        """Estima total, tendencia mensual, distritos distintos y modalidades de un filtro.
+
+        Acepta los mismos argumentos que `DatasetCompartido.filtrar` más el distrito.
+        Con provincia o distrito los distritos distintos no se estiman (el HyperLogLog
+        es por departamento) y las modalidades salen de la muestra en lugar del count-min.
+        """
+        inicio = time.perf_counter()
+        a = self.arreglos
+        prov = None if prov in (None, "Todas") else prov
+        estratos = self._mascara_estratos(anio, dpto, mes_range, periodo)
+        mods = self._codigos_modalidades(modalidades)
+
+        # Filas de la muestra dentro del filtro (estimación por dominio)
+        en_filtro = estratos[a["m_estrato"]]
+        if mods is not None:
+            en_filtro &= np.isin(a["m_modalidad"], mods)
+        if prov:
+            en_filtro &= a["m_provincia"] == self._codigo("PROVINCIA", prov)
+        if dist:
+            en_filtro &= a["m_distrito"] == self._codigo("DISTRITO", dist)
+        y = np.where(en_filtro, a["m_cantidad"], 0).astype(np.float64)
+
+        t_h, v_h = self._estimador(y)
+        total = float(t_h.sum())
+        error_total = Z_95 * np.sqrt(v_h.sum())
+
+        # Tendencia mensual: los estratos están dentro de un mes
+        mes_estrato = a["estrato_mes"]
+        con_datos = estratos & (mes_estrato >= 0) & (t_h > 0)
+        meses = np.array(self.etiquetas["MES"], dtype=np.int64)
+        n_meses = len(meses)
+        suma_mes = np.bincount(mes_estrato[con_datos], weights=t_h[con_datos], minlength=n_meses)
+        var_mes = np.bincount(mes_estrato[con_datos], weights=v_h[con_datos], minlength=n_meses)
+        presentes = np.flatnonzero(suma_mes > 0)
+        mensual = pd.DataFrame({
+            "MES": meses[presentes],
+            "cantidad": np.round(suma_mes[presentes]).astype(np.int64),
+            "error": np.round(Z_95 * np.sqrt(var_mes[presentes])).astype(np.int64),
+        })
+
+        if prov or dist:
+            distritos = error_distritos = None
+            modalidades_df = self._modalidades_muestra(y, en_filtro)
+        else:
+            hll = self._hll(estratos, mods)
+            distritos, error_distritos = round(hll.estimar()), round(hll.error())
+            modalidades_df = self._modalidades_cm(estratos, mods)
+
+        return Estimacion(
+            total=round(total), error_total=round(error_total),
+            distritos=distritos, error_distritos=error_distritos,
+            modalidades=modalidades_df, mensual=mensual,
+            filas_muestra=int(np.count_nonzero(en_filtro)),
+            segundos=time.perf_counter() - inicio,
+        )
+
+    def _estimador(self, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Total estimado y varianza por estrato de la variable `y` (una entrada por fila de la muestra)."""
+        a = self.arreglos
+        n_estratos = len(a["N"])
+        N = a["N"].astype(np.float64)
+        n = a["n"].astype(np.float64)
+        suma = np.bincount(a["m_estrato"], weights=y, minlength=n_estratos)
+        suma2 = np.bincount(a["m_estrato"], weights=y * y, minlength=n_estratos)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            media = np.where(n > 0, suma / n, 0.0)
+            s2 = np.where(n > 1, (suma2 - n * media * media) / (n - 1), 0.0)
+            var = np.where(n > 0, N * N * (1 - n / N) * s2 / n, 0.0)
+        return N * media, np.maximum(var, 0.0)
+
+    def _hll(self, estratos: np.ndarray, mods: Optional[np.ndarray]) -> HyperLogLog:
+        a = self.arreglos
+        # Celdas (año, mes, departamento, modalidad) cuyo estrato está en el filtro
+        celdas = estratos[a["hll_estrato"]]
+        if mods is not None:
+            celdas &= np.isin(a["hll_modalidad"], mods)
+        registros = a["hll_registros"][celdas]
+        if not len(registros):
+            return HyperLogLog(np.zeros(1 << HLL_P, dtype=np.uint8))
+        return HyperLogLog(registros.max(axis=0))
+
+    def _modalidades_cm(self, estratos: np.ndarray, mods: Optional[np.ndarray]) -> pd.DataFrame:
+        a = self.arreglos
+        cm = CountMin(a["cm_tablas"][estratos].sum(axis=0), int(a["total"][estratos].sum()))
+        candidatos = self.etiquetas["MODALIDADES"] if mods is None else \
+            [self.etiquetas["MODALIDADES"][c] for c in mods if c >= 0]
+        if not candidatos or cm.total == 0:
+            return pd.DataFrame(columns=["MODALIDADES", "cantidad", "error"])
+        out = pd.DataFrame({"MODALIDADES": candidatos, "cantidad": cm.estimar(candidatos).astype(np.int64)})
+        out["error"] = round(cm.error())
+        return out[out["cantidad"] > 0].sort_values("cantidad", ascending=False).reset_index(drop=True)
+
+    def _modalidades_muestra(self, y: np.ndarray, en_filtro: np.ndarray) -> pd.DataFrame:
+        a = self.arreglos
+        filas = []
+        for codigo in np.unique(a["m_modalidad"][en_filtro]):
+            if codigo < 0:
+                continue
+            t_h, v_h = self._estimador(np.where(a["m_modalidad"] == codigo, y, 0.0))
+            filas.append((self.etiquetas["MODALIDADES"][codigo], round(t_h.sum()), round(Z_95 * np.sqrt(v_h.sum()))))
+        out = pd.DataFrame(filas, columns=["MODALIDADES", "cantidad", "error"])
+        return out.sort_values("cantidad", ascending=False).reset_index(drop=True)
+
+
+def _rutas(version: str, directorio: Path) -> Tuple[Path, Path]:
+    nombre = "sinopsis_" + hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+    return Path(directorio) / f"{nombre}.npz", Path(directorio) / f"{nombre}.json"
+
+
+@log_time
+def construir_sinopsis(df: pd.DataFrame, version: str, directorio: Path = APPROX_DIR,
+                       fraccion: float = FRACCION_MUESTRA, minimo: int = MIN_ESTRATO) -> Sinopsis:
+    """Muestrea `df` (limpio) por estrato, construye los sketches y los guarda en `directorio`."""
+    try:
+        codigos, etiquetas = {}, {}
+        for col in COLUMNAS:
+            codigos[col], etiquetas[col] = _codigos(df[col])
+        cantidad = df["cantidad"].to_numpy(dtype=np.int64)
+
+        # Estratos (año, mes, departamento); los nulos (-1) forman su propio estrato
+        dims = tuple(len(etiquetas[c]) + 1 for c in ("AÑO", "MES", "DEPARTAMENTO"))
+        combinado = np.ravel_multi_index(tuple(codigos[c] + 1 for c in ("AÑO", "MES", "DEPARTAMENTO")), dims)
+        unicos, estrato = np.unique(combinado, return_inverse=True)
+        e_anio, e_mes, e_dpto = (x - 1 for x in np.unravel_index(unicos, dims))
+        n_estratos = len(unicos)
+        N = np.bincount(estrato, minlength=n_estratos)
+        total = np.bincount(estrato, weights=cantidad, minlength=n_estratos).round().astype(np.int64)
+
+        # Muestra: las primeras k_h filas de cada estrato en orden aleatorio
+        k = np.minimum(N, np.maximum(minimo, np.ceil(fraccion * N).astype(np.int64)))
+        orden = np.lexsort((np.random.default_rng(SEMILLA).random(len(df)), estrato))
+        inicio_estrato = np.concatenate(([0], np.cumsum(N)[:-1]))
+        rango = np.arange(len(df)) - inicio_estrato[estrato[orden]]
+        elegidas = np.sort(orden[rango < k[estrato[orden]]])
+
+        # HyperLogLog de distritos por celda (estrato, modalidad)
+        hashes_dist = _hash64(etiquetas["DISTRITO"])
+        con_distrito = codigos["DISTRITO"] >= 0
+        registro, rango_hll = HyperLogLog.posiciones(hashes_dist[codigos["DISTRITO"][con_distrito]])
+        n_mods = len(etiquetas["MODALIDADES"]) + 1
+        celda_fila = estrato[con_distrito] * n_mods + (codigos["MODALIDADES"][con_distrito] + 1)
+        celdas, celda = np.unique(celda_fila, return_inverse=True)
+        registros = np.zeros((len(celdas), 1 << HLL_P), dtype=np.uint8)
+        # Basta una fila por par (celda, distrito): registro y rango dependen sólo del distrito
+        _, pares = np.unique(celda * len(etiquetas["DISTRITO"]) + codigos["DISTRITO"][con_distrito],
+                             return_index=True)
+        np.maximum.at(registros, (celda[pares], registro[pares]), rango_hll[pares])
+
+        # Count-min de modalidades por estrato (pesado por cantidad)
+        cubetas = CountMin.cubetas(etiquetas["MODALIDADES"])
+        con_mod = codigos["MODALIDADES"] >= 0
+        cm = np.zeros((n_estratos, CM_PROFUNDIDAD, CM_ANCHO), dtype=np.int64)
+        for j in range(CM_PROFUNDIDAD):
+            plano = (estrato[con_mod] * CM_PROFUNDIDAD + j) * CM_ANCHO + cubetas[j][codigos["MODALIDADES"][con_mod]]
+            cm.reshape(-1)[:] += np.bincount(plano, weights=cantidad[con_mod], minlength=cm.size).round().astype(np.int64)
+
+        arreglos = {
+            "estrato_anio": e_anio.astype(np.int32), "estrato_mes": e_mes.astype(np.int32),
+            "estrato_dpto": e_dpto.astype(np.int32),
+            "N": N.astype(np.int64), "n": k.astype(np.int64), "total": total,
+            "m_estrato": estrato[elegidas].astype(np.int32),
+            "m_provincia": codigos["PROVINCIA"][elegidas], "m_distrito": codigos["DISTRITO"][elegidas],
+            "m_modalidad": codigos["MODALIDADES"][elegidas], "m_cantidad": cantidad[elegidas],
+            "hll_estrato": (celdas // n_mods).astype(np.int32),
+            "hll_modalidad": (celdas % n_mods - 1).astype(np.int32),
+            "hll_registros": registros,
+            "cm_tablas": cm,
+        }
+    except Exception as e:
+        logger.exception("Error construyendo la sinopsis aproximada: %s", e)
+        raise ProcessingError(f"No se pudo construir la sinopsis: {e}")
+
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    path_npz, path_json = _rutas(version, directorio)
+    tmp = path_npz.with_name(path_npz.stem + ".tmp.npz")
+    np.savez(tmp, **arreglos)
+    tmp.replace(path_npz)
+    path_json.write_text(json.dumps({"version": version, "etiquetas": etiquetas}, ensure_ascii=False),
+                         encoding="utf-8")
+    for viejo in directorio.glob("sinopsis_*"):
+        if viejo not in (path_npz, path_json):
+            viejo.unlink(missing_ok=True)
+
+    logger.info("Sinopsis aproximada: %s estratos, muestra de %s filas (%.1f %%), %s celdas HLL",
+                n_estratos, len(elegidas), 100 * len(elegidas) / max(len(df), 1), len(celdas))
+    return Sinopsis(version=version, etiquetas=etiquetas, arreglos=arreglos)
+
+
+def abrir_sinopsis(version: str, directorio: Path = APPROX_DIR) -> Optional[Sinopsis]:
+    """Sinopsis guardada de `version`, o None si no existe."""
+    path_npz, path_json = _rutas(version, directorio)
+    if not (path_npz.exists() and path_json.exists()):
+        return None
+    try:
+        meta = json.loads(path_json.read_text(encoding="utf-8"))
+        with np.load(path_npz) as datos:
+            arreglos = {k: datos[k] for k in datos.files}
+    except (OSError, ValueError) as e:
+        logger.warning("Sinopsis guardada ilegible (%s); se reconstruirá", e)
+        return None
+    return Sinopsis(version=meta["version"], etiquetas=meta["etiquetas"], arreglos=arreglos)
+
+
+# Sinopsis vigente por versión del dataset (una por proceso)
+_sinopsis: Dict[str, Sinopsis] = {}
+_lock = threading.Lock()
+# Un lock por versión: sólo un hilo construye cada sinopsis, sin bloquear a las demás versiones
+_locks_construccion: Dict[str, threading.Lock] = {}
+
+
+def obtener_sinopsis(ds) -> Sinopsis:
+    """Sinopsis del dataset compartido `ds`: en memoria, en disco o recién construida."""
+    sinopsis = _sinopsis.get(ds.version)
+    if sinopsis is not None:
+        return sinopsis
+    with _lock:
+        lock_version = _locks_construccion.setdefault(ds.version, threading.Lock())
+    with lock_version:
+        sinopsis = _sinopsis.get(ds.version)
+        if sinopsis is None:
+            sinopsis = abrir_sinopsis(ds.version) or construir_sinopsis(ds.df, ds.version)
+            with _lock:
+                _sinopsis.clear()
+                _sinopsis[ds.version] = sinopsis
+                for version in list(_locks_construccion):
+                    if version != ds.version and not _locks_construccion[version].locked():
+                        del _locks_construccion[version]
+    return sinopsis
+
+
+# --- Resultados exactos en segundo plano ---
+
+MAX_TAREAS = 16
+
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sidpol-exacto")
+_tareas: "OrderedDict[str, Future]" = OrderedDict()
+_lock_tareas = threading.Lock()
+
+# La sinopsis va en su propio hilo: no comparte cola con los resultados exactos
+_ejecutor_sinopsis = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sidpol-sinopsis")
+_tareas_sinopsis: Dict[str, Future] = {}
+
+
+def en_segundo_plano(clave: str, funcion, *args, **kwargs) -> Future:
+    """Calcula `funcion(*args, **kwargs)` en un hilo; la misma `clave` devuelve la misma tarea.
+
+    Las sesiones que piden el mismo resultado comparten la tarea, y las últimas
+    MAX_TAREAS quedan disponibles (terminadas o no) para los reruns siguientes.
+    """
+    with _lock_tareas:
+        futuro = _tareas.get(clave)
+        if futuro is None:
+            futuro = _ejecutor.submit(funcion, *args, **kwargs)
+            _tareas[clave] = futuro
+            while len(_tareas) > MAX_TAREAS:
+                _tareas.popitem(last=False)
+        else:
+            _tareas.move_to_end(clave)
+        return futuro
+
+
+def sinopsis_en_segundo_plano(ds) -> Future:
+    """Prepara la sinopsis de `ds` en el hilo de sinopsis; la misma versión devuelve la misma tarea.
+
+    Una sinopsis ya en memoria se devuelve como tarea terminada, sin pasar por el hilo.
+    """
+    with _lock_tareas:
+        futuro = _tareas_sinopsis.get(ds.version)
+        if futuro is None or (futuro.done() and futuro.exception() is not None):
+            sinopsis = _sinopsis.get(ds.version)
+            if sinopsis is not None:
+                futuro = Future()
+                futuro.set_result(sinopsis)
+            else:
+                futuro = _ejecutor_sinopsis.submit(obtener_sinopsis, ds)
+            _tareas_sinopsis.clear()
+            _tareas_sinopsis[ds.version] = futuro
+        return futuro
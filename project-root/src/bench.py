@@ -0,0 +1,145 @@
+"""
+Benchmark de arranque en frío de la aplicación SIDPOL.
+Mide, cada vez en un proceso Python nuevo, el tiempo de importación de los
+módulos de src/ y el tiempo hasta el primer render completo de app.py
+(con AppTest de Streamlit), y lo compara con la medición anterior.
+
+Uso:
+    python src/bench.py [--repeticiones 3] [--salida logs/bench_startup.json] [--umbral 20]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+APP_PATH = SRC_DIR / "app.py"
+SALIDA_DEFECTO = SRC_DIR.parent / "logs" / "bench_startup.json"
+
+MODULOS = ("processing", "database", "analysis", "viz", "download_data")
+
+_SCRIPT_IMPORT = """
+import sys, time
+sys.path.insert(0, {src!r})
+t = time.perf_counter()
+import {modulo}
+print(time.perf_counter() - t)
+"""
+
+_SCRIPT_RENDER = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout={timeout})
+at.run()
+t2 = time.perf_counter()
+from metrics import registry
+secciones = {{k: v["sum_s"] for k, v in registry.snapshot().items() if k.startswith("seccion_")}}
+pesados = [m for m in ("pandas", "sklearn", "altair", "requests") if m in sys.modules]
+print(json.dumps({{
+    "import_streamlit_s": t1 - t0,
+    "primer_render_s": t2 - t1,
+    "excepciones": len(at.exception),
+    "secciones_s": secciones,
+    "modulos_pesados_cargados": pesados,
+}}))
+"""
+
+
+def _ejecutar(script: str, timeout: float) -> str:
+    resultado = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=str(SRC_DIR), capture_output=True, text=True, timeout=timeout,
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr.strip().splitlines()[-1] if resultado.stderr else "error desconocido")
+    return resultado.stdout.strip().splitlines()[-1]
+
+
+def medir_importaciones(modulos=MODULOS, repeticiones: int = 3, timeout: float = 120) -> dict:
+    """Mediana (s) del tiempo de `import <modulo>` en un intérprete nuevo, por módulo."""
+    tiempos = {}
+    for modulo in modulos:
+        muestras = [
+            float(_ejecutar(_SCRIPT_IMPORT.format(src=str(SRC_DIR), modulo=modulo), timeout))
+            for _ in range(repeticiones)
+        ]
+        tiempos[modulo] = round(statistics.median(muestras), 4)
+    return tiempos
+
+
+def medir_primer_render(repeticiones: int = 3, timeout: float = 300) -> dict:
+    """Mediana del primer render completo de app.py en un proceso nuevo, con desglose por sección."""
+    corridas = [
+        json.loads(_ejecutar(_SCRIPT_RENDER.format(src=str(SRC_DIR), app=str(APP_PATH), timeout=timeout), timeout))
+        for _ in range(repeticiones)
+    ]
+    mediana = statistics.median(c["primer_render_s"] for c in corridas)
+    representativa = min(corridas, key=lambda c: abs(c["primer_render_s"] - mediana))
+    return {
+        "primer_render_s": round(mediana, 4),
+        "import_streamlit_s": round(statistics.median(c["import_streamlit_s"] for c in corridas), 4),
+        "excepciones": max(c["excepciones"] for c in corridas),
+        "secciones_s": {k: round(v, 4) for k, v in representativa["secciones_s"].items()},
+        "modulos_pesados_cargados": representativa["modulos_pesados_cargados"],
+    }
+
+
+def medir_arranque(repeticiones: int = 3) -> dict:
+    """Benchmark completo de arranque en frío (importaciones + primer render)."""
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "repeticiones": repeticiones,
+        "importacion_s": medir_importaciones(repeticiones=repeticiones),
+        "render": medir_primer_render(repeticiones=repeticiones),
+    }
+
+
+def comparar(anterior: dict, actual: dict) -> dict:
+    """Variación porcentual de cada métrica de tiempo respecto a la medición anterior."""
+    def pares():
+        for modulo, t in actual["importacion_s"].items():
+            yield f"import {modulo}", anterior.get("importacion_s", {}).get(modulo), t
+        yield "primer_render", anterior.get("render", {}).get("primer_render_s"), actual["render"]["primer_render_s"]
+
+    return {
+        nombre: round((nuevo - viejo) / viejo * 100, 1)
+        for nombre, viejo, nuevo in pares()
+        if viejo
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío de app.py")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", type=Path, default=SALIDA_DEFECTO)
+    parser.add_argument("--umbral", type=float, default=None,
+                        help="Falla (código 1) si alguna métrica empeora más de este porcentaje")
+    args = parser.parse_args(argv)
+
+    anterior = json.loads(args.salida.read_text(encoding="utf-8")) if args.salida.exists() else None
+    actual = medir_arranque(args.repeticiones)
+    if anterior:
+        actual["variacion_pct"] = comparar(anterior, actual)
+
+    args.salida.parent.mkdir(parents=True, exist_ok=True)
+    args.salida.write_text(json.dumps(actual, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(actual, ensure_ascii=False, indent=2))
+
+    if args.umbral is not None and anterior:
+        regresiones = {k: v for k, v in actual["variacion_pct"].items() if v > args.umbral}
+        if regresiones:
+            print(f"Regresión de arranque (> {args.umbral}%): {regresiones}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Búsqueda incremental de nombres: departamentos, provincias, distritos y modalidades.
+
+Dos índices con la misma normalización (mayúsculas, sin tildes ni espacios repetidos):
+
+- en memoria (`IndiceNombres`), construido desde `ds.opciones` una vez por versión
+  del dataset: prefijos por búsqueda binaria sobre las claves ordenadas y
+  subcadenas por intersección de trigramas;
+- en SQLite, la tabla FTS5 `nombres_fts` (tokenizador trigram) que llena la
+  ingesta (ver database.buscar_nombres).
+
+Un mismo distrito aparece una vez por cada (departamento, provincia) en que
+existe, así "SAN JUAN" devuelve todos los distritos con ese nombre del país.
+"""
+
+import bisect
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils import log_time
+
+# Orden de los tipos en los resultados (a igual calidad de coincidencia)
+TIPOS = ("departamento", "provincia", "distrito", "modalidad")
+LIMITE_DEFECTO = 10
+
+
+def normalizar(texto) -> str:
+    """Clave de búsqueda: mayúsculas, sin diacríticos y con espacios simples."""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.upper().split())
+
+
+def trigramas(clave: str) -> Set[str]:
+    return {clave[i:i + 3] for i in range(len(clave) - 2)}
+
+
+@dataclass(frozen=True)
+class Resultado:
+    """Un nombre encontrado con su ubicación en la jerarquía (None donde no aplica)."""
+
+    tipo: str
+    nombre: str
+    departamento: Optional[str] = None
+    provincia: Optional[str] = None
+
+    def etiqueta(self) -> str:
+        contexto = " › ".join(p for p in (self.departamento, self.provincia) if p)
+        return f"{self.nombre} ({self.tipo}{', ' + contexto if contexto else ''})"
+
+    def a_dict(self) -> dict:
+        return {"tipo": self.tipo, "nombre": self.nombre,
+                "departamento": self.departamento, "provincia": self.provincia}
+
+
+def entradas_desde_opciones(opciones: dict) -> List[Resultado]:
+    """Entradas del índice a partir de `processing.opciones_filtros`."""
+    entradas = []
+    for dpto in opciones["departamentos"]:
+        entradas.append(Resultado("departamento", dpto))
+        provincias = opciones["jerarquia"].get(dpto, {})
+        con_provincia = set()
+        for prov, distritos in provincias.items():
+            entradas.append(Resultado("provincia", prov, dpto))
+            for dist in distritos:
+                entradas.append(Resultado("distrito", dist, dpto, prov))
+                con_provincia.add(dist)
+        # Distritos de filas sin provincia
+        for dist in opciones["distritos"].get(dpto, []):
+            if dist not in con_provincia:
+                entradas.append(Resultado("distrito", dist, dpto))
+    entradas.extend(Resultado("modalidad", m) for m in opciones["modalidades"])
+    return entradas
+
+
+class IndiceNombres:
+    """Índice en memoria de prefijos (claves ordenadas) y subcadenas (trigramas)."""
+
+    def __init__(self, entradas: Iterable[Resultado]):
+        pares = sorted(((normalizar(e.nombre), TIPOS.index(e.tipo), e) for e in entradas),
+                       key=lambda p: (p[0], p[1], p[2].departamento or "", p[2].provincia or ""))
+        self._claves = [clave for clave, _, _ in pares]
+        self._entradas = [e for _, _, e in pares]
+        self._tipos = [tipo for _, tipo, _ in pares]
+        self._trigramas: Dict[str, List[int]] = {}
+        for i, clave in enumerate(self._claves):
+            for tri in trigramas(clave):
+                self._trigramas.setdefault(tri, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def _prefijo(self, q: str) -> range:
+        inicio = bisect.bisect_left(self._claves, q)
+        fin = bisect.bisect_left(self._claves, q + "\uffff", lo=inicio)
+        return range(inicio, fin)
+
+    def _subcadena(self, q: str) -> List[int]:
+        if len(q) < 3:
+            # Sin trigramas: recorrido completo con la misma regla que LIKE '%q%' en SQLite
+            # ("UA" → "SAN JUAN"); son pocos miles de claves
+            return [i for i, clave in enumerate(self._claves) if q in clave]
+        listas = sorted((self._trigramas.get(t, []) for t in trigramas(q)), key=len)
+        candidatos = set(listas[0]).intersection(*listas[1:]) if listas else set()
+        return [i for i in candidatos if q in self._claves[i]]
+
+    def buscar(self, texto: str, limite: int = LIMITE_DEFECTO, tipos: Optional[Iterable[str]] = None) -> List[Resultado]:
+        """Nombres que contienen `texto`: primero coincidencias exactas, luego prefijos y luego subcadenas."""
+        q = normalizar(texto)
+        if not q:
+            return []
+        permitidos = set(TIPOS.index(t) for t in tipos) if tipos else None
+        prefijo = self._prefijo(q)
+
+        def orden(i):
+            clave = self._claves[i]
+            calidad = 0 if clave == q else 1 if i in prefijo else 2 if (" " + q) in clave else 3
+            return calidad, self._tipos[i], clave
+
+        indices = set(prefijo).union(self._subcadena(q))
+        if permitidos is not None:
+            indices = {i for i in indices if self._tipos[i] in permitidos}
+        return [self._entradas[i] for i in sorted(indices, key=orden)[:limite]]
+
+
+# Índice del dataset compartido vigente (uno por proceso, se reemplaza al cambiar la versión)
+_indices: Dict[str, IndiceNombres] = {}
+_lock = threading.Lock()
+
+
+@log_time
+def _construir(opciones: dict) -> IndiceNombres:
+    return IndiceNombres(entradas_desde_opciones(opciones))
+
+
+def obtener_indice(ds) -> IndiceNombres:
+    """Índice de nombres del dataset compartido `ds` (se construye una vez por versión)."""
+    indice = _indices.get(ds.version)
+    if indice is not None:
+        return indice
+    with _lock:
+        indice = _indices.get(ds.version)
+        if indice is None:
+            indice = _construir(ds.opciones)
+            _indices.clear()
+            _indices[ds.version] = indice
+    return indice
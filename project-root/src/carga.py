@@ -0,0 +1,291 @@
+"""
+Prueba de carga de la aplicación SIDPOL: N sesiones concurrentes con interacciones guionizadas.
+
+Cada nivel de concurrencia se ejecuta en un proceso Python nuevo (un "servidor"):
+N hilos, cada uno con su propio AppTest de Streamlit sobre app.py, comparten el
+proceso igual que las sesiones de un servidor real (dataset compartido, cachés,
+pools de hilos). Cada sesión repite el guion:
+
+    abrir la app → cambiar el año → elegir un departamento → abrir las cuatro
+    pestañas de análisis (esperando los cálculos en segundo plano) → ejecutar SQL
+
+Por nivel se reporta la latencia de los reruns (p50/p95/p99/máx, total y por
+paso), el throughput (reruns/s), la CPU del proceso (% de un núcleo) y la
+memoria residente (inicio y pico), para dimensionar el despliegue.
+
+Con mucha concurrencia AppTest a veces devuelve un árbol vacío para una
+ejecución que terminó en `st.rerun()`; ese rerun se repite (el navegador
+mostraría la siguiente ejecución) y se cuenta aparte en "reruns_vacios".
+
+Uso:
+    python src/carga.py [--sesiones 1,2,4,8] [--iteraciones 1] [--salida logs/loadtest.json]
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+APP_PATH = SRC_DIR / "app.py"
+SALIDA_DEFECTO = SRC_DIR.parent / "logs" / "loadtest.json"
+
+NIVELES_DEFECTO = (1, 2, 4, 8)
+
+PESTANAS = ("📊 Predicciones", "📈 Crecimiento", "🔗 Correlaciones", "🚨 Anomalías")
+
+CONSULTAS_SQL = (
+    "SELECT anio, SUM(cantidad) AS total FROM denuncias GROUP BY anio",
+    "SELECT d.nombre, COUNT(*) AS filas FROM denuncias x JOIN departamentos d ON x.departamento_id = d.id "
+    "GROUP BY d.nombre ORDER BY filas DESC LIMIT 10",
+    "SELECT * FROM denuncias LIMIT 50",
+)
+
+# Espera de los cálculos en segundo plano: el navegador re-ejecuta los fragmentos con run_every
+INTERVALO_ESPERA = 0.25
+MAX_ESPERAS = 120
+
+# Muestreo de CPU y memoria del proceso
+INTERVALO_MUESTREO = 0.2
+
+_SCRIPT_NIVEL = """
+import json, sys
+sys.path.insert(0, {src!r})
+import carga
+print(json.dumps(carga.ejecutar_nivel({sesiones}, {iteraciones}, {semilla}, {timeout})))
+"""
+
+
+def _rss_mb() -> float:
+    """Memoria residente actual del proceso (MB); el pico histórico si no hay /proc (0 si tampoco hay `resource`)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource  # sólo Unix
+    except ImportError:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentil(valores, p: float) -> float:
+    """Percentil `p` (0–100) por rango más cercano."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+
+def resumen(valores) -> dict:
+    return {
+        "n": len(valores),
+        "p50_s": round(percentil(valores, 50), 4),
+        "p95_s": round(percentil(valores, 95), 4),
+        "p99_s": round(percentil(valores, 99), 4),
+        "max_s": round(max(valores), 4) if valores else 0.0,
+    }
+
+
+class Muestreo(threading.Thread):
+    """Mide la memoria residente del proceso cada INTERVALO_MUESTREO segundos."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pico_mb = self.inicio_mb = _rss_mb()
+        self._fin = threading.Event()
+
+    def run(self):
+        while not self._fin.wait(INTERVALO_MUESTREO):
+            self.pico_mb = max(self.pico_mb, _rss_mb())
+
+    def detener(self):
+        self._fin.set()
+        self.join()
+        self.pico_mb = max(self.pico_mb, _rss_mb())
+
+
+class Sesion:
+    """Una sesión de navegador simulada: un AppTest y el registro de latencias por paso."""
+
+    def __init__(self, rng: random.Random, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.rng = rng
+        self.tiempos = []  # (paso, segundos)
+        self.errores = []
+        self.vacios = 0
+
+    def _rerun(self, paso: str, accion=None):
+        inicio = time.perf_counter()
+        try:
+            (accion() if accion is not None else self.at).run()
+            if not self.at.main.children and not self.at.exception:
+                self.vacios += 1
+                self.at.run()
+        except Exception as e:
+            self.errores.append(f"{paso}: {type(e).__name__}: {e}")
+        self.tiempos.append((paso, time.perf_counter() - inicio))
+        if self.at.exception:
+            self.errores.append(f"{paso}: {self.at.exception[0].value}")
+
+    def _esperar(self, paso: str):
+        """Re-ejecuta mientras haya un cálculo en segundo plano (como los fragmentos con run_every)."""
+        for _ in range(MAX_ESPERAS):
+            if not any("Calculando" in i.value or "Preparando" in i.value for i in self.at.info):
+                return
+            time.sleep(INTERVALO_ESPERA)
+            self._rerun(f"{paso} (espera)")
+        self.errores.append(f"{paso}: el cálculo en segundo plano no terminó")
+
+    def _selectbox(self, etiqueta: str):
+        return next(s for s in self.at.selectbox if s.label == etiqueta)
+
+    def guion(self):
+        self._rerun("inicio")
+        if self.errores:
+            return
+
+        anio = self._selectbox("Año")
+        self._rerun("año", lambda: anio.set_value(self.rng.choice(anio.options[:-1] or anio.options)))
+
+        dpto = self.at.selectbox(key="filtro_dpto")
+        self._rerun("departamento", lambda: dpto.set_value(self.rng.choice(dpto.options[1:])))
+
+        for pestana in PESTANAS:
+            self.at.session_state["tab_analisis"] = pestana
+            self._rerun("pestaña")
+            self._esperar("pestaña")
+
+        editor = next(t for t in self.at.text_area if t.label.startswith("Escribe tu consulta SQL"))
+        editor.input(self.rng.choice(CONSULTAS_SQL))
+        boton = next(b for b in self.at.button if b.label == "▶️ Ejecutar")
+        self._rerun("sql", boton.click)
+
+
+def ejecutar_nivel(sesiones: int, iteraciones: int = 1, semilla: int = 0, timeout: float = 120) -> dict:
+    """Ejecuta `sesiones` sesiones concurrentes en este proceso y devuelve el reporte del nivel."""
+    importlib.import_module("streamlit.testing.v1")  # la importación no cuenta en las mediciones
+
+    muestreo = Muestreo()
+    inicio_barrera = threading.Barrier(sesiones)
+    resultados = [None] * sesiones
+
+    def trabajar(i: int):
+        rng = random.Random(semilla * 1000 + i)
+        tiempos, errores, vacios = [], [], 0
+        inicio_barrera.wait()
+        for _ in range(iteraciones):
+            sesion = None
+            try:
+                sesion = Sesion(rng, timeout)
+                sesion.guion()
+            except Exception as e:
+                errores.append(f"guion: {type(e).__name__}: {e}")
+            if sesion is not None:
+                tiempos += sesion.tiempos
+                errores += sesion.errores
+                vacios += sesion.vacios
+        resultados[i] = (tiempos, errores, vacios)
+
+    hilos = [threading.Thread(target=trabajar, args=(i,), name=f"sesion-{i}") for i in range(sesiones)]
+    muestreo.start()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    pared = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    muestreo.detener()
+
+    tiempos = [t for r in resultados for t in r[0]]
+    errores = [e for r in resultados for e in r[1]]
+    por_paso = {}
+    for paso, segundos in tiempos:
+        por_paso.setdefault(paso, []).append(segundos)
+    return {
+        "sesiones": sesiones,
+        "iteraciones": iteraciones,
+        "segundos": round(pared, 3),
+        "reruns": len(tiempos),
+        "throughput_reruns_s": round(len(tiempos) / pared, 2) if pared else 0.0,
+        "latencia": resumen([s for _, s in tiempos]),
+        "por_paso": {paso: resumen(v) for paso, v in por_paso.items()},
+        "cpu_pct": round(cpu / pared * 100, 1) if pared else 0.0,
+        "memoria_mb": {"inicio": round(muestreo.inicio_mb, 1), "pico": round(muestreo.pico_mb, 1)},
+        "reruns_vacios": sum(r[2] for r in resultados),
+        "errores": len(errores),
+        "ejemplos_error": errores[:5],
+    }
+
+
+def medir_nivel(sesiones: int, iteraciones: int = 1, semilla: int = 0, timeout: float = 120) -> dict:
+    """Un nivel de concurrencia en un proceso nuevo (memoria y cachés parten de cero en cada nivel)."""
+    script = _SCRIPT_NIVEL.format(src=str(SRC_DIR), sesiones=sesiones, iteraciones=iteraciones,
+                                  semilla=semilla, timeout=timeout)
+    limite = timeout * (len(PESTANAS) + 4) * iteraciones + 60
+    resultado = subprocess.run([sys.executable, "-c", script], cwd=str(SRC_DIR), capture_output=True,
+                               text=True, timeout=limite)
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr.strip().splitlines()[-1] if resultado.stderr else "error desconocido")
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def tabla(niveles: list) -> str:
+    """Resumen legible de los niveles (una fila por N)."""
+    filas = [f"{'N':>4} {'reruns':>7} {'rerun/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+             f"{'CPU %':>7} {'RSS pico MB':>12} {'errores':>8}"]
+    for n in niveles:
+        lat = n["latencia"]
+        filas.append(f"{n['sesiones']:>4} {n['reruns']:>7} {n['throughput_reruns_s']:>8} "
+                     f"{lat['p50_s'] * 1000:>8.0f} {lat['p95_s'] * 1000:>8.0f} {lat['p99_s'] * 1000:>8.0f} "
+                     f"{n['cpu_pct']:>7} {n['memoria_mb']['pico']:>12} {n['errores']:>8}")
+    return "\n".join(filas)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga concurrente de app.py (AppTest)")
+    parser.add_argument("--sesiones", default=",".join(map(str, NIVELES_DEFECTO)),
+                        help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--iteraciones", type=int, default=1, help="Repeticiones del guion por sesión")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="Tiempo máximo por rerun (s)")
+    parser.add_argument("--salida", type=Path, default=SALIDA_DEFECTO)
+    args = parser.parse_args(argv)
+    try:
+        niveles_n = [int(n) for n in args.sesiones.split(",") if n.strip()]
+    except ValueError:
+        parser.error("--sesiones debe ser una lista de enteros, p. ej. 1,2,4,8")
+    if not niveles_n or min(niveles_n) < 1:
+        parser.error("--sesiones debe contener enteros positivos")
+
+    niveles = []
+    for n in niveles_n:
+        print(f"Nivel N={n}…", file=sys.stderr)
+        niveles.append(medir_nivel(n, args.iteraciones, args.semilla, args.timeout))
+    reporte = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "niveles": niveles,
+    }
+
+    args.salida.parent.mkdir(parents=True, exist_ok=True)
+    args.salida.write_text(json.dumps(reporte, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(tabla(niveles), file=sys.stderr)
+    print(json.dumps(reporte, ensure_ascii=False, indent=2))
+    return 1 if any(n["errores"] for n in niveles) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+Línea de comandos para ejecutar el pipeline de SIDPOL sin navegador (cron, workers).
+
+Subcomandos:
+    download        Descarga el CSV oficial (download_data.download_csv)
+    ingest          Carga el CSV a la BD (incremental por defecto; --completa recarga todo)
+    rollback-db     Vuelve a publicar la versión anterior de la BD (repetirlo deshace el cambio)
+    build-caches    Construye el lago Parquet, el cubo OLAP, la sinopsis aproximada y la
+                    instantánea de la vista por defecto (en paralelo)
+    export          Exporta los datos filtrados a CSV, CSV.gz o Parquet
+    benchmark       Benchmark de arranque en frío (bench.py)
+    loadtest        Prueba de carga con N sesiones concurrentes (carga.py)
+    pipeline        download → (ingest ‖ build-caches)
+
+Cada ejecución escribe un reporte JSON con la duración y el resultado de cada
+etapa (por defecto logs/cli_report.json).
+
+Códigos de salida:
+    0  todas las etapas terminaron bien
+    1  falló al menos una etapa
+    2  uso incorrecto (argumentos)
+    3  no hay CSV en data/ para procesar
+
+Uso:
+    python src/cli.py pipeline --sin-descarga
+    python src/cli.py export --formato parquet --anio 2024 --dpto LIMA --salida /tmp/lima_2024.parquet
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import processing
+from metrics import registry
+from utils import logger, LOG_DIR
+from exceptions import DatabaseError
+
+EXITO, ERROR_ETAPA, ERROR_USO, SIN_DATOS = 0, 1, 2, 3
+
+REPORTE_DEFECTO = LOG_DIR / "cli_report.json"
+
+
+class SinDatosError(Exception):
+    """No hay CSV en data/ sobre el cual ejecutar la etapa."""
+
+
+def _csv(args) -> Path:
+    path = Path(args.csv) if getattr(args, "csv", None) else processing.data_path()
+    if not path.exists():
+        raise SinDatosError(f"No existe el CSV {path}; ejecuta primero 'download'")
+    return path
+
+
+# --- Etapas (cada una devuelve un resultado serializable a JSON) ---
+
+def etapa_download(args) -> dict:
+    import download_data
+
+    kwargs = {}
+    if args.url:
+        kwargs["url"] = args.url
+    if args.nombre:
+        kwargs["output_filename"] = args.nombre
+    path = download_data.download_csv(**kwargs)
+    return {"archivo": str(path), "bytes": path.stat().st_size}
+
+
+def etapa_ingest(args) -> dict:
+    import database
+
+    path = _csv(args)
+    if args.completa:
+        filas, exito = database.cargar_csv_a_bd(str(path))
+        resultado = {"modo": "completa", "filas_insertadas": filas}
+    else:
+        resultado, exito = database.cargar_csv_delta(str(path), eliminar_ausentes=not args.conservar_ausentes)
+        resultado = {"modo": "incremental", **(resultado or {})}
+    if not exito:
+        raise DatabaseError(f"La carga de {path.name} a la BD falló (ver logs/sidpol.log)")
+    return resultado
+
+
+def etapa_rollback_db(args) -> dict:
+    import database
+
+    version = database.restaurar_anterior()
+    return {"version_bd": version, "anterior": database.version_anterior()}
+
+
+def etapa_build_caches(args) -> dict:
+    import aproximado
+    import cube
+    import dataset
+    import instantanea
+    import lake
+
+    path = _csv(args)
+    ds = dataset.obtener_dataset(path)
+    # El lago (Parquet), el cubo, la sinopsis (NumPy) y la instantánea (JSON) son independientes:
+    # se escriben en paralelo
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        f_lago = ex.submit(lake.escribir_particiones, ds.df, ds.version)
+        f_cubo = ex.submit(lambda: cube.abrir_cubo(ds.version) or cube.construir_cubo(ds.df, ds.version))
+        f_sinopsis = ex.submit(lambda: aproximado.abrir_sinopsis(ds.version)
+                               or aproximado.construir_sinopsis(ds.df, ds.version))
+        f_vista = ex.submit(lambda: instantanea.abrir_instantanea(ds.version)
+                            or instantanea.construir_instantanea(ds))
+        reporte_lago, cubo_, sinopsis, vista = f_lago.result(), f_cubo.result(), f_sinopsis.result(), f_vista.result()
+    return {
+        "version": ds.version,
+        "filas": len(ds),
+        "lago": {"escritas": len(reporte_lago["escritas"]), "sin_cambios": reporte_lago["sin_cambios"],
+                 "eliminadas": len(reporte_lago["eliminadas"])},
+        "cubo": list(cubo_.datos.shape),
+        "sinopsis": {"estratos": len(sinopsis.arreglos["N"]), "filas_muestra": len(sinopsis.arreglos["m_cantidad"])},
+        "instantanea": {"total": vista.total, "filas": vista.filas},
+    }
+
+
+def etapa_export(args) -> dict:
+    import dataset
+    import export
+    import lake
+
+    csv_path = _csv(args)
+    periodo = None
+    if args.desde or args.hasta:
+        if not (args.desde and args.hasta):
+            raise ValueError("--desde y --hasta van juntos")
+        periodo = tuple(tuple(int(x) for x in p.split("-")) for p in (args.desde, args.hasta))
+    mes_range = tuple(int(x) for x in args.mes.split("-")) if args.mes else None
+    modalidades = args.modalidades.split(",") if args.modalidades else None
+    if lake.vigente(dataset.version_dataset(csv_path)):
+        # Sólo se leen del disco las particiones del año/meses/periodo pedidos
+        fuente = "lago"
+        df = lake.filtrar(args.anio, modalidades, args.dpto, args.prov, mes_range, periodo)
+    else:
+        fuente = "csv"
+        df = dataset.obtener_dataset(csv_path).filtrar(args.anio, modalidades, args.dpto, args.prov, mes_range, periodo)
+    if args.dist:
+        df = df[df["DISTRITO"] == args.dist]
+    destino = export.exportar(df, args.formato, Path(args.salida) if args.salida else None,
+                              prefijo=export.PREFIJO_CLI)
+    return {"archivo": str(destino), "filas": len(df), "bytes": destino.stat().st_size, "fuente": fuente}
+
+
+def etapa_benchmark(args) -> dict:
+    import bench
+
+    argv = ["--repeticiones", str(args.repeticiones)]
+    if args.umbral is not None:
+        argv += ["--umbral", str(args.umbral)]
+    codigo = bench.main(argv)
+    if codigo != 0:
+        raise RuntimeError("Regresión de arranque por encima del umbral")
+    return {"salida": str(bench.SALIDA_DEFECTO)}
+
+
+def etapa_loadtest(args) -> dict:
+    import carga
+
+    codigo = carga.main(["--sesiones", args.sesiones, "--iteraciones", str(args.iteraciones)])
+    if codigo != 0:
+        raise RuntimeError("La prueba de carga tuvo reruns con error")
+    return {"salida": str(carga.SALIDA_DEFECTO)}
+
+
+# --- Ejecución y reporte ---
+
+def ejecutar_etapa(nombre: str, funcion, args) -> dict:
+    """Ejecuta una etapa midiendo su duración; nunca propaga excepciones (quedan en el reporte)."""
+    inicio = time.perf_counter()
+    registro = {"etapa": nombre, "ok": True}
+    try:
+        registro["resultado"] = funcion(args)
+    except Exception as e:
+        registro.update(ok=False, error=f"{type(e).__name__}: {e}", sin_datos=isinstance(e, SinDatosError))
+        logger.exception("Etapa %s falló: %s", nombre, e)
+    registro["segundos"] = round(time.perf_counter() - inicio, 3)
+    registry.observe(f"cli_{nombre}", registro["segundos"], not registro["ok"])
+    logger.info("Etapa %s: %s en %.2fs", nombre, "ok" if registro["ok"] else "ERROR", registro["segundos"])
+    return registro
+
+
+def ejecutar_en_paralelo(etapas, args) -> list:
+    """Ejecuta etapas independientes [(nombre, función)] en hilos y devuelve sus registros en orden."""
+    with ThreadPoolExecutor(max_workers=len(etapas)) as ex:
+        futuros = [ex.submit(ejecutar_etapa, nombre, funcion, args) for nombre, funcion in etapas]
+        return [f.result() for f in futuros]
+
+
+ETAPAS = {
+    "download": etapa_download,
+    "ingest": etapa_ingest,
+    "rollback-db": etapa_rollback_db,
+    "build-caches": etapa_build_caches,
+    "export": etapa_export,
+    "benchmark": etapa_benchmark,
+    "loadtest": etapa_loadtest,
+}
+
+
+def ejecutar(args) -> list:
+    if args.comando != "pipeline":
+        return [ejecutar_etapa(args.comando, ETAPAS[args.comando], args)]
+
+    registros = []
+    if not args.sin_descarga:
+        registros.append(ejecutar_etapa("download", etapa_download, args))
+        if not registros[-1]["ok"]:
+            return registros
+    # La BD y los archivos de caché no dependen entre sí
+    registros += ejecutar_en_paralelo([("ingest", etapa_ingest), ("build-caches", etapa_build_caches)], args)
+    return registros
+
+
+def codigo_salida(registros: list) -> int:
+    if all(r["ok"] for r in registros):
+        return EXITO
+    if any(r.get("sin_datos") for r in registros):
+        return SIN_DATOS
+    return ERROR_ETAPA
+
+
+def _parser() -> argparse.ArgumentParser:
+    comun = argparse.ArgumentParser(add_help=False)
+    comun.add_argument("--reporte", type=Path, default=REPORTE_DEFECTO, help="Reporte JSON de tiempos por etapa")
+    parser = argparse.ArgumentParser(description="Pipeline de SIDPOL por línea de comandos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    comando = lambda nombre, ayuda: sub.add_parser(nombre, help=ayuda, parents=[comun])
+
+    def con_csv(p):
+        p.add_argument("--csv", help="CSV a procesar (por defecto el más reciente de data/)")
+        return p
+
+    def con_descarga(p):
+        p.add_argument("--url", help="URL del CSV (por defecto la oficial)")
+        p.add_argument("--nombre", help="Nombre del archivo en data/")
+        return p
+
+    def con_ingest(p):
+        p.add_argument("--completa", action="store_true", help="Recarga completa en lugar de incremental")
+        p.add_argument("--conservar-ausentes", action="store_true",
+                       help="Incremental: no borrar de la BD los meses que ya no están en el archivo")
+        return p
+
+    con_descarga(comando("download", "Descargar el CSV oficial"))
+    con_ingest(con_csv(comando("ingest", "Cargar el CSV a la BD")))
+    comando("rollback-db", "Restaurar la versión anterior de la BD")
+    con_csv(comando("build-caches", "Construir lago Parquet, cubo OLAP, sinopsis aproximada e instantánea"))
+
+    p_export = con_csv(comando("export", "Exportar datos filtrados"))
+    p_export.add_argument("--formato", choices=["csv", "csv.gz", "parquet"], default="csv.gz")
+    p_export.add_argument("--salida", help="Ruta de salida (por defecto un archivo temporal)")
+    p_export.add_argument("--anio", type=int)
+    p_export.add_argument("--mes", help="Rango de meses, p. ej. 3-5")
+    p_export.add_argument("--desde", help="Periodo inicial AAAA-MM")
+    p_export.add_argument("--hasta", help="Periodo final AAAA-MM")
+    p_export.add_argument("--modalidades", help="Lista separada por comas")
+    p_export.add_argument("--dpto", default="Todos")
+    p_export.add_argument("--prov")
+    p_export.add_argument("--dist")
+
+    p_bench = comando("benchmark", "Benchmark de arranque en frío")
+    p_bench.add_argument("--repeticiones", type=int, default=3)
+    p_bench.add_argument("--umbral", type=float, default=None)
+
+    p_carga = comando("loadtest", "Prueba de carga con sesiones concurrentes")
+    p_carga.add_argument("--sesiones", default="1,2,4,8", help="Niveles de concurrencia separados por comas")
+    p_carga.add_argument("--iteraciones", type=int, default=1)
+
+    p_pipe = con_ingest(con_descarga(con_csv(comando("pipeline", "download → (ingest ‖ build-caches)"))))
+    p_pipe.add_argument("--sin-descarga", action="store_true", help="Usar el CSV ya descargado")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+
+    inicio = time.strftime("%Y-%m-%dT%H:%M:%S")
+    t0 = time.perf_counter()
+    # Lo que impriman las etapas (download_data, bench, carga) va a stderr: stdout sólo lleva el reporte JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        registros = ejecutar(args)
+    codigo = codigo_salida(registros)
+    reporte = {
+        "comando": args.comando,
+        "inicio": inicio,
+        "segundos": round(time.perf_counter() - t0, 3),
+        "codigo_salida": codigo,
+        "etapas": registros,
+    }
+
+    args.reporte.parent.mkdir(parents=True, exist_ok=True)
+    args.reporte.write_text(json.dumps(reporte, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    print(json.dumps(reporte, ensure_ascii=False, indent=2, default=str))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
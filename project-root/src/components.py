@@ -0,0 +1,85 @@
+"""
+Componentes de interfaz reutilizables para la app Streamlit de SIDPOL.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from processing import permutacion_orden
+from utils import logger
+
+TAMANOS_PAGINA = (50, 100, 250, 500)
+
+# Permutaciones de orden guardadas por sesión (alternar entre órdenes ya vistos es gratis)
+MAX_PERMUTACIONES = 6
+
+ORDEN_DEFECTO = "Predeterminado (MES ↑, cantidad ↓)"
+
+
+def _permutacion(clave_datos: str, df: pd.DataFrame, columnas: tuple, ascendentes: tuple, key: str) -> np.ndarray:
+    """Permutación cacheada en la sesión por (datos filtrados, columnas, sentido).
+
+    Invertir el sentido de un orden de una sola columna reutiliza la permutación
+    ya calculada (se recorre al revés) en lugar de volver a ordenar.
+    """
+    cache = st.session_state.setdefault(f"{key}_permutaciones", OrderedDict())
+    clave = (clave_datos, columnas, ascendentes)
+    if clave in cache:
+        cache.move_to_end(clave)
+        return cache[clave]
+
+    inversa = (clave_datos, columnas, tuple(not a for a in ascendentes))
+    if len(columnas) == 1 and inversa in cache and not df[columnas[0]].hasnans:
+        perm = cache[inversa][::-1]
+    else:
+        perm = permutacion_orden(df, list(columnas), list(ascendentes))
+
+    cache[clave] = perm
+    while len(cache) > MAX_PERMUTACIONES:
+        cache.popitem(last=False)
+    return perm
+
+
+@st.fragment
+def tabla_paginada(df: pd.DataFrame, clave_datos: str, key: str = "tabla_filtrada"):
+    """Tabla con orden y paginación del lado del servidor.
+
+    Sólo se serializa al navegador la página visible (a lo sumo `max(TAMANOS_PAGINA)` filas).
+    Es un fragmento: cambiar de página u orden no re-ejecuta el resto de la app.
+
+    Args:
+        df: DataFrame a mostrar (p. ej. los datos filtrados).
+        clave_datos: identifica el contenido de `df` (versión + filtros) para cachear el orden.
+        key: prefijo de claves de widgets y de la caché en `st.session_state`.
+    """
+    total = len(df)
+    c1, c2, c3, c4 = st.columns([3, 2, 2, 2])
+    with c1:
+        orden = st.selectbox("Ordenar por", options=[ORDEN_DEFECTO] + list(df.columns), key=f"{key}_orden")
+    with c2:
+        sentido = st.radio("Sentido", options=["↑ Asc", "↓ Desc"], horizontal=True, key=f"{key}_sentido",
+                           disabled=orden == ORDEN_DEFECTO)
+    with c3:
+        tam = st.selectbox("Filas por página", options=TAMANOS_PAGINA, index=1, key=f"{key}_tam")
+    paginas = max(1, -(-total // tam))
+    with c4:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, step=1,
+                                 key=f"{key}_pagina_{hash((clave_datos, orden, sentido, tam))}")
+
+    if orden == ORDEN_DEFECTO:
+        columnas, ascendentes = ("MES", "cantidad"), (True, False)
+    else:
+        columnas, ascendentes = (orden,), (sentido == "↑ Asc",)
+
+    try:
+        perm = _permutacion(clave_datos, df, columnas, ascendentes, key)
+        inicio = (int(pagina) - 1) * tam
+        fin = min(inicio + tam, total)
+        st.dataframe(df.iloc[perm[inicio:fin]], use_container_width=True)
+        st.caption(f"Mostrando filas {inicio + 1 if total else 0:,}–{fin:,} de {total:,}")
+    except Exception as e:
+        st.error(f"❌ Error mostrando la tabla: {e}")
+        logger.exception("Error en tabla paginada: %s", e)
@@ -0,0 +1,225 @@
+"""
+Cubo OLAP denso (NumPy) con la suma de `cantidad` por año × mes × departamento × modalidad.
+Se construye una vez por versión del dataset, se guarda en data/cube/ y se abre
+con memory-map; los agregados del dashboard se responden con sumas por ejes en
+lugar de recorrer las filas. Provincia y distrito no forman parte del cubo: esos
+filtros se resuelven con los datos por fila.
+"""
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import log_time, logger
+from exceptions import ProcessingError
+
+CUBE_DIR = Path(__file__).resolve().parents[1] / "data" / "cube"
+
+EJES = ("AÑO", "MES", "DEPARTAMENTO", "MODALIDADES")
+
+# Primer índice del arreglo: 0 = suma de cantidad, 1 = número de filas (para saber
+# qué combinaciones existen, igual que un groupby, aunque sumen 0)
+SUMA, FILAS = 0, 1
+
+
+@dataclass(frozen=True)
+class CuboOLAP:
+    """Cubo (2, años, meses, departamentos, modalidades) con las etiquetas de cada eje.
+
+    Los valores nulos de departamento o modalidad ocupan la última posición de su
+    eje (etiqueta None): cuentan en los totales por mes pero no aparecen como grupo.
+    """
+
+    version: str
+    etiquetas: Dict[str, list]
+    datos: np.ndarray = field(repr=False)
+    # columna (ejes y "cantidad") → dtype en el DataFrame de origen, para devolver los mismos tipos
+    tipos: Dict[str, str] = field(repr=False)
+
+    def _indices(self, eje: str, valores) -> np.ndarray:
+        posiciones = {v: i for i, v in enumerate(self.etiquetas[eje])}
+        return np.array([posiciones[v] for v in valores if v in posiciones], dtype=np.intp)
+
+    def indices_filtro(self, anio=None, modalidades=None, dpto=None, mes_range=None) -> Dict[str, np.ndarray]:
+        """Posiciones de cada eje que cumplen el filtro (mismo criterio que `processing.filter_df`)."""
+        indices = {eje: np.arange(len(self.etiquetas[eje])) for eje in EJES}
+        if anio is not None:
+            indices["AÑO"] = self._indices("AÑO", [int(anio)])
+        if mes_range is not None:
+            indices["MES"] = self._indices("MES", [m for m in self.etiquetas["MES"]
+                                                   if m is not None and mes_range[0] <= m <= mes_range[1]])
+        if dpto and dpto != "Todos":
+            indices["DEPARTAMENTO"] = self._indices("DEPARTAMENTO", [dpto])
+        if modalidades:
+            indices["MODALIDADES"] = self._indices("MODALIDADES", modalidades)
+        return indices
+
+    # --- Agregados equivalentes a los de processing.py ---
+
+    def agregados(self, anio=None, modalidades=None, dpto=None, mes_range=None, periodo=None) -> "AgregadosCubo":
+        """Prepara los agregados del dashboard para un filtro (ver `AgregadosCubo`)."""
+        return AgregadosCubo(self, anio, modalidades, dpto, mes_range, periodo)
+
+
+class AgregadosCubo:
+    """Agregados de un filtro sobre el cubo: misma salida que by_modalidad, monthly_trend,
+    top_departamentos y heatmap_modalidad_mes de `processing` sobre las filas filtradas
+    (mismos valores y mismos dtypes que las columnas del DataFrame de origen)."""
+
+    def __init__(self, cubo: CuboOLAP, anio=None, modalidades=None, dpto=None, mes_range=None, periodo=None):
+        self.cubo = cubo
+        indices = cubo.indices_filtro(anio, modalidades, dpto, mes_range)
+        self._etiquetas = {eje: [cubo.etiquetas[eje][i] for i in indices[eje]] for eje in EJES}
+        # Sub-cubo (2, años, meses, dptos, modalidades) del filtro
+        self.sub = cubo.datos[np.ix_([SUMA, FILAS], *(indices[eje] for eje in EJES))]
+        if periodo is not None:
+            # Un rango que cruza años no es un producto de ejes: máscara sobre (año, mes)
+            anios = np.array(self._etiquetas["AÑO"], dtype=np.int64)[:, None]
+            meses = np.array([-1 if m is None else m for m in self._etiquetas["MES"]], dtype=np.int64)[None, :]
+            claves = anios * 12 + (meses - 1)
+            (a0, m0), (a1, m1) = periodo
+            mascara = (meses > 0) & (claves >= a0 * 12 + m0 - 1) & (claves <= a1 * 12 + m1 - 1)
+            self.sub = self.sub * mascara[None, :, :, None, None]
+
+    @property
+    def vacio(self) -> bool:
+        return not self.sub[FILAS].any()
+
+    def total(self) -> int:
+        return int(self.sub[SUMA].sum())
+
+    def _por(self, ejes: Tuple[str, ...], quitar_nulos: bool = True) -> pd.DataFrame:
+        posiciones = tuple(1 + EJES.index(e) for e in ejes)
+        otros = tuple(i for i in range(1, self.sub.ndim) if i not in posiciones)
+        suma, filas = self.sub.sum(axis=otros)
+        indices = np.nonzero(filas)
+        columnas = {}
+        for eje, idx in zip(ejes, indices):
+            columnas[eje] = pd.array(np.array(self._etiquetas[eje], dtype=object)[idx], dtype=self.cubo.tipos[eje])
+        out = pd.DataFrame(columnas)
+        out["cantidad"] = pd.array(suma[indices], dtype=self.cubo.tipos["cantidad"])
+        if quitar_nulos:
+            out = out.dropna(subset=list(ejes))
+        return out.reset_index(drop=True)
+
+    def _validar(self, nombre: str):
+        if self.vacio:
+            raise ProcessingError(f"Sin datos para {nombre}")
+
+    @log_time
+    def by_modalidad(self) -> pd.DataFrame:
+        self._validar("by_modalidad")
+        return self._por(("MODALIDADES",)).sort_values("cantidad", ascending=False)
+
+    @log_time
+    def monthly_trend(self) -> pd.DataFrame:
+        self._validar("monthly_trend")
+        return self._por(("MES",)).sort_values("MES")
+
+    @log_time
+    def top_departamentos(self) -> pd.DataFrame:
+        self._validar("top_departamentos")
+        return self._por(("DEPARTAMENTO",)).sort_values("cantidad", ascending=False).head(10)
+
+    @log_time
+    def heatmap_modalidad_mes(self) -> pd.DataFrame:
+        self._validar("heatmap_modalidad_mes")
+        # Orden del groupby de pandas: modalidad y luego mes
+        return self._por(("MES", "MODALIDADES"))[["MODALIDADES", "MES", "cantidad"]] \
+            .sort_values(["MODALIDADES", "MES"]).reset_index(drop=True)
+
+
+def _codigos(serie: pd.Series, numerico: bool) -> Tuple[np.ndarray, list]:
+    """Códigos 0..k-1 por valor (ordenados) y el nulo, si existe, como última etiqueta (None)."""
+    codigos, uniques = pd.factorize(serie, sort=True)
+    etiquetas = [int(u) for u in uniques] if numerico else [str(u) for u in uniques]
+    nulos = codigos < 0
+    if nulos.any():
+        codigos = np.where(nulos, len(etiquetas), codigos)
+        etiquetas.append(None)
+    return codigos, etiquetas
+
+
+def _rutas(version: str, directorio: Path) -> Tuple[Path, Path]:
+    nombre = "cubo_" + hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+    return Path(directorio) / f"{nombre}.npy", Path(directorio) / f"{nombre}.json"
+
+
+@log_time
+def construir_cubo(df: pd.DataFrame, version: str, directorio: Optional[Path] = None) -> CuboOLAP:
+    """Construye el cubo de `df` (limpio), lo guarda en `directorio` (por defecto `CUBE_DIR`) y lo
+    devuelve abierto con memory-map. Borra los cubos de otras versiones en ese directorio."""
+    directorio = Path(directorio) if directorio is not None else CUBE_DIR
+    directorio.mkdir(parents=True, exist_ok=True)
+    path_npy, path_json = _rutas(version, directorio)
+
+    codigos, etiquetas = [], {}
+    for eje in EJES:
+        c, e = _codigos(df[eje], numerico=eje in ("AÑO", "MES"))
+        codigos.append(c)
+        etiquetas[eje] = e
+    forma = tuple(len(etiquetas[e]) for e in EJES)
+    plano = np.ravel_multi_index(codigos, forma) if len(df) else np.empty(0, dtype=np.intp)
+    n = int(np.prod(forma))
+
+    tmp = path_npy.with_name(path_npy.name + ".tmp")
+    datos = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.int64, shape=(2,) + forma)
+    datos[SUMA] = np.bincount(plano, weights=df["cantidad"].to_numpy(dtype=np.float64), minlength=n) \
+        .round().astype(np.int64).reshape(forma)
+    datos[FILAS] = np.bincount(plano, minlength=n).reshape(forma)
+    datos.flush()
+    del datos
+    tmp.replace(path_npy)
+    tipos = {col: str(df[col].dtype) for col in EJES + ("cantidad",)}
+    meta = {"version": version, "etiquetas": etiquetas, "tipos": tipos}
+    path_json.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    # Borrar cubos de versiones anteriores
+    for viejo in directorio.glob("cubo_*"):
+        if viejo not in (path_npy, path_json):
+            viejo.unlink(missing_ok=True)
+
+    logger.info("Cubo OLAP construido: %s celdas (%.1f MB) para %s", n, 2 * n * 8 / 1024 / 1024, version)
+    return abrir_cubo(version, directorio)
+
+
+def abrir_cubo(version: str, directorio: Optional[Path] = None) -> Optional[CuboOLAP]:
+    """Abre (memory-map, sólo lectura) el cubo guardado de `version`, o None si no existe."""
+    path_npy, path_json = _rutas(version, directorio if directorio is not None else CUBE_DIR)
+    if not (path_npy.exists() and path_json.exists()):
+        return None
+    try:
+        meta = json.loads(path_json.read_text(encoding="utf-8"))
+        datos = np.load(path_npy, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        logger.warning("Cubo guardado ilegible (%s); se reconstruirá", e)
+        return None
+    if "tipos" not in meta:
+        # Cubo anterior al registro de tipos: se reconstruye para devolver los dtypes de processing
+        return None
+    return CuboOLAP(version=meta["version"], etiquetas=meta["etiquetas"], datos=datos, tipos=meta["tipos"])
+
+
+# Cubo vigente por versión del dataset (uno por proceso)
+_cubos: Dict[str, CuboOLAP] = {}
+_lock = threading.Lock()
+
+
+def obtener_cubo(ds) -> CuboOLAP:
+    """Cubo del dataset compartido `ds`: en memoria, en disco o recién construido."""
+    cubo = _cubos.get(ds.version)
+    if cubo is not None:
+        return cubo
+    with _lock:
+        cubo = _cubos.get(ds.version)
+        if cubo is None:
+            cubo = abrir_cubo(ds.version) or construir_cubo(ds.df, ds.version)
+            _cubos.clear()
+            _cubos[ds.version] = cubo
+    return cubo
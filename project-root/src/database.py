@@ -1,29 +1,61 @@
+import os
+import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+import uuid
 import pandas as pd
 from pathlib import Path
 from utils import log_time, logger, debug, handle_errors
 from exceptions import DatabaseError, DataLoadError
 import json
 import hashlib
-from typing import Tuple, Optional
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional
+import numpy as np
 import processing
+import busqueda
+from aproximado import FRACCION_MUESTRA, MIN_ESTRATO
+from profiling import perfilable
 
 # Ruta de la base de datos
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "denuncias.db"
 
+# Rutas de BD cuyo esquema ya se verificó en este proceso (evita un
+# executescript + commit en cada consulta de lectura)
+_esquemas_verificados = set()
 
-def init_db():
-    """Inicializa la conexión y crea el esquema si falta."""
+
+def init_db(path=None):
+    """Inicializa la conexión (a la BD publicada o a `path`) y crea el esquema si falta (una vez por proceso).
+
+    Cada consulta abre su propia conexión: tras publicar una BD nueva (ver
+    `_publicar`), la siguiente consulta ya abre el archivo nuevo.
+    """
+    path = Path(path) if path is not None else DB_PATH
     try:
-        conn = sqlite3.connect(str(DB_PATH))
+        nueva = not path.exists()
+        conn = sqlite3.connect(str(path))
         conn.row_factory = sqlite3.Row
-        create_schema(conn)
+        if nueva or str(path) not in _esquemas_verificados:
+            create_schema(conn)
+            _esquemas_verificados.add(str(path))
         return conn
     except Exception as e:
-        logger.exception(f"Error inicializando BD: {e}")
+        logger.exception("Error inicializando BD: %s", e)
         raise DatabaseError(f"No se pudo conectar a BD: {e}")
 
 
+def version_bd() -> str:
+    """Token de versión de los datos de la BD: cambia con cada escritura confirmada en el archivo."""
+    try:
+        st_ = DB_PATH.stat()
+        return f"{st_.st_size}:{st_.st_mtime_ns}"
+    except FileNotFoundError:
+        return "sin-bd"
+
+
 def create_schema(conn: sqlite3.Connection):
     """Crea el esquema de tablas si no existe."""
     try:
@@ -61,131 +93,665 @@ def create_schema(conn: sqlite3.Connection):
         FOREIGN KEY(modalidad_id) REFERENCES modalidades(id),
         FOREIGN KEY(fuente_id) REFERENCES fuentes(id)
     );
+    CREATE INDEX IF NOT EXISTS idx_denuncias_periodo ON denuncias(anio, mes);
+    CREATE TABLE IF NOT EXISTS particiones (
+        anio INTEGER,
+        mes INTEGER,
+        hash TEXT,
+        filas INTEGER,
+        fuente_id INTEGER,
+        cargado_en TEXT,
+        PRIMARY KEY(anio, mes),
+        FOREIGN KEY(fuente_id) REFERENCES fuentes(id)
+    );
+    CREATE TABLE IF NOT EXISTS denuncias_muestra (
+        id INTEGER PRIMARY KEY,
+        anio INTEGER,
+        mes INTEGER,
+        departamento_id INTEGER,
+        provincia TEXT,
+        distrito TEXT,
+        modalidad_id INTEGER,
+        cantidad INTEGER,
+        fuente_id INTEGER,
+        peso REAL,
+        grupo INTEGER,
+        n_muestra INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_muestra_periodo ON denuncias_muestra(anio, mes);
     """
         )
+        try:
+            cur.execute(_SQL_NOMBRES_FTS)
+        except sqlite3.OperationalError as e:
+            # SQLite sin FTS5/trigram: misma tabla sin índice (LIKE recorre las ~2.500 filas)
+            logger.warning("FTS5 con tokenizador trigram no disponible (%s); búsqueda de nombres sin índice", e)
+            cur.execute(_SQL_NOMBRES_PLANA)
         conn.commit()
         logger.info("Esquema de BD creado/verificado")
     except Exception as e:
-        logger.exception(f"Error creando esquema: {e}")
+        logger.exception("Error creando esquema: %s", e)
         raise DatabaseError(f"Error en esquema: {e}")
 
 
-@log_time
-def cargar_csv_a_bd(csv_path):
-    """Carga datos del CSV a la BD SQLite"""
+# Índice de nombres para la búsqueda incremental: `clave` es el nombre normalizado
+# (busqueda.normalizar); el tokenizador trigram acelera LIKE '%texto%' desde 3 caracteres
+_SQL_NOMBRES_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS nombres_fts USING fts5(
+    clave, nombre UNINDEXED, tipo UNINDEXED, departamento UNINDEXED, provincia UNINDEXED,
+    tokenize = 'trigram'
+)
+"""
+_SQL_NOMBRES_PLANA = """
+CREATE TABLE IF NOT EXISTS nombres_fts (clave TEXT, nombre TEXT, tipo TEXT, departamento TEXT, provincia TEXT)
+"""
+
+# Nombres distintos presentes en `denuncias` (tipo, nombre, departamento, provincia)
+_SQL_NOMBRES = """
+SELECT 'departamento', dep.nombre, NULL, NULL FROM departamentos dep
+WHERE dep.id IN (SELECT DISTINCT departamento_id FROM denuncias)
+UNION ALL
+SELECT DISTINCT 'provincia', d.provincia, dep.nombre, NULL
+FROM denuncias d JOIN departamentos dep ON d.departamento_id = dep.id
+WHERE d.provincia IS NOT NULL
+UNION ALL
+SELECT DISTINCT 'distrito', d.distrito, dep.nombre, d.provincia
+FROM denuncias d JOIN departamentos dep ON d.departamento_id = dep.id
+WHERE d.distrito IS NOT NULL
+UNION ALL
+SELECT 'modalidad', m.nombre, NULL, NULL FROM modalidades m
+WHERE m.id IN (SELECT DISTINCT modalidad_id FROM denuncias)
+"""
+
+
+def _indexar_nombres(cur):
+    """Reconstruye `nombres_fts` con los nombres que hay en `denuncias`."""
+    filas = cur.execute(_SQL_NOMBRES).fetchall()
+    cur.execute("DELETE FROM nombres_fts")
+    cur.executemany(
+        "INSERT INTO nombres_fts (clave, nombre, tipo, departamento, provincia) VALUES (?, ?, ?, ?, ?)",
+        [(busqueda.normalizar(nombre), nombre, tipo, dpto, prov) for tipo, nombre, dpto, prov in filas],
+    )
+    return len(filas)
+
+
+# Columnas del DataFrame limpio que definen el contenido de una partición (año, mes)
+COLUMNAS_PARTICION = ["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"]
+
+
+def _registrar_fuente(cur, csv_path) -> int:
+    """Crea o recupera la fila de `fuentes` del archivo (con hash y tamaño)."""
     try:
-        conn = init_db()
+        h = hashlib.sha256()
+        size_bytes = 0
+        with open(csv_path, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+                size_bytes += len(bloque)
+        sha256 = h.hexdigest()
+    except Exception as e:
+        logger.warning("No se pudo calcular hash del archivo: %s", e)
+        sha256 = None
+        size_bytes = None
+
+    filename = Path(csv_path).name
+    cur.execute("SELECT id FROM fuentes WHERE filename = ?", (filename,))
+    row = cur.fetchone()
+    if row:
+        logger.debug("Fuente existente: %s (id=%s)", filename, row[0])
+        return row[0]
+    cur.execute(
+        "INSERT INTO fuentes (filename, downloaded_at, sha256, size_bytes, url) VALUES (?, datetime('now'), ?, ?, ?)",
+        (filename, sha256, size_bytes, None),
+    )
+    logger.debug("Fuente nueva creada: %s (id=%s)", filename, cur.lastrowid)
+    return cur.lastrowid
+
+
+def _insertar_filas(conn, df: pd.DataFrame, fuente_id: int) -> int:
+    """Inserta las filas de `df` (limpio) en `denuncias`; devuelve cuántas se insertaron.
+
+    No confirma la transacción: el llamador decide cuándo hacer commit.
+    """
+    cur = conn.cursor()
+
+    # Caches para evitar consultas repetidas
+    dept_cache = {}
+    mod_cache = {}
+
+    def get_or_create(tabla: str, cache: dict, nombre: str) -> int:
+        if nombre in cache:
+            return cache[nombre]
+        cur.execute(f"SELECT id FROM {tabla} WHERE nombre = ?", (nombre,))
+        r = cur.fetchone()
+        if r:
+            cache[nombre] = r[0]
+            return r[0]
+        cur.execute(f"INSERT INTO {tabla} (nombre) VALUES (?)", (nombre,))
+        cache[nombre] = cur.lastrowid
+        return cur.lastrowid
+
+    # Preparar lista de inserts
+    inserts = []
+    for _, r in df.iterrows():
+        anio = int(r.get("AÑO")) if pd.notna(r.get("AÑO")) else None
+        mes = int(r.get("MES")) if pd.notna(r.get("MES")) else None
+        dept = r.get("DEPARTAMENTO") if pd.notna(r.get("DEPARTAMENTO")) else None
+        prov = r.get("PROVINCIA") if pd.notna(r.get("PROVINCIA")) else None
+        dist = r.get("DISTRITO") if pd.notna(r.get("DISTRITO")) else None
+        mod = r.get("MODALIDADES") if pd.notna(r.get("MODALIDADES")) else None
+        cant = int(r.get("cantidad")) if pd.notna(r.get("cantidad")) else 0
+
+        dept_id = get_or_create("departamentos", dept_cache, str(dept)) if dept else None
+        mod_id = get_or_create("modalidades", mod_cache, str(mod)) if mod else None
+
+        inserts.append((anio, mes, dept_id, prov, dist, mod_id, cant, fuente_id))
+
+    cur.executemany(
+        "INSERT INTO denuncias (anio, mes, departamento_id, provincia, distrito, modalidad_id, cantidad, fuente_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        inserts,
+    )
+    return len(inserts)
+
+
+@log_time
+def hashes_particiones(df: pd.DataFrame) -> Dict[Tuple[int, int], Tuple[str, int]]:
+    """Hash de contenido por partición (año, mes) del DataFrame limpio → (hash, filas).
 
-        # Intentar leer con utf-8 y fallback a latin1
+    El hash no depende del orden de las filas: se combinan los hashes por fila
+    ordenados dentro de cada partición.
+    """
+    datos = df.dropna(subset=["AÑO", "MES"])
+    if datos.empty:
+        return {}
+    filas = pd.util.hash_pandas_object(datos[COLUMNAS_PARTICION], index=False).to_numpy()
+    anios = datos["AÑO"].to_numpy(dtype=np.int64)
+    meses = datos["MES"].to_numpy(dtype=np.int64)
+
+    orden = np.lexsort((filas, meses, anios))
+    filas, anios, meses = filas[orden], anios[orden], meses[orden]
+    cortes = np.flatnonzero((np.diff(anios) != 0) | (np.diff(meses) != 0)) + 1
+    limites = np.concatenate(([0], cortes, [len(filas)]))
+
+    return {
+        (int(anios[i]), int(meses[i])): (hashlib.sha256(filas[i:j].tobytes()).hexdigest(), int(j - i))
+        for i, j in zip(limites[:-1], limites[1:])
+    }
+
+
+def _guardar_particiones(cur, hashes: Dict[Tuple[int, int], Tuple[str, int]], fuente_id: int):
+    cur.executemany(
+        "INSERT OR REPLACE INTO particiones (anio, mes, hash, filas, fuente_id, cargado_en) "
+        "VALUES (?, ?, ?, ?, ?, datetime('now'))",
+        [(anio, mes, h, n, fuente_id) for (anio, mes), (h, n) in hashes.items()],
+    )
+
+
+# Muestra estratificada por (anio, mes, departamento) para las consultas aproximadas:
+# FRACCION_MUESTRA de cada estrato, con un mínimo de MIN_ESTRATO filas (los de aproximado.py)
+# Grupos de la muestra para estimar el error de cualquier consulta (jackknife)
+GRUPOS_MUESTRA = 8
+
+_SQL_MUESTRA = """
+INSERT INTO denuncias_muestra
+    (id, anio, mes, departamento_id, provincia, distrito, modalidad_id, cantidad, fuente_id, peso, grupo, n_muestra)
+SELECT id, anio, mes, departamento_id, provincia, distrito, modalidad_id, cantidad, fuente_id,
+       CAST(n AS REAL) / k,
+       -- Un estrato completo (censo) no aporta varianza: no pertenece a ningún grupo (-1)
+       CASE WHEN k = n THEN -1 ELSE (rn - 1) % :grupos END,
+       k
+FROM (
+    SELECT *, MIN(n, MAX(:minimo, CAST(:fraccion * n + 0.999999 AS INTEGER))) AS k
+    FROM (
+        SELECT d.*,
+               ROW_NUMBER() OVER (PARTITION BY anio, mes, departamento_id
+                                  ORDER BY (id * 2654435761) % 4294967296) AS rn,
+               COUNT(*) OVER (PARTITION BY anio, mes, departamento_id) AS n
+        FROM denuncias d
+        {where}
+    )
+)
+WHERE rn <= k
+"""
+
+
+def _muestrear(cur, periodos=None):
+    """Reconstruye la muestra estratificada de `denuncias_muestra` (sólo de `periodos` si se indican)."""
+    parametros = {"grupos": GRUPOS_MUESTRA, "minimo": MIN_ESTRATO, "fraccion": FRACCION_MUESTRA}
+    if periodos is None:
+        cur.execute("DELETE FROM denuncias_muestra")
+        cur.execute(_SQL_MUESTRA.format(where=""), parametros)
+        return
+    for anio, mes in periodos:
+        cur.execute("DELETE FROM denuncias_muestra WHERE anio = ? AND mes = ?", (anio, mes))
+        cur.execute(_SQL_MUESTRA.format(where="WHERE anio = :anio AND mes = :mes"),
+                    {**parametros, "anio": anio, "mes": mes})
+
+
+# --- Construcción e intercambio ---
+# Las cargas no escriben en la BD publicada: cada una construye su propio archivo
+# `denuncias.nueva-XXXX.db` (datos, muestra, índice de nombres, índices y ANALYZE) y lo publica
+# con os.replace, que es atómico. Los lectores nunca ven una carga a medias ni esperan bloqueos
+# de escritura; la versión reemplazada queda como `denuncias.anterior.db` para volver a ella al
+# instante. Publicar y restaurar renombran archivos que comparten todos los procesos (app, API,
+# CLI), así que se serializan con un lock de archivo; entre procesos gana la última publicación.
+
+# Serializa las cargas del proceso (una carga incremental parte de la última BD publicada)
+_lock_carga = threading.Lock()
+
+# Lock entre procesos para publicar/restaurar: espera máxima y edad a partir de la cual se
+# considera abandonado por un proceso que murió a mitad (publicar sólo renombra: tarda ms)
+ESPERA_LOCK = 30
+LOCK_VENCIDO = 120
+
+
+def ruta_version(nombre: str) -> Path:
+    """Archivo hermano de la BD publicada (p. ej. "anterior")."""
+    return DB_PATH.with_name(f"{DB_PATH.stem}.{nombre}{DB_PATH.suffix}")
+
+
+def _eliminar_bd(path: Path):
+    for archivo in (path, path.with_name(path.name + "-journal")):
+        archivo.unlink(missing_ok=True)
+
+
+@contextmanager
+def _lock_publicacion():
+    """Lock entre procesos (archivo `denuncias.db.lock` creado con O_CREAT | O_EXCL) para publicar o restaurar."""
+    path = DB_PATH.with_name(DB_PATH.name + ".lock")
+    limite = time.monotonic() + ESPERA_LOCK
+    while True:
         try:
-            raw = pd.read_csv(csv_path, encoding="utf-8")
-        except Exception:
-            logger.warning(f"UTF-8 falló, usando latin1 para {csv_path}")
-            raw = pd.read_csv(csv_path, encoding="latin1")
+            fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                vencido = time.time() - path.stat().st_mtime > LOCK_VENCIDO
+            except FileNotFoundError:
+                continue
+            if vencido:
+                logger.warning("Lock de publicación abandonado (%s); se elimina", path.name)
+                path.unlink(missing_ok=True)
+                continue
+            if time.monotonic() > limite:
+                raise DatabaseError(f"Otro proceso está publicando la BD ({path.name}); reintente")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+    finally:
+        os.close(fd)
+    try:
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def _abrir_construccion(copiar_publicada: bool) -> Tuple[sqlite3.Connection, Path]:
+    """BD en construcción en un archivo propio, vacía o (con `copiar_publicada`) copia de la publicada.
+
+    Returns:
+        (conexión, ruta del archivo en construcción).
+    """
+    fd, nombre = tempfile.mkstemp(dir=DB_PATH.parent, prefix=f"{DB_PATH.stem}.nueva-", suffix=DB_PATH.suffix)
+    os.close(fd)
+    nueva = Path(nombre)
+    try:
+        if copiar_publicada and DB_PATH.exists():
+            origen, destino = sqlite3.connect(str(DB_PATH)), sqlite3.connect(str(nueva))
+            try:
+                origen.backup(destino)
+            finally:
+                origen.close()
+                destino.close()
+        return init_db(nueva), nueva
+    except Exception:
+        _eliminar_bd(nueva)
+        raise
+
+
+def _preservar_publicada() -> Optional[Path]:
+    """Segundo nombre único (enlace duro o copia) para el archivo publicado, que sigue en su sitio."""
+    if not DB_PATH.exists():
+        return None
+    enlace = DB_PATH.with_name(f"{DB_PATH.stem}.swap-{uuid.uuid4().hex[:12]}{DB_PATH.suffix}")
+    try:
+        os.link(DB_PATH, enlace)
+    except OSError:
+        shutil.copy2(DB_PATH, enlace)
+    return enlace
+
+
+def _intercambiar(origen: Path, destino_publicada: Path):
+    """Publica `origen` en DB_PATH; la versión publicada pasa a `destino_publicada` (con el lock tomado)."""
+    # DB_PATH siempre existe: primero se le da otro nombre a la versión actual y luego se reemplaza
+    enlace = _preservar_publicada()
+    try:
+        os.replace(origen, DB_PATH)
+    except OSError:
+        if enlace is not None:
+            enlace.unlink(missing_ok=True)
+        raise
+    if enlace is not None:
+        os.replace(enlace, destino_publicada)
+
+
+def _completar_derivados(cur):
+    """Construye la muestra y el índice de nombres que falten en la BD en construcción (p. ej. copia de una BD vieja)."""
+    if cur.execute("SELECT 1 FROM denuncias LIMIT 1").fetchone() is None:
+        return
+    if cur.execute("SELECT 1 FROM denuncias_muestra LIMIT 1").fetchone() is None:
+        _muestrear(cur)
+    if cur.execute("SELECT 1 FROM nombres_fts LIMIT 1").fetchone() is None:
+        _indexar_nombres(cur)
+
+
+def _publicar(conn: sqlite3.Connection, nueva: Path):
+    """Termina la BD en construcción `nueva` (derivados y ANALYZE), la cierra y la publica; la actual pasa a "anterior"."""
+    _completar_derivados(conn.cursor())
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    with _lock_publicacion():
+        _intercambiar(nueva, ruta_version("anterior"))
+    _esquemas_verificados.discard(str(nueva))
+    logger.info("BD publicada: %s (%s bytes)", DB_PATH.name, DB_PATH.stat().st_size)
+
+
+def version_anterior() -> Optional[str]:
+    """Fecha de la versión anterior disponible para restaurar (o None)."""
+    anterior = ruta_version("anterior")
+    if not anterior.exists():
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(anterior.stat().st_mtime))
+
+
+@log_time
+def restaurar_anterior() -> str:
+    """Intercambia la BD publicada con la anterior (restaurar dos veces deja todo como estaba).
+
+    Returns:
+        token de versión (`version_bd`) de la BD publicada tras el cambio.
+    """
+    with _lock_carga, _lock_publicacion():
+        anterior = ruta_version("anterior")
+        if not anterior.exists():
+            raise DatabaseError("No hay una versión anterior de la BD para restaurar")
+        _intercambiar(anterior, anterior)
+    logger.info("BD restaurada a la versión anterior")
+    return version_bd()
+
+
+@log_time
+@perfilable("ingest")
+def cargar_csv_a_bd(csv_path):
+    """Recarga completa: construye una BD nueva con el CSV y la publica (la actual queda como anterior)."""
+    conn = nueva = None
+    try:
+        # Lectura única con el lector compartido (encoding detectado, tipos declarados)
+        raw = processing.load_raw(Path(csv_path))
 
         # Utilizar las funciones de procesamiento para estandarizar columnas
         df = processing.clean(raw)
 
-        # Calcular hash y metadatos del archivo
-        try:
-            with open(csv_path, "rb") as f:
-                content = f.read()
-            sha256 = hashlib.sha256(content).hexdigest()
-            size_bytes = len(content)
-        except Exception as e:
-            logger.warning(f"No se pudo calcular hash del archivo: {e}")
-            sha256 = None
-            size_bytes = None
+        with _lock_carga:
+            conn, nueva = _abrir_construccion(copiar_publicada=False)
+            cur = conn.cursor()
+            fuente_id = _registrar_fuente(cur, csv_path)
+            total = _insertar_filas(conn, df, fuente_id)
+            # Registrar los hashes por partición para que la próxima carga pueda ser incremental
+            _guardar_particiones(cur, hashes_particiones(df), fuente_id)
+            _muestrear(cur)
+            _indexar_nombres(cur)
+            _publicar(conn, nueva)
+            conn = nueva = None
+        logger.info("CSV cargado en BD: %s (%s filas insertadas)", csv_path, total)
+        return total, True
+    except Exception as e:
+        if conn is not None:
+            conn.close()
+        if nueva is not None:
+            _eliminar_bd(nueva)
+        logger.exception("Error cargando CSV a BD: %s", e)
+        return 0, False
 
-        cur = conn.cursor()
 
-        # Crear o recuperar fuente
-        filename = Path(csv_path).name
-        cur.execute("SELECT id FROM fuentes WHERE filename = ?", (filename,))
-        row = cur.fetchone()
-        if row:
-            fuente_id = row[0]
-            logger.debug(f"Fuente existente: {filename} (id={fuente_id})")
-        else:
-            cur.execute(
-                "INSERT INTO fuentes (filename, downloaded_at, sha256, size_bytes, url) VALUES (?, datetime('now'), ?, ?, ?)",
-                (filename, sha256, size_bytes, None),
-            )
-            fuente_id = cur.lastrowid
-            logger.debug(f"Fuente nueva creada: {filename} (id={fuente_id})")
-
-        # Caches para evitar consultas repetidas
-        dept_cache = {}
-        mod_cache = {}
-
-        def get_or_create_departamento(conn, nombre: str) -> int:
-            if nombre in dept_cache:
-                return dept_cache[nombre]
-            c = conn.cursor()
-            c.execute("SELECT id FROM departamentos WHERE nombre = ?", (nombre,))
-            r = c.fetchone()
-            if r:
-                dept_cache[nombre] = r[0]
-                return r[0]
-            c.execute("INSERT INTO departamentos (nombre) VALUES (?)", (nombre,))
-            conn.commit()
-            dept_cache[nombre] = c.lastrowid
-            return c.lastrowid
-
-        def get_or_create_modalidad(conn, nombre: str) -> int:
-            if nombre in mod_cache:
-                return mod_cache[nombre]
-            c = conn.cursor()
-            c.execute("SELECT id FROM modalidades WHERE nombre = ?", (nombre,))
-            r = c.fetchone()
-            if r:
-                mod_cache[nombre] = r[0]
-                return r[0]
-            c.execute("INSERT INTO modalidades (nombre) VALUES (?)", (nombre,))
-            conn.commit()
-            mod_cache[nombre] = c.lastrowid
-            return c.lastrowid
-
-        # Preparar lista de inserts
-        inserts = []
-        for _, r in df.iterrows():
-            anio = int(r.get("AÑO")) if pd.notna(r.get("AÑO")) else None
-            mes = int(r.get("MES")) if pd.notna(r.get("MES")) else None
-            dept = r.get("DEPARTAMENTO") if pd.notna(r.get("DEPARTAMENTO")) else None
-            prov = r.get("PROVINCIA") if pd.notna(r.get("PROVINCIA")) else None
-            dist = r.get("DISTRITO") if pd.notna(r.get("DISTRITO")) else None
-            mod = r.get("MODALIDADES") if pd.notna(r.get("MODALIDADES")) else None
-            cant = int(r.get("cantidad")) if pd.notna(r.get("cantidad")) else 0
-
-            dept_id = get_or_create_departamento(conn, str(dept)) if dept else None
-            mod_id = get_or_create_modalidad(conn, str(mod)) if mod else None
-
-            inserts.append((anio, mes, dept_id, prov, dist, mod_id, cant, fuente_id))
-
-        cur.executemany(
-            "INSERT INTO denuncias (anio, mes, departamento_id, provincia, distrito, modalidad_id, cantidad, fuente_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            inserts,
-        )
-        conn.commit()
-        total = cur.rowcount
-        conn.close()
-        logger.info(f"CSV cargado en BD: {csv_path} ({len(inserts)} filas insertadas)")
-        return len(inserts), True
+@log_time
+@perfilable("ingest")
+def cargar_csv_delta(csv_path, eliminar_ausentes=True):
+    """Carga incremental de una nueva versión acumulada del CSV.
+
+    Compara el hash de cada partición (año, mes) del archivo con el de la
+    última carga y sólo reinserta los meses nuevos o modificados; sin cambios
+    no se publica nada. Como el archivo es acumulado, los meses de la BD que ya
+    no aparecen en él se borran, igual que en el lago (`lake.escribir_particiones`);
+    con `eliminar_ausentes=False` sólo se reportan.
+
+    Sólo se parsean e insertan los meses cambiados, pero la carga trabaja sobre
+    una copia completa de la BD publicada que luego se publica (ver `_publicar`):
+    el disco escribe todo el historial en cada carga con cambios. Es el precio de
+    que los lectores nunca vean una carga a medias.
+
+    Returns:
+        (reporte, exito). El reporte incluye las listas "nuevas", "modificadas",
+        "sin_cambios" y "ausentes" (como "AAAA-MM"), si los ausentes se
+        eliminaron ("ausentes_eliminados") y los totales de filas insertadas y
+        eliminadas.
+    """
+    conn = nueva = None
+    try:
+        df = processing.clean(processing.load_raw(Path(csv_path)))
+        nuevos = hashes_particiones(df)
+
+        with _lock_carga:
+            lectura = init_db()
+            try:
+                previos = {
+                    (r["anio"], r["mes"]): r["hash"]
+                    for r in lectura.execute("SELECT anio, mes, hash FROM particiones").fetchall()
+                }
+            finally:
+                lectura.close()
+
+            nuevas = sorted(p for p in nuevos if p not in previos)
+            modificadas = sorted(p for p in nuevos if p in previos and previos[p] != nuevos[p][0])
+            sin_cambios = sorted(p for p in nuevos if previos.get(p) == nuevos[p][0])
+            ausentes = sorted(p for p in previos if p not in nuevos)
+            a_cargar = nuevas + modificadas
+            a_eliminar = ausentes if eliminar_ausentes else []
+
+            filas_eliminadas = 0
+            filas_insertadas = 0
+            if a_cargar or a_eliminar:
+                conn, nueva = _abrir_construccion(copiar_publicada=True)
+                cur = conn.cursor()
+                fuente_id = _registrar_fuente(cur, csv_path)
+                # Se borra también en las particiones "nuevas": cubre BD cargadas antes de registrar hashes
+                for anio, mes in a_cargar + a_eliminar:
+                    cur.execute("DELETE FROM denuncias WHERE anio = ? AND mes = ?", (anio, mes))
+                    filas_eliminadas += cur.rowcount
+                for anio, mes in a_eliminar:
+                    cur.execute("DELETE FROM particiones WHERE anio = ? AND mes = ?", (anio, mes))
+                periodos = pd.MultiIndex.from_tuples(a_cargar)
+                seleccion = pd.MultiIndex.from_arrays([df["AÑO"], df["MES"]]).isin(periodos)
+                filas_insertadas = _insertar_filas(conn, df[seleccion], fuente_id)
+                _guardar_particiones(cur, {p: nuevos[p] for p in a_cargar}, fuente_id)
+                _muestrear(cur, a_cargar + a_eliminar)
+                _indexar_nombres(cur)
+                _publicar(conn, nueva)
+                conn = nueva = None
+
+        def fmt(periodos):
+            return [f"{anio}-{mes:02d}" for anio, mes in periodos]
+
+        reporte = {
+            "archivo": Path(csv_path).name,
+            "nuevas": fmt(nuevas),
+            "modificadas": fmt(modificadas),
+            "sin_cambios": fmt(sin_cambios),
+            "ausentes": fmt(ausentes),
+            "ausentes_eliminados": bool(a_eliminar),
+            "filas_insertadas": filas_insertadas,
+            "filas_eliminadas": filas_eliminadas,
+        }
+        logger.info("Carga incremental %s: %s nuevas, %s modificadas, %s sin cambios, %s ausentes (+%s/-%s filas)",
+                    reporte["archivo"], len(nuevas), len(modificadas), len(sin_cambios), len(ausentes),
+                    filas_insertadas, filas_eliminadas)
+        return reporte, True
     except Exception as e:
-        logger.exception(f"Error cargando CSV a BD: {e}")
-        return 0, False
+        if conn is not None:
+            conn.close()
+        if nueva is not None:
+            _eliminar_bd(nueva)
+        logger.exception("Error en carga incremental a BD: %s", e)
+        return None, False
 
 
-def consultar_bd(sql_query):
-    """Ejecuta una consulta SQL y retorna DataFrame"""
+def consultar_bd(sql_query, aproximado=False):
+    """Ejecuta una consulta SQL y retorna DataFrame
+
+    Con `aproximado=True` la consulta se responde sobre la muestra estratificada
+    (ver `consultar_bd_aproximada`).
+    """
+    if aproximado:
+        return consultar_bd_aproximada(sql_query)
     try:
         conn = init_db()
         resultado = pd.read_sql_query(sql_query, conn)
         conn.close()
-        logger.debug(f"Consulta SQL ejecutada, {len(resultado)} filas retornadas")
+        logger.debug("Consulta SQL ejecutada, %s filas retornadas", len(resultado))
+        return resultado, True
+    except Exception as e:
+        logger.exception("Error en consulta SQL: %s", e)
+        return None, False
+
+
+def _vista_muestra(conn, grupo=None):
+    """Reemplaza `denuncias` por una vista TEMP sobre la muestra con `cantidad` y `peso` expandidos.
+
+    Las tablas TEMP tienen prioridad sobre las de `main` para los nombres sin
+    esquema, así que la consulta del usuario no necesita cambios. Con `grupo`,
+    la vista es la réplica jackknife que excluye ese grupo.
+    """
+    if grupo is None:
+        factor, where = "peso", ""
+    else:
+        # Sin el grupo g, las filas restantes del estrato representan a las n_muestra:
+        # peso × n / (n - n_g), con n_g = ceil((n - g) / G) filas del estrato en el grupo g
+        g, G = int(grupo), GRUPOS_MUESTRA
+        factor = (f"peso * (CASE WHEN grupo < 0 THEN 1.0 ELSE "
+                  f"CAST(n_muestra AS REAL) / (n_muestra - (n_muestra + {G - 1 - g}) / {G}) END)")
+        where = f"WHERE grupo <> {g}"
+    conn.execute("DROP VIEW IF EXISTS temp.denuncias")
+    conn.execute(
+        f"CREATE TEMP VIEW denuncias AS SELECT id, anio, mes, departamento_id, provincia, distrito, "
+        f"modalidad_id, cantidad * {factor} AS cantidad, fuente_id, {factor} AS peso "
+        f"FROM main.denuncias_muestra {where}"
+    )
+
+
+@log_time
+def consultar_bd_aproximada(sql_query):
+    """Responde una consulta sobre la muestra estratificada, con error estimado.
+
+    La consulta se ejecuta sin cambios contra una vista `denuncias` de la muestra
+    en la que `cantidad` ya está expandida por el peso de cada fila: SUM(cantidad)
+    estima el total y SUM(peso) el número de filas (COUNT(*) cuenta la muestra).
+    El error se estima con un jackknife por grupos: la consulta se repite
+    GRUPOS_MUESTRA veces quitando cada vez un grupo de la muestra, y la dispersión
+    de esas réplicas da una columna "<columna> ±" (intervalo del 95 %) por cada
+    columna decimal. Sólo las agregaciones (SUM, AVG) tienen sentido estadístico.
+
+    La muestra se construye sólo en la carga (BD en construcción); si la BD
+    publicada no la tiene, se responde con la consulta exacta (fracción 1).
+
+    Returns:
+        (DataFrame, exito); `DataFrame.attrs["aproximado"]` indica la fracción muestreada.
+    """
+    conn = None
+    try:
+        conn = init_db()
+        filas, muestra = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM denuncias), (SELECT COUNT(*) FROM denuncias_muestra)").fetchone()
+        if not filas:
+            raise DatabaseError("No hay datos en la BD: carga primero el CSV")
+        if not muestra:
+            logger.warning("La BD publicada no tiene muestra (se crea en la próxima carga): consulta exacta")
+            conn.close()
+            conn = None
+            resultado, exito = consultar_bd(sql_query)
+            if exito:
+                resultado.attrs["aproximado"] = {"filas_muestra": filas, "filas": filas, "fraccion": 1.0, "grupos": 0}
+            return resultado, exito
+
+        _vista_muestra(conn)
+        resultado = pd.read_sql_query(sql_query, conn)
+        replicas = []
+        for grupo in range(GRUPOS_MUESTRA):
+            _vista_muestra(conn, grupo)
+            replicas.append(pd.read_sql_query(sql_query, conn))
+
+        # Columnas decimales = estimaciones (cantidad y peso son REAL en la vista); el resto son claves
+        valores = [c for c in resultado.columns if pd.api.types.is_float_dtype(resultado[c])]
+        claves = [c for c in resultado.columns if c not in valores]
+        if valores:
+            alineadas = []
+            for r in replicas:
+                if claves:
+                    r = resultado[claves].merge(r, on=claves, how="left")
+                alineadas.append(r[valores].reindex(range(len(resultado))).fillna(0).to_numpy())
+            # Varianza jackknife: (G - 1) / G · Σ (réplica - media)²
+            replicado = np.stack(alineadas)
+            varianza = (GRUPOS_MUESTRA - 1) / GRUPOS_MUESTRA * \
+                ((replicado - replicado.mean(axis=0)) ** 2).sum(axis=0)
+            for i, c in enumerate(valores):
+                posicion = resultado.columns.get_loc(c) + 1
+                resultado.insert(posicion, f"{c} ±", (1.96 * np.sqrt(varianza[:, i])).round(1))
+                resultado[c] = resultado[c].round(1)
+
+        resultado.attrs["aproximado"] = {"filas_muestra": muestra, "filas": filas,
+                                         "fraccion": muestra / max(filas, 1), "grupos": GRUPOS_MUESTRA}
+        logger.debug("Consulta aproximada sobre %s de %s filas: %s filas retornadas", muestra, filas, len(resultado))
+        return resultado, True
+    except Exception as e:
+        logger.exception("Error en consulta SQL aproximada: %s", e)
+        return None, False
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+_SQL_BUSCAR = """
+SELECT tipo, nombre, departamento, provincia FROM nombres_fts
+WHERE clave LIKE :contiene
+ORDER BY CASE WHEN clave = :q THEN 0 WHEN clave LIKE :prefijo THEN 1 WHEN clave LIKE :palabra THEN 2 ELSE 3 END,
+         CASE tipo WHEN 'departamento' THEN 0 WHEN 'provincia' THEN 1 WHEN 'distrito' THEN 2 ELSE 3 END,
+         clave, departamento, provincia
+LIMIT :limite
+"""
+
+
+@debug
+def buscar_nombres(texto, limite=busqueda.LIMITE_DEFECTO):
+    """Búsqueda de departamentos, provincias, distritos y modalidades que contienen `texto`.
+
+    Usa el índice trigram de `nombres_fts`, que sólo llena la ingesta: la consulta
+    no escribe en la BD publicada. Mismo orden que `busqueda.IndiceNombres.buscar`:
+    exactas, prefijos, inicio de palabra y resto.
+    """
+    # Los comodines de LIKE no forman parte de ningún nombre
+    q = busqueda.normalizar(texto).replace("%", "").replace("_", "")
+    if not q:
+        return pd.DataFrame(columns=["tipo", "nombre", "departamento", "provincia"]), True
+    try:
+        conn = init_db()
+        try:
+            resultado = pd.read_sql_query(_SQL_BUSCAR, conn, params={
+                "q": q, "contiene": f"%{q}%", "prefijo": f"{q}%", "palabra": f"% {q}%", "limite": int(limite)})
+        finally:
+            conn.close()
         return resultado, True
     except Exception as e:
-        logger.exception(f"Error en consulta SQL: {e}")
+        logger.exception("Error buscando nombres: %s", e)
         return None, False
 
 
@@ -229,7 +795,7 @@ def obtener_tendencia_mensual(año):
         """
         return consultar_bd(query)
     except Exception as e:
-        logger.exception(f"Error en tendencia mensual: {e}")
+        logger.exception("Error en tendencia mensual: %s", e)
         return None, False
 
 
@@ -249,7 +815,7 @@ def obtener_denuncias_por_provincia(departamento):
         conn.close()
         return resultado, True
     except Exception as e:
-        logger.exception(f"Error en denuncias por provincia: {e}")
+        logger.exception("Error en denuncias por provincia: %s", e)
         return None, False
 
 
@@ -275,7 +841,7 @@ def obtener_tabla_completa(limite=100):
         query = f"SELECT d.id, d.anio, d.mes, dep.nombre as DEPARTAMENTO, d.provincia, d.distrito, mod.nombre as MODALIDADES, d.cantidad, f.filename as fuente FROM denuncias d LEFT JOIN departamentos dep ON d.departamento_id = dep.id LEFT JOIN modalidades mod ON d.modalidad_id = mod.id LEFT JOIN fuentes f ON d.fuente_id = f.id LIMIT {int(limite)}"
         return consultar_bd(query)
     except Exception as e:
-        logger.exception(f"Error obteniendo tabla completa: {e}")
+        logger.exception("Error obteniendo tabla completa: %s", e)
         return None, False
 
 
@@ -285,7 +851,7 @@ def obtener_denuncias_join(limite=100):
         query = f"SELECT d.id, d.anio, d.mes, dep.nombre as departamento, mod.nombre as modalidad, d.cantidad FROM denuncias d LEFT JOIN departamentos dep ON d.departamento_id = dep.id LEFT JOIN modalidades mod ON d.modalidad_id = mod.id ORDER BY d.anio DESC, d.mes DESC LIMIT {int(limite)}"
         return consultar_bd(query)
     except Exception as e:
-        logger.exception(f"Error en JOIN: {e}")
+        logger.exception("Error en JOIN: %s", e)
         return None, False
 
 
@@ -305,6 +871,6 @@ def obtener_top_modalidades_por_departamento(n: int = 5):
         """
         return consultar_bd(query)
     except Exception as e:
-        logger.exception(f"Error obteniendo top modalidades: {e}")
+        logger.exception("Error obteniendo top modalidades: %s", e)
         return None, False
 
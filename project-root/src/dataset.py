@@ -0,0 +1,172 @@
+"""
+Dataset limpio compartido por todas las sesiones del proceso.
+El CSV se carga y limpia una sola vez por versión (nombre + tamaño + mtime);
+cada sesión recibe vistas sin copia del mismo DataFrame (Copy-on-Write), y
+cuando aparece una nueva versión del archivo se reconstruye y se reemplaza
+de forma atómica.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import lake
+import processing
+from utils import log_time, logger
+from exceptions import DataLoadError
+
+# Con Copy-on-Write, las vistas derivadas nunca modifican el DataFrame compartido
+# (en pandas >= 3.0 ya está siempre activo y la opción está deprecada)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+
+def version_dataset(path: Path) -> str:
+    """Token de versión del archivo: cambia si el CSV se reemplaza o modifica."""
+    st_ = Path(path).stat()
+    return f"{Path(path).name}:{st_.st_size}:{st_.st_mtime_ns}"
+
+
+@dataclass(frozen=True)
+class DatasetCompartido:
+    """DataFrame limpio ordenado por (AÑO, MES) + índices, inmutable y compartido entre sesiones."""
+
+    path: Path
+    version: str
+    _df: pd.DataFrame = field(repr=False)
+    # valor → posiciones (np.ndarray, crecientes) de las filas con ese valor
+    indices: Dict[str, Dict[object, np.ndarray]] = field(repr=False)
+    # Tabla de offsets por periodo (ver processing.tabla_offsets)
+    claves_periodo: np.ndarray = field(repr=False)
+    offsets: np.ndarray = field(repr=False)
+    # Opciones de los selectores y jerarquía geográfica (ver processing.opciones_filtros)
+    opciones: dict = field(repr=False)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Vista sin copia del DataFrame compartido (las escrituras disparan CoW en la vista)."""
+        return self._df.copy(deep=False)
+
+    def __len__(self) -> int:
+        return len(self._df)
+
+    def posiciones(self, columna: str, valor) -> np.ndarray:
+        return self.indices.get(columna, {}).get(valor, np.empty(0, dtype=np.intp))
+
+    def provincias(self, dpto: str) -> List[str]:
+        return list(self.opciones["jerarquia"].get(dpto, {}))
+
+    def distritos(self, dpto: str, prov: Optional[str] = None) -> List[str]:
+        """Distritos del departamento, o sólo los de la provincia si se indica."""
+        if prov:
+            return self.opciones["jerarquia"].get(dpto, {}).get(prov, [])
+        return self.opciones["distritos"].get(dpto, [])
+
+    def periodos(self) -> List[Tuple[int, int]]:
+        """Periodos (año, mes) presentes, en orden."""
+        return [processing.periodo_de_clave(c) for c in self.claves_periodo]
+
+    def rango(self, inicio: Tuple[int, int], fin: Tuple[int, int]) -> Tuple[int, int]:
+        """Filas [a, b) del rango de periodos (búsqueda binaria en la tabla de offsets)."""
+        return processing.rango_filas(self.claves_periodo, self.offsets, inicio, fin)
+
+    def filtrar(self, anio, modalidades, dpto, prov, mes_range, periodo=None) -> pd.DataFrame:
+        """Igual que `processing.filter_df`, pero el tiempo se resuelve como un tramo contiguo.
+
+        Un año con rango de meses, o un `periodo` que cruza años, es un rango de
+        filas del DataFrame ordenado; el departamento se acota dentro de ese tramo
+        con búsquedas binarias sobre sus posiciones.
+        """
+        a, b = 0, len(self._df)
+        if periodo is not None:
+            a, b = self.rango(*periodo)
+            periodo = None
+        if anio is not None:
+            lo, hi = mes_range if mes_range else (1, 12)
+            a2, b2 = self.rango((int(anio), lo), (int(anio), hi))
+            a, b = max(a, a2), max(min(b, b2), max(a, a2))
+            anio, mes_range = None, None
+
+        if dpto and dpto != "Todos":
+            pos = self.posiciones("DEPARTAMENTO", dpto)
+            pos = pos[np.searchsorted(pos, a):np.searchsorted(pos, b)]
+            base = self._df.take(pos)
+            dpto = None
+        else:
+            base = self._df.iloc[a:b]
+        return processing.filter_df(base, anio, modalidades, dpto, prov, mes_range, periodo)
+
+
+@log_time
+def _construir(path: Path, version: str) -> DatasetCompartido:
+    opciones = None
+    if lake.vigente(version):
+        # El lago Parquet ya contiene esta versión del CSV limpia: se evita parsear y limpiar
+        df = lake.leer()
+        opciones = lake.leer_opciones(version)
+    else:
+        df = processing.clean(processing.load_raw(path))
+    if opciones is None:
+        opciones = processing.opciones_filtros(df)
+    # Orden físico por periodo: cualquier rango de fechas es un tramo contiguo
+    df = processing.ordenar_por_periodo(df)
+    claves, offsets = processing.tabla_offsets(df)
+    indices = {
+        col: df.groupby(col, sort=False, observed=True).indices
+        for col in ("DEPARTAMENTO",)
+        if col in df.columns
+    }
+    logger.info("Dataset compartido construido: %s (%s filas, %s periodos, %.1f MB)",
+                version, len(df), len(claves), df.memory_usage(deep=True).sum() / 1024 / 1024)
+    return DatasetCompartido(path=Path(path), version=version, _df=df, indices=indices,
+                             claves_periodo=claves, offsets=offsets, opciones=opciones)
+
+
+# Registro por proceso: ruta → dataset vigente
+_datasets: Dict[str, DatasetCompartido] = {}
+_lock = threading.Lock()
+_locks_carga: Dict[str, threading.Lock] = {}
+
+
+def obtener_dataset(path: Path) -> DatasetCompartido:
+    """Devuelve el dataset compartido de `path`, reconstruyéndolo si cambió la versión del archivo.
+
+    Sólo un hilo reconstruye; mientras tanto los demás esperan y reciben el mismo objeto.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    clave = str(path.resolve())
+    version = version_dataset(path)
+
+    actual = _datasets.get(clave)
+    if actual is not None and actual.version == version:
+        return actual
+
+    with _lock:
+        lock_carga = _locks_carga.setdefault(clave, threading.Lock())
+    with lock_carga:
+        actual = _datasets.get(clave)
+        if actual is not None and actual.version == version:
+            return actual
+        try:
+            nuevo = _construir(path, version)
+        except Exception as e:
+            logger.exception("Error construyendo dataset compartido: %s", e)
+            raise DataLoadError(f"No se pudo cargar {path}: {e}")
+        # Reemplazo atómico: las sesiones que ya tienen la versión anterior la conservan
+        _datasets[clave] = nuevo
+        return nuevo
+
+
+def invalidar(path: Optional[Path] = None):
+    """Descarta el dataset de `path` (o todos) para forzar su recarga en el próximo acceso."""
+    with _lock:
+        if path is None:
+            _datasets.clear()
+        else:
+            _datasets.pop(str(Path(path).resolve()), None)
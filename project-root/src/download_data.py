@@ -5,7 +5,80 @@ import hashlib
 import json
 from datetime import datetime
 import processing
-import pandas as pd
+
+
+# Columnas esperadas en el CSV crudo (antes de processing.clean)
+EXPECTED_RAW = ("ANIO", "MES", "DPTO_HECHO_NEW", "PROV_HECHO", "DIST_HECHO", "P_MODALIDADES", "cantidad")
+
+# Filas de muestra leídas para validar el esquema
+FILAS_MUESTRA = 1000
+
+
+def mapear_columnas(columnas) -> dict:
+    """Propone un mapeo {columna del archivo: columna esperada} por palabras clave.
+
+    Sólo mapea columnas que no tengan ya un nombre esperado, y nunca asigna
+    dos columnas al mismo destino.
+    """
+    presentes = set(columnas)
+    rename_map = {}
+    for c in columnas:
+        if c in EXPECTED_RAW:
+            continue
+        cu = c.upper()
+        if "ANIO" in cu or "AÑO" in cu:
+            destino = "ANIO"
+        elif "MES" in cu:
+            destino = "MES"
+        elif "DEPARTA" in cu or "DPTO" in cu or "DEPARTAMENTO" in cu:
+            destino = "DPTO_HECHO_NEW"
+        elif "PROV" in cu:
+            destino = "PROV_HECHO"
+        elif "DIST" in cu:
+            destino = "DIST_HECHO"
+        elif "MODAL" in cu:
+            destino = "P_MODALIDADES"
+        elif "CANT" in cu or "CANTIDAD" in cu:
+            destino = "cantidad"
+        else:
+            continue
+        if destino not in presentes and destino not in rename_map.values():
+            rename_map[c] = destino
+    return rename_map
+
+
+def validar_esquema(path: Path, filas_muestra: int = FILAS_MUESTRA) -> dict:
+    """Lee sólo el encabezado y una muestra de filas y devuelve el resultado para metadata.json.
+
+    Returns:
+        dict con `column_mapping` (renombres a aplicar al leer), `schema_valid`
+        y `missing_columns` (columnas esperadas que siguen faltando tras el mapeo).
+    """
+    muestra = processing.leer_csv(path, nrows=filas_muestra, aplicar_mapeo=False)
+
+    rename_map = mapear_columnas(list(muestra.columns))
+    columnas = {rename_map.get(c, c) for c in muestra.columns}
+    faltantes = [c for c in EXPECTED_RAW if c not in columnas]
+    return {
+        "column_mapping": rename_map,
+        "schema_valid": not faltantes,
+        "missing_columns": faltantes,
+        "sample_rows": len(muestra),
+    }
+
+
+def mapeos_por_archivo(metadata_file: Path, nombre: str, mapeo: dict) -> dict:
+    """`column_mapping` para metadata.json: el `mapeo` del archivo `nombre` más los de descargas
+    anteriores cuyo archivo sigue en data/ (p. ej. los CSV mensuales leídos lado a lado).
+    """
+    try:
+        anterior = json.loads(metadata_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        anterior = {}
+    mapeos = {n: m for n, m in processing.mapeos_registrados(anterior).items()
+              if (metadata_file.parent / n).exists()}
+    mapeos[nombre] = mapeo
+    return mapeos
 
 
 def download_csv(
@@ -36,16 +109,19 @@ def download_csv(
     for attempt in range(1, max_retries + 1):
         try:
             print(f"Descargando CSV desde: {url} (intento {attempt})")
-            resp = requests.get(url, headers=headers, timeout=30)
-            resp.raise_for_status()
-
-            content = resp.content
-            with open(output_file, "wb") as f:
-                f.write(content)
+            # Descarga en streaming: se escribe a disco y se calcula el hash por bloques
+            hasher = hashlib.sha256()
+            size = 0
+            with requests.get(url, headers=headers, timeout=30, stream=True) as resp:
+                resp.raise_for_status()
+                with open(output_file, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
 
             # Calcular hash y crear metadata
-            sha256 = hashlib.sha256(content).hexdigest()
-            size = len(content)
+            sha256 = hasher.hexdigest()
             meta = {
                 "filename": output_file.name,
                 "url": url,
@@ -53,54 +129,25 @@ def download_csv(
                 "sha256": sha256,
                 "size_bytes": size,
             }
-            with open(metadata_file, "w", encoding="utf-8") as mf:
-                json.dump(meta, mf, ensure_ascii=False, indent=2)
 
-            # Intentar validar/estandarizar columnas del CSV descargado
+            # Validar el esquema leyendo sólo el encabezado y una muestra de filas.
+            # El archivo descargado no se modifica (el sha256 sigue siendo el del origen):
+            # el mapeo de columnas se guarda en metadata.json y se aplica al leer.
             try:
-                # Leer con las mismas funciones de processing para garantizar nombres esperados
-                try:
-                    raw = processing.load_raw(output_file)
-                except Exception:
-                    raw = pd.read_csv(output_file, encoding="latin1")
-
-                # Columnas esperadas en el raw antes de clean
-                expected_raw = {"ANIO", "MES", "DPTO_HECHO_NEW", "PROV_HECHO", "DIST_HECHO", "P_MODALIDADES", "cantidad"}
-                cols = set(raw.columns.str.upper())
-
-                if not expected_raw.issubset(cols):
-                    # Intentar mapear columnas por palabras clave
-                    rename_map = {}
-                    for c in raw.columns:
-                        cu = c.upper()
-                        if "ANIO" in cu or "AÑO" in cu:
-                            rename_map[c] = "ANIO"
-                        elif "MES" in cu:
-                            rename_map[c] = "MES"
-                        elif "DEPARTA" in cu or "DPTO" in cu or "DEPARTAMENTO" in cu:
-                            rename_map[c] = "DPTO_HECHO_NEW"
-                        elif "PROV" in cu:
-                            rename_map[c] = "PROV_HECHO"
-                        elif "DIST" in cu:
-                            rename_map[c] = "DIST_HECHO"
-                        elif "MODAL" in cu:
-                            rename_map[c] = "P_MODALIDADES"
-                        elif "CANT" in cu or "CANTIDAD" in cu:
-                            rename_map[c] = "cantidad"
-
-                    if rename_map:
-                        raw = raw.rename(columns=rename_map)
-                        # Guardar el CSV estandarizado (sobrescribir)
-                        raw.to_csv(output_file, index=False, encoding="utf-8")
-                        meta["columns_standardized"] = True
-                        with open(metadata_file, "w", encoding="utf-8") as mf:
-                            json.dump(meta, mf, ensure_ascii=False, indent=2)
-            except Exception:
+                meta.update(validar_esquema(output_file))
+            except Exception as e:
                 # No crítico; continuar
-                pass
+                print(f"Advertencia: no se pudo validar el esquema: {e}")
+            mapeo = meta.get("column_mapping") or {}
+            meta["column_mapping"] = mapeos_por_archivo(metadata_file, output_file.name, mapeo)
+
+            with open(metadata_file, "w", encoding="utf-8") as mf:
+                json.dump(meta, mf, ensure_ascii=False, indent=2)
 
             print(f"✓ Descarga completada: {output_file}")
             print(f"✓ Tamaño: {size / (1024*1024):.2f} MB")
+            if mapeo:
+                print(f"✓ Mapeo de columnas registrado: {mapeo}")
             return output_file
 
         except Exception as e:
@@ -0,0 +1,151 @@
+"""
+Exportación de datos filtrados a archivo (CSV, CSV comprimido con gzip o Parquet).
+Los datos se escriben por bloques directamente a disco, sin construir el
+archivo completo como cadena en memoria.
+"""
+
+import gzip
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from utils import log_time, logger
+from exceptions import ProcessingError
+
+# formato → (extensión, tipo MIME)
+FORMATOS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# Filas escritas por bloque (CSV) o por row group (Parquet)
+FILAS_POR_BLOQUE = 100_000
+
+# Archivos temporales de exportación de la app: los de sesiones abandonadas se borran pasada esta edad
+# (cada render del botón de descarga renueva la fecha del suyo, ver `tocar`)
+PREFIJO_TEMPORAL = "sidpol_export_"
+EDAD_MAXIMA_TEMPORAL = 3600
+# Las exportaciones de `cli.py export` sin --salida usan otro prefijo: nadie las borra
+PREFIJO_CLI = "sidpol_cli_export_"
+
+
+@log_time
+def exportar(df: pd.DataFrame, formato: str = "csv.gz", destino: Optional[Path] = None,
+             prefijo: str = PREFIJO_TEMPORAL) -> Path:
+    """Escribe `df` en `destino` (o en un archivo temporal) en el formato pedido y devuelve la ruta.
+
+    Args:
+        df: DataFrame a exportar.
+        formato: "csv", "csv.gz" o "parquet".
+        destino: ruta de salida; si es None se crea un archivo temporal que
+            el llamador debe borrar con `eliminar()` cuando ya no lo necesite.
+        prefijo: prefijo del archivo temporal; sólo los de `PREFIJO_TEMPORAL`
+            entran en `limpiar_temporales`.
+    """
+    if formato not in FORMATOS:
+        raise ProcessingError(f"Formato de exportación no soportado: {formato}")
+    extension, _ = FORMATOS[formato]
+    if destino is None:
+        limpiar_temporales()
+        fd, nombre = tempfile.mkstemp(prefix=prefijo, suffix=extension)
+        os.close(fd)
+        destino = Path(nombre)
+    destino = Path(destino)
+
+    try:
+        if formato == "parquet":
+            _escribir_parquet(df, destino)
+        else:
+            _escribir_csv(df, destino, comprimir=formato == "csv.gz")
+        logger.info("Exportación %s: %s filas → %s (%.1f MB)",
+                    formato, len(df), destino.name, destino.stat().st_size / 1024 / 1024)
+        return destino
+    except Exception as e:
+        eliminar(destino)
+        logger.exception("Error exportando datos: %s", e)
+        raise ProcessingError(f"Error exportando datos ({formato}): {e}")
+
+
+def _escribir_csv(df: pd.DataFrame, destino: Path, comprimir: bool):
+    abrir = (lambda p: gzip.open(p, "wt", encoding="utf-8", newline="", compresslevel=6)) if comprimir \
+        else (lambda p: open(p, "w", encoding="utf-8", newline=""))
+    with abrir(destino) as f:
+        if df.empty:
+            df.to_csv(f, index=False)
+            return
+        for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+            df.iloc[inicio:inicio + FILAS_POR_BLOQUE].to_csv(f, header=inicio == 0, index=False)
+
+
+def _escribir_parquet(df: pd.DataFrame, destino: Path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ProcessingError(f"Exportar a Parquet requiere pyarrow: {e}")
+
+    writer = None
+    try:
+        for inicio in range(0, max(len(df), 1), FILAS_POR_BLOQUE):
+            bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+            tabla = pa.Table.from_pandas(bloque, preserve_index=False,
+                                         schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(str(destino), tabla.schema, compression="zstd")
+            writer.write_table(tabla)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def eliminar(path: Optional[Path]):
+    """Borra un archivo exportado (ignora si ya no existe)."""
+    if path:
+        try:
+            Path(path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("No se pudo borrar exportación %s: %s", path, e)
+
+
+def tocar(path: Path) -> Optional[int]:
+    """Renueva la fecha de un archivo exportado (así `limpiar_temporales` no lo borra) y devuelve
+    su tamaño en bytes, o None si ya no existe."""
+    try:
+        os.utime(path)
+        return Path(path).stat().st_size
+    except OSError:
+        return None
+
+
+def leer(path: Path, df: pd.DataFrame, formato: str) -> bytes:
+    """Contenido de un archivo exportado; si ya no existe (p. ej. lo borró la limpieza) se regenera desde `df`."""
+    try:
+        return Path(path).read_bytes()
+    except FileNotFoundError:
+        logger.warning("Exportación %s ya no existe; se vuelve a generar", Path(path).name)
+    nuevo = exportar(df, formato)
+    try:
+        return nuevo.read_bytes()
+    finally:
+        eliminar(nuevo)
+
+
+def limpiar_temporales(edad_maxima: float = EDAD_MAXIMA_TEMPORAL) -> int:
+    """Borra las exportaciones temporales con más de `edad_maxima` segundos y devuelve cuántas borró."""
+    limite = time.time() - edad_maxima
+    borrados = 0
+    for path in Path(tempfile.gettempdir()).glob(PREFIJO_TEMPORAL + "*"):
+        try:
+            if path.stat().st_mtime < limite:
+                path.unlink()
+                borrados += 1
+        except OSError:
+            pass  # otra sesión la borró o no es accesible
+    if borrados:
+        logger.info("Exportaciones temporales antiguas borradas: %s", borrados)
+    return borrados
@@ -0,0 +1,156 @@
+"""
+Instantánea precalculada de la vista por defecto del dashboard (primer render).
+
+Una sesión nueva ve primero el filtro por defecto: último año, las tres primeras
+modalidades, todos los departamentos y meses 1–12. Sus KPIs, agregados, la
+primera página de la tabla, la predicción y las opciones de los selectores se
+guardan en data/snapshot/ como un JSON pequeño por versión del dataset. La app
+lo dibuja sin cargar el dataset y sólo lo carga cuando el usuario cambia un filtro.
+"""
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import processing
+from utils import log_time, logger
+
+SNAPSHOT_DIR = Path(__file__).resolve().parents[1] / "data" / "snapshot"
+
+# Primera página de la tabla (tamaño por defecto de components.tabla_paginada) y su orden por defecto
+FILAS_TABLA = 100
+ORDEN_TABLA = (["MES", "cantidad"], [True, False])
+COLUMNAS_TABLA = ["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"]
+
+# Valor inicial del slider "Meses a predecir"
+MESES_PREDICCION = 3
+
+AGREGADOS = ("by_modalidad", "monthly_trend", "top_departamentos")
+
+
+def filtro_por_defecto(opciones: dict) -> dict:
+    """Filtro que producen los controles de `seccion_filtros` sin tocar."""
+    return dict(anio=opciones["anios"][-1] if opciones["anios"] else None,
+                modalidades=opciones["modalidades"][:3], dpto="Todos", prov=None,
+                mes_range=(1, 12), periodo=None, dist=None)
+
+
+def _normalizar(filtro: dict) -> dict:
+    return {k: tuple(v) if isinstance(v, list) else v for k, v in filtro.items()}
+
+
+@dataclass(frozen=True)
+class Instantanea:
+    """Vista por defecto de una versión del dataset; ofrece las opciones de selectores de `DatasetCompartido`."""
+
+    version: str
+    opciones: dict = field(repr=False)
+    claves_periodo: Tuple[int, ...] = field(repr=False)
+    filtro: dict
+    total: int
+    filas: int
+    # nombre → DataFrame: "by_modalidad", "monthly_trend", "top_departamentos", "tabla", "prediccion"
+    tablas: Dict[str, pd.DataFrame] = field(repr=False)
+
+    def provincias(self, dpto: str) -> List[str]:
+        return list(self.opciones["jerarquia"].get(dpto, {}))
+
+    def distritos(self, dpto: str, prov: Optional[str] = None) -> List[str]:
+        if prov:
+            return self.opciones["jerarquia"].get(dpto, {}).get(prov, [])
+        return self.opciones["distritos"].get(dpto, [])
+
+    def periodos(self) -> List[Tuple[int, int]]:
+        return [processing.periodo_de_clave(c) for c in self.claves_periodo]
+
+    def es_defecto(self, filtro: dict) -> bool:
+        """¿`filtro` es el filtro precalculado?"""
+        return _normalizar(filtro) == _normalizar(self.filtro)
+
+
+def _ruta(version: str, directorio: Path) -> Path:
+    return Path(directorio) / ("vista_" + hashlib.sha1(version.encode("utf-8")).hexdigest()[:16] + ".json")
+
+
+def _tabla_json(df: Optional[pd.DataFrame]) -> Optional[dict]:
+    if df is None:
+        return None
+    return json.loads(df.to_json(orient="split", index=False, force_ascii=False))
+
+
+@log_time
+def construir_instantanea(ds, directorio: Path = SNAPSHOT_DIR) -> Instantanea:
+    """Calcula la vista por defecto del dataset compartido `ds` y la guarda en `directorio`."""
+    import analysis
+
+    filtro = filtro_por_defecto(ds.opciones)
+    df_f = ds.filtrar(filtro["anio"], filtro["modalidades"], filtro["dpto"], filtro["prov"],
+                      filtro["mes_range"], filtro["periodo"])
+    tablas = {nombre: getattr(processing, nombre)(df_f) for nombre in AGREGADOS} if len(df_f) else {}
+    perm = processing.permutacion_orden(df_f, *ORDEN_TABLA)
+    tablas["tabla"] = df_f[COLUMNAS_TABLA].iloc[perm[:FILAS_TABLA]]
+    tablas["prediccion"] = analysis.predict_monthly_trend(df_f, months_ahead=MESES_PREDICCION)
+
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    path = _ruta(ds.version, directorio)
+    contenido = {
+        "version": ds.version,
+        "opciones": ds.opciones,
+        "claves_periodo": [int(c) for c in ds.claves_periodo],
+        "filtro": filtro,
+        "total": int(df_f["cantidad"].sum()),
+        "filas": len(df_f),
+        "tablas": {nombre: _tabla_json(df) for nombre, df in tablas.items()},
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(contenido, ensure_ascii=False, default=str), encoding="utf-8")
+    tmp.replace(path)
+
+    # Borrar instantáneas de versiones anteriores
+    for vieja in directorio.glob("vista_*.json"):
+        if vieja != path:
+            vieja.unlink(missing_ok=True)
+    logger.info("Instantánea de la vista por defecto: %s (%.1f KB)", ds.version, path.stat().st_size / 1024)
+    return abrir_instantanea(ds.version, directorio)
+
+
+def abrir_instantanea(version: str, directorio: Path = SNAPSHOT_DIR) -> Optional[Instantanea]:
+    """Instantánea guardada de `version`, o None si no existe o está dañada."""
+    path = _ruta(version, directorio)
+    if not path.exists():
+        return None
+    try:
+        c = json.loads(path.read_text(encoding="utf-8"))
+        tablas = {nombre: pd.DataFrame(t["data"], columns=t["columns"])
+                  for nombre, t in c["tablas"].items() if t is not None}
+        return Instantanea(version=c["version"], opciones=c["opciones"], claves_periodo=tuple(c["claves_periodo"]),
+                           filtro=_normalizar(c["filtro"]), total=c["total"], filas=c["filas"], tablas=tablas)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Instantánea ilegible (%s); se reconstruirá", e)
+        return None
+
+
+# Instantánea vigente (una por proceso)
+_instantaneas: Dict[str, Instantanea] = {}
+_lock = threading.Lock()
+
+
+def obtener_instantanea(version: str) -> Optional[Instantanea]:
+    """Instantánea de `version` desde memoria o disco, sin construirla (None si no existe)."""
+    inst = _instantaneas.get(version)
+    if inst is not None:
+        return inst
+    with _lock:
+        inst = _instantaneas.get(version)
+        if inst is None:
+            inst = abrir_instantanea(version)
+            if inst is not None:
+                _instantaneas.clear()
+                _instantaneas[version] = inst
+    return inst
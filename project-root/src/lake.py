@@ -0,0 +1,172 @@
+"""
+Almacén columnar particionado (Parquet) del dataset limpio en data/lake/.
+
+Estructura: data/lake/anio=AAAA/mes=MM/part.parquet, más un manifiesto
+(_manifest.json) con el hash y las filas de cada partición. Los lectores
+sólo abren las particiones que cubren el año y el rango de meses pedidos,
+y una nueva versión mensual del CSV sólo escribe las particiones que cambiaron.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+import processing
+from database import hashes_particiones
+from utils import log_time, logger
+from exceptions import DataLoadError, ProcessingError
+
+LAKE_DIR = Path(__file__).resolve().parents[1] / "data" / "lake"
+MANIFIESTO = "_manifest.json"
+OPCIONES = "_opciones.json"
+
+
+def ruta_particion(anio: int, mes: int, directorio: Path = LAKE_DIR) -> Path:
+    return Path(directorio) / f"anio={anio}" / f"mes={mes:02d}" / "part.parquet"
+
+
+def leer_manifiesto(directorio: Path = LAKE_DIR) -> dict:
+    """Manifiesto del lago: {"fuente": versión del CSV de origen, "particiones": {"AAAA-MM": {...}}}."""
+    path = Path(directorio) / MANIFIESTO
+    if not path.exists():
+        return {"fuente": None, "particiones": {}}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning("Manifiesto del lago ilegible (%s); se reconstruirá", e)
+        return {"fuente": None, "particiones": {}}
+
+
+def _escribir_atomico(path: Path, escribir):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    escribir(tmp)
+    os.replace(tmp, path)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        return pa, pq
+    except ImportError as e:
+        raise ProcessingError(f"El lago Parquet requiere pyarrow: {e}")
+
+
+@log_time
+def escribir_particiones(df: pd.DataFrame, fuente: Optional[str] = None, directorio: Path = LAKE_DIR) -> dict:
+    """Escribe en el lago las particiones (año, mes) de `df` (limpio) cuyo contenido cambió.
+
+    `df` es una versión completa (acumulada) del dataset: el lago queda igual a ella.
+
+    Returns:
+        Reporte con las particiones "escritas", el número "sin_cambios" y las
+        "eliminadas" (meses del lago ausentes en `df`), como "AAAA-MM".
+    """
+    pa, pq = _pyarrow()
+    directorio = Path(directorio)
+    manifiesto = leer_manifiesto(directorio)
+    actuales = manifiesto.get("particiones", {})
+    hashes = hashes_particiones(df)
+
+    cambiadas = [
+        (anio, mes) for (anio, mes), (h, _) in sorted(hashes.items())
+        if actuales.get(f"{anio}-{mes:02d}", {}).get("hash") != h
+    ]
+    if cambiadas:
+        grupos = df.groupby([df["AÑO"].astype("int64"), df["MES"].astype("int64")], sort=False).indices
+        for anio, mes in cambiadas:
+            tabla = pa.Table.from_pandas(df.take(grupos[(anio, mes)]), preserve_index=False)
+            _escribir_atomico(ruta_particion(anio, mes, directorio),
+                              lambda tmp: pq.write_table(tabla, str(tmp), compression="zstd"))
+            h, filas = hashes[(anio, mes)]
+            actuales[f"{anio}-{mes:02d}"] = {"hash": h, "filas": filas}
+
+    # El lago refleja la versión escrita: los meses que ya no están en ella se eliminan
+    presentes = {f"{anio}-{mes:02d}" for anio, mes in hashes}
+    eliminadas = sorted(clave for clave in actuales if clave not in presentes)
+    for clave in eliminadas:
+        anio, mes = (int(x) for x in clave.split("-"))
+        ruta_particion(anio, mes, directorio).unlink(missing_ok=True)
+        del actuales[clave]
+
+    # Opciones de los selectores de esta versión (ver processing.opciones_filtros)
+    opciones = {"fuente": fuente, **processing.opciones_filtros(df)}
+    _escribir_atomico(directorio / OPCIONES,
+                      lambda tmp: tmp.write_text(json.dumps(opciones, ensure_ascii=False), encoding="utf-8"))
+
+    manifiesto = {"fuente": fuente, "particiones": dict(sorted(actuales.items()))}
+    _escribir_atomico(directorio / MANIFIESTO,
+                      lambda tmp: tmp.write_text(json.dumps(manifiesto, indent=2), encoding="utf-8"))
+    escritas = [f"{anio}-{mes:02d}" for anio, mes in cambiadas]
+    logger.info("Lago Parquet: %s particiones escritas, %s sin cambios, %s eliminadas",
+                len(escritas), len(hashes) - len(escritas), len(eliminadas))
+    return {"escritas": escritas, "sin_cambios": len(hashes) - len(escritas), "eliminadas": eliminadas}
+
+
+@log_time
+def actualizar_desde_csv(csv_path: Path, directorio: Path = LAKE_DIR) -> dict:
+    """Lee y limpia `csv_path` y reescribe en el lago sólo los meses nuevos, modificados o eliminados."""
+    from dataset import version_dataset
+
+    csv_path = Path(csv_path)
+    df = processing.clean(processing.load_raw(csv_path))
+    return escribir_particiones(df, fuente=version_dataset(csv_path), directorio=directorio)
+
+
+def particiones(anio=None, mes_range: Optional[Tuple[int, int]] = None,
+                directorio: Path = LAKE_DIR, periodo=None) -> List[Tuple[int, int]]:
+    """Particiones (año, mes) del manifiesto que cumplen el filtro de año, rango de meses y periodo."""
+    seleccion = []
+    for clave in leer_manifiesto(directorio).get("particiones", {}):
+        a, m = (int(x) for x in clave.split("-"))
+        if anio is not None and a != int(anio):
+            continue
+        if mes_range is not None and not (mes_range[0] <= m <= mes_range[1]):
+            continue
+        if periodo is not None and not (tuple(periodo[0]) <= (a, m) <= tuple(periodo[1])):
+            continue
+        seleccion.append((a, m))
+    return sorted(seleccion)
+
+
+@log_time
+def leer(anio=None, mes_range: Optional[Tuple[int, int]] = None, columnas: Optional[List[str]] = None,
+         directorio: Path = LAKE_DIR, periodo=None) -> pd.DataFrame:
+    """Lee del lago sólo las particiones que cubren `anio`, `mes_range` y `periodo` (None = todas)."""
+    pa, pq = _pyarrow()
+    seleccion = particiones(anio, mes_range, directorio, periodo)
+    if not seleccion:
+        raise DataLoadError(f"El lago en {directorio} no tiene particiones para año={anio}, meses={mes_range}")
+    try:
+        tablas = [pq.read_table(str(ruta_particion(a, m, directorio)), columns=columnas) for a, m in seleccion]
+        df = pa.concat_tables(tablas).to_pandas()
+    except Exception as e:
+        logger.exception("Error leyendo el lago Parquet: %s", e)
+        raise DataLoadError(f"No se pudo leer el lago {directorio}: {e}")
+    logger.debug("Lago: %s particiones leídas (%s filas)", len(seleccion), len(df))
+    return df
+
+
+def filtrar(anio, modalidades, dpto, prov, mes_range, periodo=None, directorio: Path = LAKE_DIR) -> pd.DataFrame:
+    """Igual que `processing.filter_df`, pero leyendo del disco sólo las particiones necesarias."""
+    df = leer(anio, mes_range, directorio=directorio, periodo=periodo)
+    return processing.filter_df(df, anio, modalidades, dpto, prov, mes_range, periodo)
+
+
+def leer_opciones(version: str, directorio: Path = LAKE_DIR) -> Optional[dict]:
+    """Opciones de los selectores guardadas para `version`, o None si no existen o son de otra versión."""
+    path = Path(directorio) / OPCIONES
+    try:
+        opciones = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return opciones if opciones.pop("fuente", None) == version else None
+
+
+def vigente(version: str, directorio: Path = LAKE_DIR) -> bool:
+    """True si el lago se construyó a partir de la versión `version` del CSV."""
+    return leer_manifiesto(directorio).get("fuente") == version
@@ -0,0 +1,160 @@
+"""
+Registro de métricas en proceso para la aplicación SIDPOL.
+Mantiene un histograma de latencias por función (o sección del dashboard),
+con conteos y errores, exportable en texto Prometheus y en JSON.
+"""
+
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Dict
+
+# Límites superiores (en segundos) de los buckets del histograma
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Cantidad de observaciones recientes usadas para calcular percentiles
+VENTANA_PERCENTILES = 2048
+
+
+class Histograma:
+    """Histograma de latencias de una función: buckets acumulables + ventana para percentiles."""
+
+    def __init__(self, buckets: tuple = BUCKETS, ventana: int = VENTANA_PERCENTILES):
+        self.buckets = buckets
+        self.conteo_buckets = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.muestras = deque(maxlen=ventana)
+
+    def observar(self, segundos: float, error: bool = False):
+        self.conteo_buckets[bisect_left(self.buckets, segundos)] += 1
+        self.count += 1
+        self.sum += segundos
+        self.max = max(self.max, segundos)
+        if error:
+            self.errors += 1
+        self.muestras.append(segundos)
+
+    def percentil(self, q: float) -> float:
+        """Percentil `q` (0–100) sobre la ventana de observaciones recientes."""
+        if not self.muestras:
+            return 0.0
+        ordenadas = sorted(self.muestras)
+        idx = min(len(ordenadas) - 1, max(0, math.ceil(q / 100 * len(ordenadas)) - 1))
+        return ordenadas[idx]
+
+    def resumen(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_s": round(self.sum, 6),
+            "mean_s": round(self.sum / self.count, 6) if self.count else 0.0,
+            "max_s": round(self.max, 6),
+            "p50_s": round(self.percentil(50), 6),
+            "p95_s": round(self.percentil(95), 6),
+            "p99_s": round(self.percentil(99), 6),
+            "buckets": {
+                **{str(le): n for le, n in zip(self.buckets, self._acumulado())},
+                "+Inf": self.count,
+            },
+        }
+
+    def _acumulado(self):
+        total = 0
+        for n in self.conteo_buckets[:-1]:
+            total += n
+            yield total
+
+
+class MetricsRegistry:
+    """Registro thread-safe de histogramas por nombre de función/sección."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas: Dict[str, Histograma] = {}
+        self.iniciado = time.time()
+
+    def observe(self, nombre: str, segundos: float, error: bool = False):
+        with self._lock:
+            hist = self._histogramas.get(nombre)
+            if hist is None:
+                hist = self._histogramas[nombre] = Histograma()
+            hist.observar(segundos, error)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Copia consistente de todas las métricas, ordenada por nombre."""
+        with self._lock:
+            return {nombre: h.resumen() for nombre, h in sorted(self._histogramas.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histogramas.clear()
+            self.iniciado = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"generated_at": time.time(), "started_at": self.iniciado, "functions": self.snapshot()},
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    def to_prometheus(self) -> str:
+        """Formato de exposición de texto de Prometheus (histograma + cuantiles + errores)."""
+        lineas = [
+            "# HELP sidpol_function_duration_seconds Latencia de funciones/secciones SIDPOL.",
+            "# TYPE sidpol_function_duration_seconds histogram",
+        ]
+        snap = self.snapshot()
+        for nombre, r in snap.items():
+            etiqueta = _escapar(nombre)
+            for le, n in r["buckets"].items():
+                lineas.append(f'sidpol_function_duration_seconds_bucket{{function="{etiqueta}",le="{le}"}} {n}')
+            lineas.append(f'sidpol_function_duration_seconds_sum{{function="{etiqueta}"}} {r["sum_s"]}')
+            lineas.append(f'sidpol_function_duration_seconds_count{{function="{etiqueta}"}} {r["count"]}')
+        lineas += [
+            "# HELP sidpol_function_duration_quantile_seconds Percentiles sobre la ventana reciente.",
+            "# TYPE sidpol_function_duration_quantile_seconds gauge",
+        ]
+        for nombre, r in snap.items():
+            etiqueta = _escapar(nombre)
+            for q, clave in (("0.5", "p50_s"), ("0.95", "p95_s"), ("0.99", "p99_s")):
+                lineas.append(f'sidpol_function_duration_quantile_seconds{{function="{etiqueta}",quantile="{q}"}} {r[clave]}')
+        lineas += [
+            "# HELP sidpol_function_errors_total Ejecuciones que terminaron en excepción.",
+            "# TYPE sidpol_function_errors_total counter",
+        ]
+        for nombre, r in snap.items():
+            lineas.append(f'sidpol_function_errors_total{{function="{_escapar(nombre)}"}} {r["errors"]}')
+        return "\n".join(lineas) + "\n"
+
+    def export(self, directorio: Path, prefijo: str = "metrics") -> tuple[Path, Path]:
+        """Escribe `<prefijo>.prom` y `<prefijo>.json` en `directorio` y devuelve sus rutas."""
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        prom_path = directorio / f"{prefijo}.prom"
+        json_path = directorio / f"{prefijo}.json"
+        _escribir_atomico(prom_path, self.to_prometheus())
+        _escribir_atomico(json_path, self.to_json())
+        return prom_path, json_path
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escribir_atomico(path: Path, contenido: str):
+    # Escribir a temporal y reemplazar para que un scraper nunca lea un archivo a medias
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(contenido, encoding="utf-8")
+    tmp.replace(path)
+
+
+# Registro global del proceso (compartido por todas las sesiones de Streamlit)
+registry = MetricsRegistry()
+
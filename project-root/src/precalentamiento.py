@@ -0,0 +1,305 @@
+"""
+Precalentamiento de cachés en segundo plano tras cada versión nueva del dataset.
+
+Después de una descarga, una ingesta o "🔄 Actualizar caché" las cachés están
+frías y los primeros usuarios de cada filtro popular pagaban el cálculo completo.
+Este módulo:
+
+- cuenta qué años, departamentos y selecciones de modalidades usan las sesiones
+  (`registrar_uso`, persistido en logs/uso_filtros.json);
+- guarda en una caché compartida entre sesiones el resultado de cada filtro:
+  posiciones de sus filas en el dataset compartido (no una copia de ellas),
+  total y agregados de los gráficos (`resultado`);
+- al ver una versión nueva del dataset (`programar`) carga en un hilo el dataset,
+  el cubo, la sinopsis aproximada, el índice de nombres y la instantánea, y
+  calcula el resultado de los filtros más usados: cada año usado y cada
+  departamento usado en el último año, ordenados por frecuencia.
+
+Sin usos registrados sólo se precalienta el filtro por defecto.
+"""
+
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import aproximado
+import busqueda
+import cube
+import dataset
+import instantanea
+import processing
+from metrics import registry
+from utils import LOG_DIR, log_time, logger
+
+USO_PATH = LOG_DIR / "uso_filtros.json"
+
+# El conteo de usos se escribe a disco a lo sumo cada INTERVALO_GUARDADO segundos
+INTERVALO_GUARDADO = 30.0
+
+# Filtros precalentados por versión y resultados retenidos (LRU, todas las versiones)
+MAX_FILTROS = 40
+MAX_RESULTADOS = 64
+
+
+# --- Frecuencias de uso ---
+
+_uso: Optional[Dict[str, Counter]] = None
+_ultimo_guardado = 0.0
+_lock_uso = threading.Lock()
+
+
+def _cargar_uso() -> Dict[str, Counter]:
+    uso = {"anios": Counter(), "departamentos": Counter(), "modalidades": Counter()}
+    try:
+        guardado = json.loads(USO_PATH.read_text(encoding="utf-8"))
+        for nombre, conteos in uso.items():
+            conteos.update(guardado.get(nombre, {}))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning("Uso de filtros ilegible (%s); se empieza de cero", e)
+    return uso
+
+
+def _guardar_uso():
+    global _ultimo_guardado
+    contenido = json.dumps({nombre: dict(conteos) for nombre, conteos in _uso.items()}, ensure_ascii=False)
+    try:
+        USO_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = USO_PATH.with_name(USO_PATH.name + ".tmp")
+        tmp.write_text(contenido, encoding="utf-8")
+        tmp.replace(USO_PATH)
+        _ultimo_guardado = time.monotonic()
+    except OSError as e:
+        logger.warning("No se pudo guardar el uso de filtros: %s", e)
+
+
+def registrar_uso(filtro: dict):
+    """Cuenta un filtro aplicado por una sesión (año, departamento y modalidades elegidas)."""
+    global _uso
+    with _lock_uso:
+        if _uso is None:
+            _uso = _cargar_uso()
+        if filtro.get("anio") is not None:
+            _uso["anios"][str(filtro["anio"])] += 1
+        if filtro.get("dpto") and filtro["dpto"] != "Todos":
+            _uso["departamentos"][filtro["dpto"]] += 1
+        _uso["modalidades"][json.dumps(list(filtro.get("modalidades") or []), ensure_ascii=False)] += 1
+        if time.monotonic() - _ultimo_guardado >= INTERVALO_GUARDADO:
+            _guardar_uso()
+
+
+def frecuencias() -> Dict[str, Counter]:
+    """Copia de los conteos de uso: "anios", "departamentos" y "modalidades" (lista en JSON)."""
+    global _uso
+    with _lock_uso:
+        if _uso is None:
+            _uso = _cargar_uso()
+        return {nombre: Counter(conteos) for nombre, conteos in _uso.items()}
+
+
+def filtros_calientes(opciones: dict, uso: Dict[str, Counter], limite: int = MAX_FILTROS) -> List[dict]:
+    """Filtros a precalentar para un dataset con `opciones`, del más al menos usado.
+
+    Parten del filtro por defecto con la selección de modalidades más usada; se
+    varía el año (cada año usado) o el departamento dentro del último año (cada
+    departamento usado), con los valores que esos selectores dejan al elegirlos.
+    """
+    base = instantanea.filtro_por_defecto(opciones)
+    validas = set(opciones["modalidades"])
+    for seleccion, _ in uso["modalidades"].most_common():
+        mods = json.loads(seleccion)
+        if all(m in validas for m in mods):
+            base["modalidades"] = mods
+            break
+
+    anios, dptos = set(opciones["anios"]), set(opciones["departamentos"])
+    candidatos = [(n, dict(base, anio=int(a))) for a, n in uso["anios"].items() if int(a) in anios]
+    candidatos += [(n, dict(base, dpto=d, prov="Todas")) for d, n in uso["departamentos"].items() if d in dptos]
+    candidatos.sort(key=lambda c: -c[0])
+
+    filtros, vistos = [], set()
+    for filtro in [base] + [f for _, f in candidatos]:
+        clave = clave_filtro("", filtro)
+        if clave not in vistos:
+            vistos.add(clave)
+            filtros.append(filtro)
+    return filtros[:limite]
+
+
+# --- Resultados de filtros compartidos entre sesiones ---
+
+def clave_filtro(version: str, filtro: dict) -> str:
+    """Identifica el contenido de un filtro sobre una versión del dataset."""
+    return repr((version, filtro["anio"], list(filtro["modalidades"] or []), filtro["dpto"], filtro["prov"],
+                 filtro["mes_range"], filtro["periodo"], filtro["dist"]))
+
+
+@dataclass(frozen=True)
+class ResultadoFiltro:
+    """Filas de un filtro, su total y los agregados de los gráficos principales."""
+
+    df: pd.DataFrame = field(repr=False)
+    total: int
+    # nombre (ver instantanea.AGREGADOS) → DataFrame, o la excepción que dio al calcularlo
+    agregados: Dict[str, object] = field(repr=False)
+
+    def agregado(self, nombre: str) -> pd.DataFrame:
+        valor = self.agregados[nombre]
+        if isinstance(valor, Exception):
+            raise valor
+        return valor
+
+
+def filtrar(ds, filtro: dict) -> pd.DataFrame:
+    """Filas del dataset que cumplen `filtro` (argumentos de `ds.filtrar` más el distrito)."""
+    df_f = ds.filtrar(filtro["anio"], filtro["modalidades"], filtro["dpto"], filtro["prov"],
+                      filtro["mes_range"], filtro["periodo"])
+    # Filtro adicional de distrito si se aplicó
+    if filtro["dist"] and "DISTRITO" in df_f.columns:
+        df_f = df_f[df_f["DISTRITO"] == filtro["dist"]]
+    return df_f
+
+
+def agregados_cubo(ds, filtro: dict):
+    """Agregados del filtro sobre el cubo OLAP, o None si el filtro no lo permite o el cubo falla.
+
+    Provincia y distrito no forman parte del cubo: con esos filtros se agrega sobre las filas.
+    """
+    if (filtro["prov"] and filtro["prov"] != "Todas") or filtro["dist"]:
+        return None
+    try:
+        return cube.obtener_cubo(ds).agregados(filtro["anio"], filtro["modalidades"], filtro["dpto"],
+                                               filtro["mes_range"], filtro["periodo"])
+    except Exception as e:
+        logger.warning("Cubo OLAP no disponible, se agrega sobre las filas: %s", e)
+        return None
+
+
+def calcular(ds, filtro: dict) -> ResultadoFiltro:
+    df_f = filtrar(ds, filtro)
+    cubo = agregados_cubo(ds, filtro)
+    agregados = {}
+    for nombre in instantanea.AGREGADOS:
+        try:
+            agregados[nombre] = getattr(cubo, nombre)() if cubo is not None else getattr(processing, nombre)(df_f)
+        except Exception as e:
+            agregados[nombre] = e
+    total = cubo.total() if cubo is not None else int(df_f["cantidad"].sum())
+    return ResultadoFiltro(df=df_f, total=total, agregados=agregados)
+
+
+@dataclass(frozen=True)
+class _Guardado:
+    """Lo que retiene la caché por filtro: posiciones de las filas en `ds.df`, total y agregados."""
+
+    posiciones: np.ndarray = field(repr=False)
+    total: int
+    agregados: Dict[str, object] = field(repr=False)
+
+
+def _filas(ds, posiciones: np.ndarray) -> pd.DataFrame:
+    """Filas de `ds` en `posiciones` (crecientes); un tramo contiguo es una vista sin copia."""
+    if len(posiciones) and posiciones[-1] - posiciones[0] + 1 == len(posiciones):
+        return ds.df.iloc[int(posiciones[0]):int(posiciones[-1]) + 1]
+    return ds.df.take(posiciones)
+
+
+# clave_filtro → _Guardado. Guardar copias de las filas duplicaría el dataset compartido por cada
+# filtro; las posiciones ocupan 4 bytes por fila y el DataFrame se rehace con `_filas` al pedirlo.
+_resultados: "OrderedDict[str, _Guardado]" = OrderedDict()
+_lock_resultados = threading.Lock()
+
+
+def resultado(ds, filtro: dict) -> ResultadoFiltro:
+    """Resultado de `filtro` sobre el dataset compartido `ds`, desde la caché o recién calculado."""
+    clave = clave_filtro(ds.version, filtro)
+    with _lock_resultados:
+        guardado = _resultados.get(clave)
+        if guardado is not None:
+            _resultados.move_to_end(clave)
+    if guardado is not None:
+        return ResultadoFiltro(df=_filas(ds, guardado.posiciones), total=guardado.total,
+                               agregados=guardado.agregados)
+    # Fuera del lock: dos sesiones con el mismo filtro frío pueden calcularlo a la vez
+    res = calcular(ds, filtro)
+    # El DataFrame compartido tiene índice 0..n-1: las etiquetas de las filas son sus posiciones
+    guardado = _Guardado(posiciones=res.df.index.to_numpy(dtype=np.int32), total=res.total,
+                         agregados=res.agregados)
+    with _lock_resultados:
+        _resultados[clave] = guardado
+        while len(_resultados) > MAX_RESULTADOS:
+            _resultados.popitem(last=False)
+    return res
+
+
+# --- Programación del precalentamiento ---
+
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sidpol-precalentar")
+# versión del dataset → tarea de precalentamiento (una por versión)
+_programados: Dict[str, Future] = {}
+_lock_programados = threading.Lock()
+
+
+def _paso(nombre: str, funcion, *args):
+    try:
+        funcion(*args)
+    except Exception as e:
+        logger.warning("Precalentamiento: %s falló: %s", nombre, e)
+
+
+@log_time
+def precalentar(path: Path) -> dict:
+    """Carga el dataset de `path` y calienta sus cachés y los filtros más usados."""
+    inicio = time.perf_counter()
+    ds = dataset.obtener_dataset(Path(path))
+    _paso("cubo", cube.obtener_cubo, ds)
+    _paso("sinopsis", aproximado.obtener_sinopsis, ds)
+    _paso("índice de nombres", busqueda.obtener_indice, ds)
+    if instantanea.obtener_instantanea(ds.version) is None:
+        _paso("instantánea", instantanea.construir_instantanea, ds)
+
+    filtros = filtros_calientes(ds.opciones, frecuencias())
+    for filtro in filtros:
+        _paso(clave_filtro(ds.version, filtro), resultado, ds, filtro)
+    with _lock_uso:
+        if _uso is not None:
+            _guardar_uso()
+
+    segundos = time.perf_counter() - inicio
+    registry.observe("precalentamiento", segundos)
+    logger.info("Precalentamiento de %s: %s filtros en %.2fs", ds.version, len(filtros), segundos)
+    return {"version": ds.version, "filtros": len(filtros), "segundos": round(segundos, 3)}
+
+
+def programar(path: Path) -> Optional[Future]:
+    """Precalienta en segundo plano la versión actual de `path` (una vez por versión).
+
+    Devuelve la tarea, o None si el archivo no existe.
+    """
+    try:
+        version = dataset.version_dataset(Path(path))
+    except OSError:
+        return None
+    with _lock_programados:
+        futuro = _programados.get(version)
+        if futuro is None:
+            futuro = _ejecutor.submit(precalentar, Path(path))
+            _programados[version] = futuro
+        return futuro
+
+
+def invalidar():
+    """Descarta los resultados guardados; la próxima `programar` vuelve a precalentar."""
+    with _lock_resultados:
+        _resultados.clear()
+    with _lock_programados:
+        _programados.clear()
@@ -1,7 +1,11 @@
+import codecs
+import importlib.util
+import json
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from typing import Optional, List
-from utils import log_time, logger, handle_errors
+from utils import log_time, logger, handle_errors, FRECUENTE
 from exceptions import ProcessingError, DataLoadError, ValidationError
 
 
@@ -22,13 +26,13 @@ def data_path(filename: Optional[str] = None) -> Path:
     if candidates:
         # Devolver el más reciente (por modificación)
         latest = max(candidates, key=lambda p: p.stat().st_mtime)
-        logger.debug(f"Archivo de datos más reciente: {latest.name}")
+        logger.debug("Archivo de datos más reciente: %s", latest.name)
         return latest
 
     # Nombre histórico presente en el repo (septiembre)
     sept_path = data_dir / "DATASET_Denuncias_Policiales_Enero 2018 a Setiembre 2025.csv"
     if sept_path.exists():
-        logger.debug(f"Usando archivo histórico: {sept_path.name}")
+        logger.debug("Usando archivo histórico: %s", sept_path.name)
         return sept_path
 
     # Nombre esperado cuando se descargue la versión más nueva (octubre)
@@ -43,19 +47,114 @@ def list_data_files() -> List[Path]:
         return []
     candidates = list(data_dir.glob("DATASET_Denuncias_Policiales*.csv"))
     result = sorted(candidates, key=lambda p: p.stat().st_mtime, reverse=True)
-    logger.debug(f"Encontrados {len(result)} archivos de datos")
+    logger.debug("Encontrados %s archivos de datos", len(result))
     return result
 
 
+def mapeos_registrados(meta: dict) -> dict:
+    """`column_mapping` de metadata.json como {nombre de archivo: mapeo}.
+
+    Acepta el formato anterior: un único mapeo plano para el archivo `filename`.
+    """
+    mapeos = meta.get("column_mapping") or {}
+    if all(isinstance(v, str) for v in mapeos.values()):
+        return {meta["filename"]: mapeos} if mapeos and meta.get("filename") else {}
+    return {nombre: m for nombre, m in mapeos.items() if isinstance(m, dict)}
+
+
+def mapeo_columnas(path: Path) -> dict:
+    """Mapeo de columnas registrado por `download_csv` en data/metadata.json para `path`.
+
+    El CSV descargado no se reescribe: si sus encabezados difieren de los
+    esperados, el renombrado se aplica al leerlo. Cada archivo de data/ conserva
+    su mapeo aunque después se descargue otro. Devuelve {} si no hay mapeo.
+    """
+    meta_path = Path(path).parent / "metadata.json"
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return mapeos_registrados(meta).get(Path(path).name) or {}
+
+
+# Tipos declarados para las columnas del CSV crudo (nombres del recurso oficial)
+DTYPES_RAW = {
+    "ANIO": "Int64",
+    "MES": "Int64",
+    "cantidad": "Int64",
+    "DPTO_HECHO_NEW": "string",
+    "PROV_HECHO": "string",
+    "DIST_HECHO": "string",
+    "P_MODALIDADES": "string",
+}
+
+# Bytes leídos del inicio del archivo para detectar el encoding
+MUESTRA_ENCODING = 1 << 20
+
+
+def detectar_encoding(path: Path, muestra_bytes: int = MUESTRA_ENCODING) -> str:
+    """Detecta el encoding a partir de una muestra acotada de bytes: "utf-8-sig", "utf-8" o "latin1"."""
+    with open(path, "rb") as f:
+        muestra = f.read(muestra_bytes)
+    if muestra.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Decodificador incremental: un carácter multibyte cortado al final de la muestra no es error
+        codecs.getincrementaldecoder("utf-8")().decode(muestra, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def _motor_csv() -> str:
+    """Motor de lectura: pyarrow (multihilo) si está instalado, si no el motor C de pandas."""
+    return "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+
+
+@log_time
+def leer_csv(path: Path, nrows: Optional[int] = None, aplicar_mapeo: bool = True) -> pd.DataFrame:
+    """Lector único de CSV del dataset: una sola pasada de parseo.
+
+    Detecta el encoding con una muestra de bytes, declara los tipos de las
+    columnas conocidas y usa el motor pyarrow cuando está disponible (el motor
+    C se usa para `nrows`, que pyarrow no soporta). Aplica el mapeo de columnas
+    de metadata.json si existe.
+    """
+    path = Path(path)
+    encoding = detectar_encoding(path)
+    mapeo = mapeo_columnas(path) if aplicar_mapeo else {}
+    # Los tipos se declaran con los nombres tal como vienen en el archivo
+    inverso = {destino: origen for origen, destino in mapeo.items()}
+    dtypes = {inverso.get(col, col): tipo for col, tipo in DTYPES_RAW.items()}
+    engine = "c" if nrows is not None else _motor_csv()
+
+    try:
+        df = pd.read_csv(path, encoding=encoding, dtype=dtypes, engine=engine, nrows=nrows)
+    except UnicodeDecodeError:
+        # Un byte no UTF-8 más allá de la muestra: se relee una única vez como latin1
+        logger.warning("Encoding %s inválido más allá de la muestra en %s; usando latin1", encoding, path.name)
+        encoding = "latin1"
+        df = pd.read_csv(path, encoding=encoding, dtype=dtypes, engine=engine, nrows=nrows)
+    except (ValueError, TypeError) as e:
+        # Valores que no encajan con los tipos declarados: dejar que clean() los coercione
+        logger.warning("Tipos declarados no aplicables en %s (%s); leyendo sin dtypes", path.name, e)
+        df = pd.read_csv(path, encoding=encoding, engine=engine, nrows=nrows)
+
+    if mapeo:
+        df = df.rename(columns=mapeo)
+    logger.debug("leer_csv: %s encoding=%s engine=%s", path.name, encoding, engine)
+    return df
+
+
 @log_time
 def load_raw(path: Path) -> pd.DataFrame:
     """Lee el CSV original con los nombres de columnas del recurso oficial"""
     try:
-        df = pd.read_csv(path, encoding="utf-8")
-        logger.info(f"CSV cargado: {path.name} ({len(df)} filas)")
+        df = leer_csv(Path(path))
+        logger.info("CSV cargado: %s (%s filas)", Path(path).name, len(df))
         return df
     except Exception as e:
-        logger.exception(f"Error cargando CSV: {e}")
+        logger.exception("Error cargando CSV: %s", e)
         raise DataLoadError(f"No se pudo cargar {path}: {e}")
 
 
@@ -89,13 +188,76 @@ def clean(df: pd.DataFrame) -> pd.DataFrame:
         df = df.dropna(subset=["AÑO", "MES"])
         final_rows = len(df)
         
-        logger.info(f"Clean: {initial_rows} → {final_rows} filas (removidas {initial_rows - final_rows})")
+        logger.info("Clean: %s → %s filas (removidas %s)", initial_rows, final_rows, initial_rows - final_rows)
         return df
     except Exception as e:
-        logger.exception(f"Error limpiando datos: {e}")
+        logger.exception("Error limpiando datos: %s", e)
         raise ProcessingError(f"Error en limpieza: {e}")
 
 
+# Opciones de los selectores y jerarquía geográfica (departamento → provincia → distritos)
+@log_time
+def opciones_filtros(df: pd.DataFrame) -> dict:
+    """Listas ordenadas para los selectores del dashboard, serializables a JSON.
+
+    Claves: "anios", "modalidades", "departamentos", "jerarquia" ({dpto: {prov: [distritos]}})
+    y "distritos" ({dpto: [distritos]}, incluye los de filas sin provincia).
+    """
+    geo = df[["DEPARTAMENTO", "PROVINCIA", "DISTRITO"]].drop_duplicates().dropna(subset=["DEPARTAMENTO"])
+    jerarquia, distritos = {}, {}
+    for dpto, prov, dist in geo.itertuples(index=False):
+        provincias = jerarquia.setdefault(dpto, {})
+        if pd.notna(prov):
+            provincias.setdefault(prov, set())
+        if pd.notna(dist):
+            distritos.setdefault(dpto, set()).add(dist)
+            if pd.notna(prov):
+                provincias[prov].add(dist)
+    return {
+        "anios": sorted(int(a) for a in df["AÑO"].dropna().unique()),
+        "modalidades": sorted(str(m) for m in df["MODALIDADES"].dropna().unique()),
+        "departamentos": sorted(jerarquia),
+        "jerarquia": {d: {p: sorted(ds) for p, ds in sorted(provs.items())} for d, provs in sorted(jerarquia.items())},
+        "distritos": {d: sorted(ds) for d, ds in sorted(distritos.items())},
+    }
+
+
+# Periodos (año, mes) como enteros consecutivos: permiten rangos que cruzan años
+def clave_periodo(anio, mes):
+    """Clave entera del periodo: AAAA*12 + (MES-1). Acepta escalares o arreglos."""
+    return anio * 12 + (mes - 1)
+
+
+def periodo_de_clave(clave: int) -> tuple[int, int]:
+    return int(clave) // 12, int(clave) % 12 + 1
+
+
+@log_time
+def ordenar_por_periodo(df: pd.DataFrame) -> pd.DataFrame:
+    """Ordena `df` por (AÑO, MES) de forma estable, con índice 0..n-1."""
+    return df.sort_values(["AÑO", "MES"], kind="stable").reset_index(drop=True)
+
+
+def tabla_offsets(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Tabla de offsets de un DataFrame ordenado por (AÑO, MES).
+
+    Devuelve (claves, offsets): `claves[i]` es la clave del i-ésimo periodo presente y
+    sus filas son `offsets[i]:offsets[i + 1]` (`offsets` tiene un elemento más).
+    """
+    claves_filas = clave_periodo(df["AÑO"].to_numpy(dtype=np.int64), df["MES"].to_numpy(dtype=np.int64))
+    if len(claves_filas) and (np.diff(claves_filas) < 0).any():
+        raise ProcessingError("tabla_offsets requiere un DataFrame ordenado por (AÑO, MES)")
+    claves, inicios = np.unique(claves_filas, return_index=True)
+    return claves, np.append(inicios, len(claves_filas))
+
+
+def rango_filas(claves: np.ndarray, offsets: np.ndarray, inicio: tuple[int, int], fin: tuple[int, int]) -> tuple[int, int]:
+    """Filas [a, b) de los periodos entre `inicio` y `fin` (inclusive) con dos búsquedas binarias."""
+    i = np.searchsorted(claves, clave_periodo(*inicio), side="left")
+    j = np.searchsorted(claves, clave_periodo(*fin), side="right")
+    return int(offsets[i]), int(offsets[max(i, j)])
+
+
 # Filtro único que aplica año, modalidades, dpto, provincia y rango de meses
 def filter_df(
     df: pd.DataFrame,
@@ -103,41 +265,81 @@ def filter_df(
     modalidades: list[str] | None,
     dpto: str | None,
     prov: str | None,
-    mes_range: tuple[int, int] | None
+    mes_range: tuple[int, int] | None,
+    periodo: tuple[tuple[int, int], tuple[int, int]] | None = None,
 ) -> pd.DataFrame:
-    """Aplica múltiples filtros al DataFrame"""
+    """Aplica múltiples filtros al DataFrame.
+
+    `periodo` = ((año, mes), (año, mes)) filtra un rango de fechas que puede cruzar años.
+    No copia la entrada: cada filtro produce un DataFrame nuevo con las filas
+    seleccionadas, y sin filtros se devuelve el mismo objeto (Copy-on-Write).
+    """
     try:
-        out = df.copy()
+        out = df
         initial_rows = len(out)
         
         if anio is not None:
             out = out[out["AÑO"] == anio]
-            logger.debug(f"Filtro año={anio}: {len(out)} filas")
+            logger.debug("Filtro año=%s: %s filas", anio, len(out), extra=FRECUENTE)
         
         if modalidades:
             out = out[out["MODALIDADES"].isin(modalidades)]
-            logger.debug(f"Filtro modalidades={len(modalidades)}: {len(out)} filas")
+            logger.debug("Filtro modalidades=%s: %s filas", len(modalidades), len(out), extra=FRECUENTE)
         
         if dpto and dpto != "Todos":
             out = out[out["DEPARTAMENTO"] == dpto]
-            logger.debug(f"Filtro dpto={dpto}: {len(out)} filas")
+            logger.debug("Filtro dpto=%s: %s filas", dpto, len(out), extra=FRECUENTE)
         
         if prov and prov != "Todas":
             out = out[out["PROVINCIA"] == prov]
-            logger.debug(f"Filtro provincia={prov}: {len(out)} filas")
+            logger.debug("Filtro provincia=%s: %s filas", prov, len(out), extra=FRECUENTE)
         
         if mes_range:
             lo, hi = mes_range
             out = out[(out["MES"] >= lo) & (out["MES"] <= hi)]
-            logger.debug(f"Filtro meses=[{lo}-{hi}]: {len(out)} filas")
-        
-        logger.info(f"Filter_df: {initial_rows} → {len(out)} filas aplicadas")
+            logger.debug("Filtro meses=[%s-%s]: %s filas", lo, hi, len(out), extra=FRECUENTE)
+
+        if periodo:
+            claves = clave_periodo(out["AÑO"], out["MES"])
+            out = out[(claves >= clave_periodo(*periodo[0])) & (claves <= clave_periodo(*periodo[1]))]
+            logger.debug("Filtro periodo=%s: %s filas", periodo, len(out), extra=FRECUENTE)
+
+        logger.info("Filter_df: %s → %s filas aplicadas", initial_rows, len(out), extra=FRECUENTE)
         return out
     except Exception as e:
-        logger.exception(f"Error en filter_df: {e}")
+        logger.exception("Error en filter_df: %s", e)
         raise ProcessingError(f"Error filtrando datos: {e}")
 
 
+# Permutación de orden (posiciones) para paginar sin reordenar el DataFrame completo
+@log_time
+def permutacion_orden(df: pd.DataFrame, columnas: List[str], ascendentes: List[bool]) -> np.ndarray:
+    """Devuelve las posiciones que ordenan `df` por `columnas` (estable, nulos al final).
+
+    Equivale a `df.sort_values(columnas, ascending=ascendentes)` pero sólo calcula
+    un arreglo de enteros: la página visible se obtiene con `df.iloc[perm[a:b]]`.
+    """
+    try:
+        claves = []
+        for col, asc in zip(columnas, ascendentes):
+            serie = df[col]
+            if pd.api.types.is_numeric_dtype(serie):
+                valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+                nulos = np.isnan(valores)
+                valores = np.where(nulos, 0.0, valores)
+            else:
+                codigos, _ = pd.factorize(serie, sort=True)
+                nulos = codigos < 0
+                valores = codigos
+            claves.append((valores if asc else -valores, nulos))
+        # np.lexsort usa la última clave como primaria: invertir la prioridad
+        orden = [k for valores, nulos in reversed(claves) for k in (valores, nulos)]
+        return np.lexsort(orden) if orden else np.arange(len(df))
+    except Exception as e:
+        logger.exception("Error calculando permutación de orden: %s", e)
+        raise ProcessingError(f"Error ordenando datos: {e}")
+
+
 # Agregación por modalidad para barras
 @log_time
 def by_modalidad(df: pd.DataFrame) -> pd.DataFrame:
@@ -147,7 +349,7 @@ def by_modalidad(df: pd.DataFrame) -> pd.DataFrame:
             raise ValidationError("DataFrame vacío para by_modalidad")
         return df.groupby("MODALIDADES", as_index=False)["cantidad"].sum().sort_values("cantidad", ascending=False)
     except Exception as e:
-        logger.exception(f"Error en by_modalidad: {e}")
+        logger.exception("Error en by_modalidad: %s", e)
         raise ProcessingError(f"Error agrupando por modalidad: {e}")
 
 
@@ -160,7 +362,7 @@ def monthly_trend(df: pd.DataFrame) -> pd.DataFrame:
             raise ValidationError("DataFrame vacío para monthly_trend")
         return df.groupby("MES", as_index=False)["cantidad"].sum().sort_values("MES")
     except Exception as e:
-        logger.exception(f"Error en monthly_trend: {e}")
+        logger.exception("Error en monthly_trend: %s", e)
         raise ProcessingError(f"Error en tendencia mensual: {e}")
 
 
@@ -173,7 +375,7 @@ def top_departamentos(df: pd.DataFrame) -> pd.DataFrame:
             raise ValidationError("DataFrame vacío para top_departamentos")
         return df.groupby("DEPARTAMENTO", as_index=False)["cantidad"].sum().sort_values("cantidad", ascending=False).head(10)
     except Exception as e:
-        logger.exception(f"Error en top_departamentos: {e}")
+        logger.exception("Error en top_departamentos: %s", e)
         raise ProcessingError(f"Error obteniendo top departamentos: {e}")
 
 
@@ -186,5 +388,5 @@ def heatmap_modalidad_mes(df: pd.DataFrame) -> pd.DataFrame:
             raise ValidationError("DataFrame vacío para heatmap_modalidad_mes")
         return df.groupby(["MODALIDADES", "MES"], as_index=False)["cantidad"].sum()
     except Exception as e:
-        logger.exception(f"Error en heatmap_modalidad_mes: {e}")
+        logger.exception("Error en heatmap_modalidad_mes: %s", e)
         raise ProcessingError(f"Error en heatmap: {e}")
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Perfilado bajo demanda para la aplicación SIDPOL.
+Envuelve una ejecución (un rerun de Streamlit o un `cargar_csv_a_bd`) en cProfile
+y tracemalloc, y escribe el perfil y los principales sitios de asignación en `logs/profiles/`.
+
+Se activa con la variable de entorno SIDPOL_PROFILE (valores: "rerun", "ingest",
+una lista separada por comas o "1"/"all" para todo) o, para un único rerun,
+con `?profile=1` en la URL (sólo con el panel admin habilitado). Desactivado no
+añade ninguna envoltura. Hay un único perfil a la vez por proceso: tracemalloc es
+global y otro perfil simultáneo (otra sesión o un ingest anidado) se omite.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+from utils import logger, LOG_DIR
+
+PROFILE_DIR = LOG_DIR / "profiles"
+
+# Objetivos perfilables mediante SIDPOL_PROFILE
+OBJETIVOS = ("rerun", "ingest")
+
+# Un perfil a la vez en todo el proceso: tracemalloc es global, y el primero en terminar lo detendría
+# para los demás. También evita anidar perfiles (p. ej. un ingest dentro de un rerun perfilado)
+_lock_perfil = threading.Lock()
+
+
+def objetivos_activos() -> set:
+    """Objetivos habilitados por la variable de entorno SIDPOL_PROFILE."""
+    valor = os.environ.get("SIDPOL_PROFILE", "").strip().lower()
+    if not valor or valor in ("0", "false", "no"):
+        return set()
+    if valor in ("1", "true", "all", "si", "sí"):
+        return set(OBJETIVOS)
+    return {v.strip() for v in valor.split(",") if v.strip() in OBJETIVOS}
+
+
+def _nombre_seguro(texto: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", str(texto))[:64] or "anon"
+
+
+@contextmanager
+def perfilar(etiqueta: str, sesion: str = "proceso", top_n: int = 30):
+    """Perfila el bloque con cProfile + tracemalloc y escribe los resultados en logs/profiles/.
+
+    Genera `<etiqueta>_<sesion>_<timestamp>.prof` (cargable con pstats/snakeviz)
+    y un `.txt` con las funciones más costosas y los sitios con más memoria asignada.
+    """
+    if not _lock_perfil.acquire(blocking=False):
+        logger.info("Perfil %s omitido: ya hay otro perfil en curso en el proceso", etiqueta)
+        yield None
+        return
+    try:
+        with _perfil(etiqueta, sesion, top_n) as destino:
+            yield destino
+    finally:
+        _lock_perfil.release()
+
+
+@contextmanager
+def _perfil(etiqueta: str, sesion: str, top_n: int):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    base = f"{_nombre_seguro(etiqueta)}_{_nombre_seguro(sesion)}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+
+    # Si tracemalloc ya estaba activo (p. ej. -X tracemalloc) no lo detenemos al salir
+    propio_tracemalloc = not tracemalloc.is_tracing()
+    if propio_tracemalloc:
+        tracemalloc.start(10)
+    inicio_mem = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield PROFILE_DIR / f"{base}.prof"
+    finally:
+        profiler.disable()
+        fin_mem = tracemalloc.take_snapshot()
+        _, pico = tracemalloc.get_traced_memory()
+        if propio_tracemalloc:
+            tracemalloc.stop()
+        try:
+            _escribir_resultados(base, profiler, inicio_mem, fin_mem, pico, top_n)
+        except Exception as e:
+            logger.exception("Error escribiendo perfil %s: %s", base, e)
+
+
+def _escribir_resultados(base, profiler, inicio_mem, fin_mem, pico, top_n):
+    prof_path = PROFILE_DIR / f"{base}.prof"
+    txt_path = PROFILE_DIR / f"{base}.txt"
+    profiler.dump_stats(str(prof_path))
+
+    salida = io.StringIO()
+    salida.write(f"# Perfil {base}\n\n## cProfile (top {top_n} por tiempo acumulado)\n")
+    pstats.Stats(profiler, stream=salida).sort_stats("cumulative").print_stats(top_n)
+
+    salida.write(f"\n## tracemalloc (pico {pico / 1024 / 1024:.1f} MB, top {top_n} sitios por memoria nueva)\n")
+    filtros = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ]
+    diferencias = fin_mem.filter_traces(filtros).compare_to(inicio_mem.filter_traces(filtros), "lineno")
+    for stat in diferencias[:top_n]:
+        salida.write(f"{stat}\n")
+
+    txt_path.write_text(salida.getvalue(), encoding="utf-8")
+    logger.info("Perfil escrito: %s / %s", prof_path.name, txt_path.name)
+
+
+def perfil_opcional(etiqueta: str, sesion: str, activo: bool):
+    """Devuelve `perfilar(...)` si `activo`, o un contexto vacío en caso contrario."""
+    return perfilar(etiqueta, sesion) if activo else nullcontext()
+
+
+def perfilable(objetivo: str):
+    """Decorador: perfila cada llamada si `objetivo` está en SIDPOL_PROFILE al importar el módulo.
+
+    Con el perfilado desactivado devuelve la función original sin envoltura (coste cero).
+    """
+    def decorator(func):
+        if objetivo not in objetivos_activos():
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with perfilar(f"{objetivo}-{func.__name__}", f"pid{os.getpid()}"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,65 @@
+"""
+Cálculos del dashboard fuera del hilo del script de Streamlit.
+
+Cada sesión tiene "ranuras" (p. ej. una por pestaña de análisis) con a lo sumo
+una tarea vigente. Enviar a una ranura una tarea con otra clave (otro filtro u
+otros parámetros) la reemplaza: la anterior se cancela si aún está en cola y,
+si ya empezó, su resultado se descarta. Así arrastrar un slider no encola
+trabajo obsoleto.
+"""
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import MutableMapping, Optional
+
+from metrics import registry
+from utils import logger
+
+# Hilos para los análisis: acotan el trabajo concurrente del proceso (todas las sesiones)
+MAX_HILOS = 2
+
+PREFIJO = "tarea_"
+
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="sidpol-analisis")
+
+
+def _medir(ranura: str, funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    error = False
+    try:
+        return funcion(*args, **kwargs)
+    except Exception:
+        error = True
+        raise
+    finally:
+        registry.observe(f"tarea_{ranura}", time.perf_counter() - inicio, error)
+
+
+def en_ranura(estado: MutableMapping, ranura: str, clave, funcion, *args, **kwargs) -> Future:
+    """Tarea vigente de `ranura` para `clave`, enviándola al pool si no existe.
+
+    Args:
+        estado: almacenamiento por sesión (st.session_state).
+        ranura: nombre de la ranura (una tarea vigente por ranura).
+        clave: identifica el cálculo (filtro + parámetros); una clave nueva reemplaza la tarea.
+        funcion, args, kwargs: cálculo a ejecutar en un hilo.
+    """
+    actual = estado.get(PREFIJO + ranura)
+    if actual is not None:
+        clave_actual, futuro = actual
+        if clave_actual == clave and not futuro.cancelled():
+            return futuro
+        if not futuro.done():
+            if futuro.cancel():
+                logger.debug("Tarea %s cancelada antes de empezar", ranura)
+            else:
+                logger.debug("Tarea %s reemplazada en curso; su resultado se descarta", ranura)
+    futuro = _ejecutor.submit(_medir, ranura, funcion, *args, **kwargs)
+    estado[PREFIJO + ranura] = (clave, futuro)
+    return futuro
+
+
+def tarea(estado: MutableMapping, ranura: str) -> Optional[Future]:
+    """Tarea vigente de `ranura` (o None)."""
+    actual = estado.get(PREFIJO + ranura)
+    return actual[1] if actual is not None else None
@@ -1,7 +1,50 @@
+import atexit
+import importlib.util
 import logging
+import os
+import queue
+import sys
 import time
+import types
+from collections import Counter
 from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from metrics import registry
+
+# Directorio de logs (también destino de métricas y perfiles exportados)
+LOG_DIR = Path(__file__).resolve().parent.parent / "logs"
+
+# Marca para eventos de alta frecuencia (sujetos a muestreo): logger.debug(..., extra=FRECUENTE)
+FRECUENTE = {"frecuente": True}
+
+
+class MuestreoFilter(logging.Filter):
+    """Deja pasar 1 de cada N eventos marcados como frecuentes, por punto de llamada.
+
+    N se toma de SIDPOL_LOG_SAMPLE (por defecto 1: sin muestreo). Los eventos
+    no marcados y los de nivel WARNING o superior nunca se descartan.
+    """
+
+    def __init__(self, cada_n: int = 1):
+        super().__init__()
+        self.cada_n = max(1, cada_n)
+        self._contadores = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.cada_n == 1 or record.levelno >= logging.WARNING or not getattr(record, "frecuente", False):
+            return True
+        clave = (record.pathname, record.lineno)
+        self._contadores[clave] += 1
+        return self._contadores[clave] % self.cada_n == 1
+
+
+class _QueueHandlerDiferido(QueueHandler):
+    """Encola el registro sin formatearlo: el formateo y la escritura ocurren en el hilo del listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 
 # Configurar logger básico con archivo de log
 logger = logging.getLogger("sidpol")
@@ -11,45 +54,97 @@ if not logger.handlers:
     console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
     console_handler.setFormatter(console_formatter)
     console_handler.setLevel(logging.INFO)
-    
+
     # Handler a archivo
-    log_dir = Path(__file__).resolve().parent.parent / "logs"
-    log_dir.mkdir(exist_ok=True)
-    file_handler = logging.FileHandler(log_dir / "sidpol.log", encoding="utf-8")
+    LOG_DIR.mkdir(exist_ok=True)
+    file_handler = logging.FileHandler(LOG_DIR / "sidpol.log", encoding="utf-8")
     file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
     file_handler.setFormatter(file_formatter)
     file_handler.setLevel(logging.DEBUG)
-    
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+
+    # Los hilos de la app sólo encolan; un listener en segundo plano escribe en consola y archivo
+    cola_logs = queue.SimpleQueue()
+    queue_handler = _QueueHandlerDiferido(cola_logs)
+    queue_handler.addFilter(MuestreoFilter(int(os.environ.get("SIDPOL_LOG_SAMPLE", "1") or 1)))
+    log_listener = QueueListener(cola_logs, console_handler, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    logger.addHandler(queue_handler)
     logger.setLevel(logging.DEBUG)
 
 
+class _ResumenPerezoso:
+    __slots__ = ("valor",)
+
+    def __init__(self, valor):
+        self.valor = valor
+
+    def __str__(self) -> str:
+        return _resumen(self.valor)
+
+
+def resumir(valor) -> _ResumenPerezoso:
+    """Resumen compacto y perezoso de un valor para logs: se calcula sólo al formatear el mensaje.
+
+    DataFrames/Series/arrays se describen por forma y tipos, nunca por su repr.
+    """
+    return _ResumenPerezoso(valor)
+
+
+def _resumen(valor, max_len: int = 80) -> str:
+    if hasattr(valor, "shape") and hasattr(valor, "columns"):
+        # DataFrame: forma + conteo de columnas por dtype
+        tipos = Counter(str(t) for t in valor.dtypes)
+        return f"{type(valor).__name__}{tuple(valor.shape)} dtypes={dict(tipos)}"
+    if hasattr(valor, "shape") and hasattr(valor, "dtype"):
+        # Series / ndarray
+        return f"{type(valor).__name__}{tuple(valor.shape)} dtype={valor.dtype}"
+    if isinstance(valor, dict):
+        return "{" + ", ".join(f"{k}={_resumen(v, 30)}" for k, v in list(valor.items())[:8]) + (", …}" if len(valor) > 8 else "}")
+    if isinstance(valor, (list, tuple, set, frozenset)) and len(valor) > 8:
+        return f"{type(valor).__name__}(len={len(valor)})"
+    if isinstance(valor, (list, tuple)):
+        abre, cierra = ("[", "]") if isinstance(valor, list) else ("(", ")")
+        return abre + ", ".join(_resumen(v, 30) for v in valor) + cierra
+    texto = repr(valor)
+    return texto if len(texto) <= max_len else texto[: max_len - 1] + "…"
+
+
 def log_time(func):
-    """Decorador para registrar tiempo de ejecución de funciones."""
+    """Decorador para registrar tiempo de ejecución de funciones.
+
+    Además del log, alimenta el registro de métricas (`metrics.registry`)
+    con la latencia y si la llamada terminó en excepción.
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter()
+        error = False
         try:
             result = func(*args, **kwargs)
             return result
+        except Exception:
+            error = True
+            raise
         finally:
-            elapsed = time.time() - start
-            logger.info(f"{func.__name__} ejecutado en {elapsed:.3f}s")
+            elapsed = time.perf_counter() - start
+            registry.observe(func.__name__, elapsed, error)
+            logger.info("%s ejecutado en %.3fs", func.__name__, elapsed, extra=FRECUENTE)
     return wrapper
 
 
 def debug(func):
-    """Decorador para debugging: registra parámetros y resultado."""
+    """Decorador para debugging: registra un resumen de los parámetros y el tipo del resultado."""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        logger.debug(f"→ {func.__name__} llamada con args={args}, kwargs={kwargs}")
+        logger.debug("→ %s llamada con args=%s, kwargs=%s", func.__name__, resumir(args), resumir(kwargs), extra=FRECUENTE)
         try:
             result = func(*args, **kwargs)
-            logger.debug(f"← {func.__name__} retorna {type(result).__name__}")
+            logger.debug("← %s retorna %s", func.__name__, type(result).__name__, extra=FRECUENTE)
             return result
         except Exception as e:
-            logger.debug(f"✗ {func.__name__} lanzó {type(e).__name__}: {e}")
+            logger.debug("✗ %s lanzó %s: %s", func.__name__, type(e).__name__, e)
             raise
     return wrapper
 
@@ -63,12 +158,12 @@ def cache_result(func):
         # Crear clave basada en función, args y kwargs
         key = (func.__name__, args, tuple(sorted(kwargs.items())))
         if key in cache:
-            logger.debug(f"{func.__name__} retorna resultado cacheado")
+            logger.debug("%s retorna resultado cacheado", func.__name__, extra=FRECUENTE)
             return cache[key]
         
         result = func(*args, **kwargs)
         cache[key] = result
-        logger.debug(f"{func.__name__} resultado cacheado")
+        logger.debug("%s resultado cacheado", func.__name__, extra=FRECUENTE)
         return result
     
     wrapper.clear_cache = lambda: cache.clear()
@@ -83,7 +178,33 @@ def handle_errors(default_return=None):
             try:
                 return func(*args, **kwargs)
             except Exception as e:
-                logger.exception(f"Error en {func.__name__}: {e}")
+                logger.exception("Error en %s: %s", func.__name__, e)
                 return default_return
         return wrapper
     return decorator
+
+
+class _ModuloPerezoso(types.ModuleType):
+    """Representante de un módulo aún no importado: la primera lectura de un atributo lo importa.
+
+    La importación pasa por `importlib.import_module`, que respeta los locks de
+    importación: si dos sesiones lo usan a la vez, la segunda espera a que el
+    módulo termine de ejecutarse (con `importlib.util.LazyLoader`, antes de
+    Python 3.12, podía ver el módulo a medio ejecutar).
+    """
+
+    def __getattr__(self, atributo):
+        return getattr(importlib.import_module(self.__name__), atributo)
+
+
+def importar_perezoso(nombre: str):
+    """Devuelve el módulo `nombre` sin ejecutarlo: se importa de verdad en el primer acceso a un atributo.
+
+    Útil para módulos pesados (pandas, sklearn vía analysis, altair vía viz,
+    requests vía download_data) que no todas las ejecuciones necesitan.
+    """
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    if importlib.util.find_spec(nombre) is None:
+        raise ImportError(f"No se encontró el módulo {nombre}")
+    return _ModuloPerezoso(nombre)
@@ -75,4 +75,28 @@ def heatmap_mod_mes(df: pd.DataFrame):
             tooltip=["MODALIDADES", "MES", "cantidad"]
         )
         .properties(height=320)
-    )
\ No newline at end of file
+    )
+
+# Variante aproximada: barras/línea con su intervalo de error (columna "error")
+def _barras_error(df: pd.DataFrame, campo: str, tipo: str):
+    return (
+        alt.Chart(df)
+        .transform_calculate(inferior="datum.cantidad - datum.error", superior="datum.cantidad + datum.error")
+        .mark_errorbar()
+        .encode(
+            x=alt.X(f"{campo}:{tipo}"),
+            y=alt.Y("inferior:Q", title="Denuncias"),
+            y2="superior:Q",
+        )
+    )
+
+# Barras por modalidad con el intervalo de error de cada estimación
+def bar_modalidad_error(df: pd.DataFrame):
+    orden = list(df.sort_values("cantidad", ascending=False)["MODALIDADES"])
+    x = alt.X("MODALIDADES:N", sort=orden, title="Modalidad")
+    return bar_modalidad(df).encode(x=x, tooltip=["MODALIDADES", "cantidad", "error"]) + \
+        _barras_error(df, "MODALIDADES", "N").encode(x=x)
+
+# Tendencia mensual con el intervalo de error de cada mes
+def line_trend_error(df: pd.DataFrame):
+    return line_trend(df).encode(tooltip=["MES", "cantidad", "error"]) + _barras_error(df, "MES", "O")
@@ -0,0 +1,6 @@
+"""Configuración de pytest: los módulos de src/ se importan planos, como en la app."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,117 @@
+"""API JSON (api.py) sobre un CSV pequeño: ETag/304, gzip y errores 400."""
+
+import gzip
+import http.client
+import json
+import threading
+
+import pytest
+
+import api
+import cube
+import processing
+
+
+@pytest.fixture(scope="module")
+def servidor(tmp_path_factory):
+    """Servidor en un puerto libre, en un hilo, sobre un CSV de prueba; devuelve (host, puerto)."""
+    csv = tmp_path_factory.mktemp("datos") / "denuncias.csv"
+    filas = ["ANIO,MES,DPTO_HECHO_NEW,PROV_HECHO,DIST_HECHO,P_MODALIDADES,cantidad"]
+    filas += [f"{anio},{mes},DPTO {d},PROV {d},DISTRITO {d}-{mes},Modalidad {mes % 4},{anio - 2000 + mes}"
+              for anio in (2023, 2024) for mes in range(1, 13) for d in range(6)]
+    csv.write_text("\n".join(filas) + "\n", encoding="utf-8")
+
+    parche = pytest.MonkeyPatch()
+    parche.setattr(processing, "data_path", lambda filename=None: csv)
+    parche.setattr(cube, "CUBE_DIR", tmp_path_factory.mktemp("cube"))
+    srv = api.crear_servidor(puerto=0)
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    yield srv.server_address[:2]
+    srv.shutdown()
+    srv.server_close()
+    parche.undo()
+
+
+def pedir(servidor, ruta, **cabeceras):
+    conexion = http.client.HTTPConnection(*servidor, timeout=30)
+    try:
+        conexion.request("GET", ruta, headers=cabeceras)
+        respuesta = conexion.getresponse()
+        return respuesta.status, dict(respuesta.getheaders()), respuesta.read()
+    finally:
+        conexion.close()
+
+
+def test_200_con_etag_y_304_con_if_none_match(servidor):
+    estado, cabeceras, cuerpo = pedir(servidor, "/api/modalidades?anio=2024")
+    assert estado == 200
+    assert cabeceras["ETag"].startswith('"')
+    assert {r["MODALIDADES"] for r in json.loads(cuerpo)} == {f"Modalidad {i}" for i in range(4)}
+
+    estado, cabeceras_304, cuerpo = pedir(servidor, "/api/modalidades?anio=2024", **{"If-None-Match": cabeceras["ETag"]})
+    assert estado == 304
+    assert cuerpo == b""
+    assert cabeceras_304["ETag"] == cabeceras["ETag"]
+
+
+def test_gzip_si_se_acepta_y_la_respuesta_supera_1kb(servidor):
+    estado, cabeceras, plano = pedir(servidor, "/api/opciones")
+    assert estado == 200 and len(plano) >= api.MIN_GZIP_BYTES
+    assert "Content-Encoding" not in cabeceras
+
+    estado, cabeceras, comprimido = pedir(servidor, "/api/opciones", **{"Accept-Encoding": "gzip"})
+    assert estado == 200
+    assert cabeceras["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(comprimido)) == json.loads(plano)
+
+
+def test_gzip_rechazado_con_q_cero(servidor):
+    estado, cabeceras, cuerpo = pedir(servidor, "/api/opciones", **{"Accept-Encoding": "gzip;q=0, identity"})
+    assert estado == 200
+    assert "Content-Encoding" not in cabeceras
+    assert json.loads(cuerpo)
+
+
+@pytest.mark.parametrize("cabecera, acepta", [
+    ("gzip", True),
+    ("br, GZIP", True),
+    ("deflate;q=0.5, gzip;q=0.8", True),
+    ("x-gzip", True),
+    ("*", True),
+    ("", False),
+    ("br", False),
+    ("gzip;q=0", False),
+    ("gzip;q=0.000", False),
+    ("gzip;q=0, *", False),
+    ("*;q=0", False),
+    ("gzipped", False),
+])
+def test_acepta_gzip(cabecera, acepta):
+    assert api.acepta_gzip(cabecera) is acepta
+
+
+def test_respuesta_pequena_sin_gzip(servidor):
+    estado, cabeceras, cuerpo = pedir(servidor, "/api/total?anio=2023", **{"Accept-Encoding": "gzip"})
+    assert estado == 200 and len(cuerpo) < api.MIN_GZIP_BYTES
+    assert "Content-Encoding" not in cabeceras
+    assert json.loads(cuerpo)["total"] == sum(23 + mes for mes in range(1, 13)) * 6
+
+
+@pytest.mark.parametrize("ruta", [
+    "/api/total?anio=dos-mil",
+    "/api/total?desde=2024-01",
+    "/api/total?desde=2024&hasta=2024-03",
+    "/api/prediccion?meses=99",
+    "/api/crecimiento?periodo=semana",
+])
+def test_400_con_parametros_invalidos(servidor, ruta):
+    estado, _, cuerpo = pedir(servidor, ruta)
+    assert estado == 400
+    assert "error" in json.loads(cuerpo)
+
+
+def test_404_en_ruta_desconocida(servidor):
+    estado, _, cuerpo = pedir(servidor, "/api/no-existe")
+    assert estado == 404
+    assert "/api/total" in json.loads(cuerpo)["rutas"]
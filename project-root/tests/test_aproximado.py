@@ -0,0 +1,37 @@
+"""Tareas en segundo plano de aproximado.py: la sinopsis no espera detrás de los resultados exactos."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import aproximado
+
+
+@pytest.fixture
+def sin_sinopsis(monkeypatch):
+    """Cachés de sinopsis vacías; la construcción devuelve un marcador en lugar de leer disco."""
+    monkeypatch.setattr(aproximado, "_sinopsis", {})
+    monkeypatch.setattr(aproximado, "_tareas_sinopsis", {})
+    monkeypatch.setattr(aproximado, "abrir_sinopsis", lambda version: None)
+    monkeypatch.setattr(aproximado, "construir_sinopsis", lambda df, version: ("sinopsis", version))
+
+
+def test_sinopsis_no_espera_a_los_resultados_exactos(sin_sinopsis):
+    liberar = threading.Event()
+    exactos = [aproximado.en_segundo_plano(f"prueba-bloqueo:{i}", liberar.wait, 10)
+               for i in range(aproximado._ejecutor._max_workers)]
+    try:
+        futuro = aproximado.sinopsis_en_segundo_plano(SimpleNamespace(version="v1", df=None))
+        assert futuro.result(timeout=5) == ("sinopsis", "v1")
+        assert not any(f.done() for f in exactos)
+    finally:
+        liberar.set()
+
+
+def test_sinopsis_en_memoria_devuelve_tarea_terminada(sin_sinopsis):
+    ds = SimpleNamespace(version="v2", df=None)
+    assert aproximado.obtener_sinopsis(ds) == ("sinopsis", "v2")
+
+    futuro = aproximado.sinopsis_en_segundo_plano(ds)
+    assert futuro.done() and futuro.result() == ("sinopsis", "v2")
@@ -0,0 +1,59 @@
+"""Cubo OLAP (cube.py): los agregados coinciden con los de processing.py, valores y dtypes."""
+
+import pandas as pd
+import pytest
+
+import cube
+import processing
+
+AGREGADOS = ("by_modalidad", "monthly_trend", "top_departamentos", "heatmap_modalidad_mes")
+
+
+@pytest.fixture(scope="module")
+def datos(tmp_path_factory):
+    """DataFrame con los dtypes de `processing.clean` (nulos incluidos) y su cubo; devuelve (df, cubo)."""
+    filas = [(anio, mes, dpto, mod, (anio - 2020) * 100 + mes * 7 + i)
+             for i, (anio, mes, dpto, mod) in enumerate(
+                 (a, m, d, o) for a in (2023, 2024) for m in (1, 2, 5, 12)
+                 for d in ("LIMA", "CUSCO", "PIURA", None) for o in ("Robo", "Estafa", None))]
+    df = pd.DataFrame(filas, columns=["AÑO", "MES", "DEPARTAMENTO", "MODALIDADES", "cantidad"])
+    df = df.astype({"AÑO": "Int64", "MES": "Int64", "DEPARTAMENTO": "string", "MODALIDADES": "string",
+                    "cantidad": "int64"})
+    return df, cube.construir_cubo(df, "v1", directorio=tmp_path_factory.mktemp("cube"))
+
+
+def _ordenado(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("filtro", [
+    dict(anio=None, modalidades=None, dpto="Todos", mes_range=None),
+    dict(anio=2024, modalidades=["Robo"], dpto="Todos", mes_range=(2, 12)),
+    dict(anio=2023, modalidades=None, dpto="LIMA", mes_range=(1, 5)),
+])
+@pytest.mark.parametrize("nombre", AGREGADOS)
+def test_agregados_iguales_a_processing(datos, filtro, nombre):
+    df, cubo = datos
+    filas = processing.filter_df(df, filtro["anio"], filtro["modalidades"], filtro["dpto"], None, filtro["mes_range"])
+
+    esperado = getattr(processing, nombre)(filas)
+    obtenido = getattr(cubo.agregados(**filtro), nombre)()
+
+    assert obtenido.dtypes.to_dict() == esperado.dtypes.to_dict()
+    pd.testing.assert_frame_equal(_ordenado(obtenido), _ordenado(esperado))
+
+
+def test_total_igual_a_la_suma_de_filas(datos):
+    df, cubo = datos
+    filas = processing.filter_df(df, None, None, "Todos", None, None, periodo=((2023, 5), (2024, 2)))
+
+    assert cubo.agregados(periodo=((2023, 5), (2024, 2))).total() == int(filas["cantidad"].sum())
+
+
+def test_cubo_sin_tipos_se_reconstruye(datos, tmp_path):
+    df, _ = datos
+    cube.construir_cubo(df, "v1", directorio=tmp_path)
+    _, path_json = cube._rutas("v1", tmp_path)
+    path_json.write_text('{"version": "v1", "etiquetas": {}}', encoding="utf-8")
+
+    assert cube.abrir_cubo("v1", tmp_path) is None
@@ -0,0 +1,101 @@
+"""Cargas a la BD SQLite (database.py) sobre una BD temporal."""
+
+import os
+import sqlite3
+import time
+
+import pytest
+
+import busqueda
+import database
+
+
+def _csv(path, meses):
+    filas = ["ANIO,MES,DPTO_HECHO_NEW,PROV_HECHO,DIST_HECHO,P_MODALIDADES,cantidad"]
+    filas += [f"2024,{mes},DPTO {d},PROV {d},DISTRITO {d},Modalidad {d % 2},{mes + d}" for mes in meses for d in range(3)]
+    path.write_text("\n".join(filas) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def _meses(tabla="denuncias"):
+    with sqlite3.connect(str(database.DB_PATH)) as conn:
+        return sorted(m for (m,) in conn.execute(f"SELECT DISTINCT mes FROM {tabla}"))
+
+
+@pytest.fixture
+def bd(tmp_path, monkeypatch):
+    """BD publicada en `tmp_path`; devuelve el directorio."""
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "denuncias.db")
+    return tmp_path
+
+
+def _archivos(directorio):
+    return sorted(p.name for p in directorio.iterdir() if p.suffix != ".csv")
+
+
+def test_construcciones_simultaneas_usan_archivos_propios(bd):
+    """Dos construcciones a la vez (p. ej. de dos procesos) no comparten ni borran archivos."""
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1]))[1]
+    conn_a, nueva_a = database._abrir_construccion(copiar_publicada=True)
+    conn_b, nueva_b = database._abrir_construccion(copiar_publicada=False)
+    assert nueva_a != nueva_b and nueva_a.exists() and nueva_b.exists()
+
+    conn_b.execute("INSERT INTO denuncias (anio, mes, cantidad) VALUES (2030, 1, 5)")
+    database._publicar(conn_b, nueva_b)
+    assert nueva_a.exists()
+    database._publicar(conn_a, nueva_a)
+
+    assert _archivos(bd) == ["denuncias.anterior.db", "denuncias.db"]
+    assert _meses() == [1]
+    database.restaurar_anterior()
+    with sqlite3.connect(str(database.DB_PATH)) as conn:
+        assert conn.execute("SELECT anio FROM denuncias").fetchall() == [(2030,)]
+
+
+def test_publicar_espera_el_lock_de_otro_proceso(bd, monkeypatch):
+    monkeypatch.setattr(database, "ESPERA_LOCK", 0.2)
+    lock = bd / "denuncias.db.lock"
+    lock.write_text("123")
+
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1])) == (0, False)
+    assert _archivos(bd) == ["denuncias.db.lock"]
+
+    viejo = time.time() - 2 * database.LOCK_VENCIDO
+    os.utime(lock, (viejo, viejo))
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1]))[1]
+    assert _archivos(bd) == ["denuncias.db"]
+
+
+def test_delta_elimina_meses_ausentes_del_archivo(bd):
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1, 2, 3]))[1]
+
+    reporte, exito = database.cargar_csv_delta(_csv(bd / "v2.csv", [1, 3, 4]))
+
+    assert exito
+    assert (reporte["nuevas"], reporte["ausentes"], reporte["ausentes_eliminados"]) == (["2024-04"], ["2024-02"], True)
+    assert _meses() == _meses("particiones") == _meses("denuncias_muestra") == [1, 3, 4]
+
+
+def test_delta_conserva_ausentes_si_se_pide(bd):
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1, 2, 3]))[1]
+
+    reporte, exito = database.cargar_csv_delta(_csv(bd / "v2.csv", [1, 3]), eliminar_ausentes=False)
+
+    assert exito
+    assert (reporte["ausentes"], reporte["ausentes_eliminados"], reporte["filas_eliminadas"]) == (["2024-02"], False, 0)
+    assert _meses() == [1, 2, 3]
+
+
+@pytest.mark.parametrize("texto", ["RO", "AD", "o 1", "2", "DPTO", "ISTRITO 0", "X"])
+def test_busqueda_en_memoria_igual_a_sql(bd, texto):
+    assert database.cargar_csv_a_bd(_csv(bd / "v1.csv", [1, 2]))[1]
+    with sqlite3.connect(str(database.DB_PATH)) as conn:
+        entradas = [busqueda.Resultado(*fila) for fila in
+                    conn.execute("SELECT tipo, nombre, departamento, provincia FROM nombres_fts")]
+
+    sql, exito = database.buscar_nombres(texto, limite=100)
+    memoria = busqueda.IndiceNombres(entradas).buscar(texto, limite=100)
+
+    assert exito
+    sql = sql.astype(object).where(sql.notna(), None)
+    assert [busqueda.Resultado(*fila) for fila in sql.itertuples(index=False)] == memoria
@@ -0,0 +1,55 @@
+"""Archivos temporales de exportación (export.py): limpieza, renovación y lectura diferida."""
+
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pytest
+
+import export
+
+
+@pytest.fixture(autouse=True)
+def temporales(tmp_path, monkeypatch):
+    """Los temporales van a `tmp_path` en lugar del directorio temporal del sistema."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+def _envejecer(path, segundos=2 * export.EDAD_MAXIMA_TEMPORAL):
+    viejo = time.time() - segundos
+    os.utime(path, (viejo, viejo))
+
+
+def _df():
+    return pd.DataFrame({"AÑO": [2024, 2024], "MES": [1, 2], "cantidad": [3, 4]})
+
+
+def test_limpieza_borra_solo_temporales_viejos_de_la_app(temporales):
+    viejo = export.exportar(_df(), "csv")
+    tocado = export.exportar(_df(), "csv")
+    cli = export.exportar(_df(), "csv", prefijo=export.PREFIJO_CLI)
+    for path in (viejo, tocado, cli):
+        _envejecer(path)
+
+    assert export.tocar(tocado) == tocado.stat().st_size
+    assert export.limpiar_temporales() == 1
+    assert not viejo.exists() and tocado.exists() and cli.exists()
+
+
+def test_tocar_archivo_borrado_devuelve_none(temporales):
+    path = export.exportar(_df(), "csv")
+    export.eliminar(path)
+
+    assert export.tocar(path) is None
+
+
+def test_leer_regenera_si_el_archivo_ya_no_existe(temporales):
+    df = _df()
+    path = export.exportar(df, "csv")
+    contenido = path.read_bytes()
+    export.eliminar(path)
+
+    assert export.leer(path, df, "csv") == contenido
+    assert list(temporales.iterdir()) == []
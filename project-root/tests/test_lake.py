@@ -0,0 +1,71 @@
+"""Poda de particiones del lago Parquet (lake.py) y su uso desde `cli.py export`."""
+
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import cli
+import lake
+import processing
+
+
+def _df() -> pd.DataFrame:
+    filas = [(anio, mes, dpto, "P1", "D1", mod, anio + mes)
+             for anio in (2023, 2024) for mes in (1, 2, 3) for dpto in ("LIMA", "CUSCO") for mod in ("Robo", "Estafa")]
+    df = pd.DataFrame(filas, columns=["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"])
+    df[["AÑO", "MES"]] = df[["AÑO", "MES"]].astype("Int64")
+    for col in ("DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES"):
+        df[col] = df[col].astype("string")
+    return df
+
+
+@pytest.fixture
+def lago(tmp_path, monkeypatch):
+    """Lago con 2 años × 3 meses; devuelve (directorio, df, rutas abiertas por pq.read_table)."""
+    df = _df()
+    lake.escribir_particiones(df, fuente="v1", directorio=tmp_path)
+    abiertas = []
+    read_table = pq.read_table
+
+    def espiar(ruta, *args, **kwargs):
+        abiertas.append(ruta)
+        return read_table(ruta, *args, **kwargs)
+
+    monkeypatch.setattr(pq, "read_table", espiar)
+    return tmp_path, df, abiertas
+
+
+def test_filtrar_abre_solo_particiones_del_anio_y_meses(lago):
+    directorio, df, abiertas = lago
+    res = lake.filtrar(2024, ["Robo"], "LIMA", None, (2, 3), directorio=directorio)
+
+    assert abiertas == [str(lake.ruta_particion(2024, m, directorio)) for m in (2, 3)]
+    esperado = processing.filter_df(df, 2024, ["Robo"], "LIMA", None, (2, 3))
+    assert res["cantidad"].sum() == esperado["cantidad"].sum()
+    assert len(res) == len(esperado) == 2
+
+
+def test_filtrar_periodo_que_cruza_anios(lago):
+    directorio, _, abiertas = lago
+    res = lake.filtrar(None, None, "Todos", None, None, periodo=((2023, 3), (2024, 1)), directorio=directorio)
+
+    assert abiertas == [str(lake.ruta_particion(a, m, directorio)) for a, m in ((2023, 3), (2024, 1))]
+    assert set(zip(res["AÑO"], res["MES"])) == {(2023, 3), (2024, 1)}
+
+
+def test_export_cli_lee_del_lago_vigente(tmp_path, monkeypatch):
+    csv = tmp_path / "datos.csv"
+    csv.write_text("x")
+    llamadas = []
+    monkeypatch.setattr(lake, "vigente", lambda version: True)
+    monkeypatch.setattr(lake, "filtrar", lambda *a, **k: llamadas.append(a) or _df().head(3))
+    monkeypatch.setattr("dataset.obtener_dataset", lambda path: pytest.fail("no debe cargar el dataset completo"))
+
+    args = SimpleNamespace(csv=str(csv), desde="2023-06", hasta="2024-02", mes=None, anio=None, modalidades=None,
+                           dpto="Todos", prov=None, dist=None, formato="csv", salida=str(tmp_path / "out.csv"))
+    resultado = cli.etapa_export(args)
+
+    assert resultado["fuente"] == "lago" and resultado["filas"] == 3
+    assert llamadas == [(None, None, "Todos", None, None, ((2023, 6), (2024, 2)))]
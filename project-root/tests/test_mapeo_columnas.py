@@ -0,0 +1,43 @@
+"""Mapeo de columnas por archivo en data/metadata.json (processing.mapeo_columnas)."""
+
+import json
+
+import download_data
+import processing
+
+CRUDO = "AÑO_HECHO,MES,DPTO_HECHO_NEW,PROV_HECHO,DIST_HECHO,P_MODALIDADES,cantidad\n2024,1,LIMA,LIMA,LIMA,Robo,3\n"
+
+
+def _descargado(directorio, nombre, mapeo):
+    """Simula lo que `download_csv` escribe en metadata.json tras descargar `nombre`."""
+    (directorio / nombre).write_text(CRUDO, encoding="utf-8")
+    meta_path = directorio / "metadata.json"
+    meta = {"filename": nombre, "column_mapping": download_data.mapeos_por_archivo(meta_path, nombre, mapeo)}
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+
+def test_descarga_nueva_conserva_mapeo_de_archivos_anteriores(tmp_path):
+    _descargado(tmp_path, "enero.csv", {"AÑO_HECHO": "ANIO"})
+    _descargado(tmp_path, "febrero.csv", {})
+
+    assert processing.mapeo_columnas(tmp_path / "enero.csv") == {"AÑO_HECHO": "ANIO"}
+    assert processing.mapeo_columnas(tmp_path / "febrero.csv") == {}
+    assert list(processing.leer_csv(tmp_path / "enero.csv").columns)[0] == "ANIO"
+
+
+def test_descarga_descarta_mapeos_de_archivos_borrados(tmp_path):
+    _descargado(tmp_path, "enero.csv", {"AÑO_HECHO": "ANIO"})
+    (tmp_path / "enero.csv").unlink()
+    _descargado(tmp_path, "febrero.csv", {"AÑO_HECHO": "ANIO"})
+
+    meta = json.loads((tmp_path / "metadata.json").read_text(encoding="utf-8"))
+    assert meta["column_mapping"] == {"febrero.csv": {"AÑO_HECHO": "ANIO"}}
+
+
+def test_formato_anterior_con_un_solo_mapeo(tmp_path):
+    (tmp_path / "metadata.json").write_text(json.dumps(
+        {"filename": "enero.csv", "column_mapping": {"AÑO_HECHO": "ANIO"}}), encoding="utf-8")
+
+    assert processing.mapeo_columnas(tmp_path / "enero.csv") == {"AÑO_HECHO": "ANIO"}
+    assert processing.mapeo_columnas(tmp_path / "febrero.csv") == {}
+    assert download_data.mapeos_por_archivo(tmp_path / "metadata.json", "febrero.csv", {}) == {"febrero.csv": {}}
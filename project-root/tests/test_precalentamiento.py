@@ -0,0 +1,55 @@
+"""Caché compartida de resultados de filtros (precalentamiento.resultado)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube
+import dataset
+import precalentamiento
+import processing
+
+
+@pytest.fixture
+def ds(tmp_path, monkeypatch):
+    """Dataset compartido pequeño (2 años × 3 meses), caché de resultados vacía y cubo en `tmp_path`."""
+    filas = [(anio, mes, dpto, prov, "D1", mod, anio + mes)
+             for anio in (2023, 2024) for mes in (1, 2, 3) for dpto in ("LIMA", "CUSCO") for prov in ("P1", "P2")
+             for mod in ("Robo", "Estafa")]
+    df = pd.DataFrame(filas, columns=["AÑO", "MES", "DEPARTAMENTO", "PROVINCIA", "DISTRITO", "MODALIDADES", "cantidad"])
+    df = processing.ordenar_por_periodo(df)
+    claves, offsets = processing.tabla_offsets(df)
+    indices = {"DEPARTAMENTO": df.groupby("DEPARTAMENTO", sort=False, observed=True).indices}
+    monkeypatch.setattr(cube, "CUBE_DIR", tmp_path / "cube")
+    monkeypatch.setattr(precalentamiento, "_resultados", type(precalentamiento._resultados)())
+    return dataset.DatasetCompartido(path=None, version="v1", _df=df, indices=indices, claves_periodo=claves,
+                                     offsets=offsets, opciones=processing.opciones_filtros(df))
+
+
+def _filtro(**cambios):
+    filtro = dict(anio=2024, modalidades=["Robo"], dpto="LIMA", prov="P1", mes_range=(2, 3), periodo=None, dist=None)
+    filtro.update(cambios)
+    return filtro
+
+
+@pytest.mark.parametrize("filtro", [_filtro(), _filtro(anio=None, modalidades=[], dpto="Todos", prov="Todas")])
+def test_resultado_guarda_posiciones_y_rehace_las_filas(ds, filtro):
+    primero = precalentamiento.resultado(ds, filtro)
+    guardado = precalentamiento._resultados[precalentamiento.clave_filtro(ds.version, filtro)]
+
+    assert isinstance(guardado.posiciones, np.ndarray) and guardado.posiciones.dtype == np.int32
+    assert guardado.posiciones.tolist() == primero.df.index.tolist()
+
+    segundo = precalentamiento.resultado(ds, filtro)
+    pd.testing.assert_frame_equal(segundo.df, primero.df)
+    assert segundo.total == primero.total == int(primero.df["cantidad"].sum())
+    assert segundo.agregados is primero.agregados
+
+
+def test_resultado_respeta_max_resultados(ds, monkeypatch):
+    monkeypatch.setattr(precalentamiento, "MAX_RESULTADOS", 2)
+    for mes in (1, 2, 3):
+        precalentamiento.resultado(ds, _filtro(mes_range=(mes, mes)))
+
+    assert list(precalentamiento._resultados) == [
+        precalentamiento.clave_filtro(ds.version, _filtro(mes_range=(mes, mes))) for mes in (2, 3)]